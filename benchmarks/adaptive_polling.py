@@ -0,0 +1,117 @@
+"""
+Offline simulation of fixed and adaptive status polling against a synthetic weekly opening schedule.
+
+Some weeks of openings are written to a state history, then further weeks are polled with a fixed interval and with
+AdaptivePolling. Reports the number of polls per week and how long it took to notice an opening:
+
+    python benchmarks/adaptive_polling.py --history-weeks 8 --weeks 4 --interval 60 --floor 15 --ceiling 900
+"""
+
+import argparse
+import bisect
+import json
+import logging
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from frundenbot import STATE_CLOSED, STATE_OPEN  # noqa: E402
+from frundenbot.adaptive import AdaptivePolling  # noqa: E402
+from frundenbot.history import StateHistory  # noqa: E402
+
+WEEK = 7 * 24 * 3600
+# weekday, hour of the opening, hours open, probability of the opening in a given week
+SCHEDULE = [(2, 12, 5, 0.8), (4, 14, 8, 0.95), (5, 16, 4, 0.4)]
+
+
+def sessions(start: float, weeks: int, jitter: float, rng: random.Random) -> List[Tuple[float, float]]:
+    """
+    :return: opening and closing timestamps of the synthetic schedule, sorted
+    """
+    local = time.localtime(start)
+    monday = start - (local.tm_wday * 24 + local.tm_hour) * 3600 - local.tm_min * 60 - local.tm_sec
+    result = []
+    for week in range(weeks):
+        for weekday, hour, duration, probability in SCHEDULE:
+            if rng.random() < probability:
+                opening = monday + week * WEEK + (weekday * 24 + hour) * 3600 + rng.uniform(-jitter, jitter)
+                result.append((opening, opening + duration * 3600 + rng.uniform(-jitter, jitter)))
+    return result
+
+
+def simulate(name: str, truth: List[Tuple[float, float]], start: float, end: float, next_interval) -> Dict:
+    openings = [opening for opening, _ in truth]
+
+    def state_at(timestamp: float) -> int:
+        index = bisect.bisect_right(openings, timestamp) - 1
+        return STATE_OPEN if index >= 0 and timestamp < truth[index][1] else STATE_CLOSED
+
+    polls = 0
+    latencies = []
+    state = STATE_CLOSED
+    now = start
+    while now < end:
+        polls += 1
+        observed = state_at(now)
+        if observed == STATE_OPEN and state != STATE_OPEN:
+            index = bisect.bisect_right(openings, now) - 1
+            latencies.append(now - openings[index])
+        state = observed
+        now += next_interval(state, now)
+
+    latencies.sort()
+    weeks = (end - start) / WEEK
+    return {
+        'policy': name,
+        'polls_per_week': polls / weeks,
+        'openings': len(latencies),
+        'mean_detection_s': sum(latencies) / len(latencies) if latencies else 0.0,
+        'p95_detection_s': latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else 0.0,
+        'max_detection_s': latencies[-1] if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--history-weeks', type=int, default=8, help='Weeks in the history before the simulation.')
+    parser.add_argument('--weeks', type=int, default=4, help='Simulated weeks.')
+    parser.add_argument('--interval', type=float, default=60, help='Fixed poll interval in seconds.')
+    parser.add_argument('--floor', type=float, default=15, help='Shortest adaptive poll interval in seconds.')
+    parser.add_argument('--ceiling', type=float, default=900, help='Longest adaptive poll interval in seconds.')
+    parser.add_argument('--jitter', type=float, default=1800, help='Random shift of openings and closings in seconds.')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stderr)
+    rng = random.Random(args.seed)
+    start = time.time() - args.history_weeks * WEEK
+    truth = sessions(start, args.history_weeks + args.weeks, args.jitter, rng)
+    simulation_start = start + args.history_weeks * WEEK
+    simulation_end = simulation_start + args.weeks * WEEK
+
+    with tempfile.TemporaryDirectory() as workdir:
+        history = StateHistory(f'{workdir}/history.bin')
+        history.record(STATE_CLOSED, start)
+        for opening, closing in truth:
+            if closing < simulation_start:
+                history.record(STATE_OPEN, opening)
+                history.record(STATE_CLOSED, closing)
+        logging.info('History with %d openings', sum(1 for _, closing in truth if closing < simulation_start))
+
+        adaptive = AdaptivePolling(floor=args.floor, ceiling=args.ceiling)
+        results = [
+            simulate('fixed', truth, simulation_start, simulation_end, lambda state, now: args.interval),
+            simulate('adaptive', truth, simulation_start, simulation_end,
+                     lambda state, now: adaptive.interval('simulation', history, args.interval, state, now)),
+        ]
+        history.close()
+    json.dump({'timestamp': int(time.time()), 'results': results}, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+"""
+Offline micro-benchmarks for the storage backends and the notifier.
+
+Run the suite and store the results:
+
+    python benchmarks/bench.py --sizes 10,1000,100000 --output before.json
+
+Compare two result files, e.g. from two commits:
+
+    python benchmarks/bench.py --compare before.json after.json
+"""
+
+import argparse
+import json
+import logging
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fakes import FakeAsyncBotApi, FakeBot, FakeS3  # noqa: E402
+
+from frundenbot.engine import AsyncEngine  # noqa: E402
+from frundenbot.notifier import Notifier  # noqa: E402
+from frundenbot.sender import AsyncMessageSender, MessageSender  # noqa: E402
+from frundenbot.storage import FileStorage, S3Storage, SQLiteStorage, Storage  # noqa: E402
+
+BACKENDS = ('file', 's3', 'sqlite')
+DEFAULT_SIZES = '10,100,1000,10000,100000,1000000'
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def measure(name: str, backend: str, size: int, operation: Callable[[int], None], ops: int) -> Dict:
+    """
+    Run an operation several times and summarize the latencies.
+
+    :param name: name of the benchmark
+    :param backend: name of the storage backend
+    :param size: number of listeners the storage contained
+    :param operation: called with the index of the run
+    :param ops: number of runs
+    :return: result record
+    """
+    latencies = []
+    start = time.perf_counter()
+    for i in range(ops):
+        op_start = time.perf_counter()
+        operation(i)
+        latencies.append(time.perf_counter() - op_start)
+    total = time.perf_counter() - start
+    return {
+        'benchmark': name,
+        'backend': backend,
+        'size': size,
+        'ops': ops,
+        'ops_per_sec': ops / total if total else float('inf'),
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+class StorageFactory:
+    """
+    Creates storages of one backend in a temporary directory or fake S3 bucket.
+    """
+
+    def __init__(self, backend: str, workdir: str, s3_latency: float):
+        self.backend = backend
+        self.workdir = workdir
+        self.s3 = FakeS3(latency=s3_latency)
+        self._count = 0
+
+    def fresh(self) -> Storage:
+        self._count += 1
+        self.s3.objects.clear()
+        return self.reopen()
+
+    def reopen(self) -> Storage:
+        path = f'{self.workdir}/{self.backend}-{self._count}'
+        if self.backend == 'file':
+            return FileStorage(path=path)
+        if self.backend == 'sqlite':
+            return SQLiteStorage(path=f'{path}.sqlite')
+        with mock.patch('boto3.resource', return_value=self.s3):
+            return S3Storage(region_name='local', bucket='bench', key='key', secret='secret')
+
+
+def bench_storage(factory: StorageFactory, sizes: List[int], ops: int) -> List[Dict]:
+    results = []
+    backend = factory.backend
+
+    storage = factory.fresh()
+    results.append(measure('set_mate', backend, 0, lambda i: storage.set_mate(f'Mate {i}'), ops))
+    results.append(measure('get_mate', backend, 0, lambda i: storage.get_mate(), ops))
+    results.append(measure('set_open', backend, 0, lambda i: storage.set_open(i % 2), ops))
+    results.append(measure('get_open', backend, 0, lambda i: storage.get_open(), ops))
+
+    for size in sizes:
+        storage = factory.fresh()
+        storage.set_notification_listeners({f'{chat_id}' for chat_id in range(size)})
+        results.append(measure('register', backend, size,
+                               lambda i: storage.add_notification_listener(size + i), ops))
+        results.append(measure('contains', backend, size,
+                               lambda i: storage.has_notification_listener(i * 7919 % size), ops))
+        results.append(measure('scan', backend, size, lambda i: sum(1 for _ in storage.iter_notification_listeners()),
+                               3))
+
+        def cold_start(i):
+            cold = factory.reopen()
+            cold.get_open()
+            cold.has_notification_listener(0)
+
+        results.append(measure('cold_start', backend, size, cold_start, 3))
+        logging.info('Finished storage benchmarks for %s with %d listeners', backend, size)
+    return results
+
+
+def bench_fanout(factory: StorageFactory, sizes: List[int], bot_latency: float, workers: int) -> List[Dict]:
+    results = []
+    for size in sizes:
+        storage = factory.fresh()
+        bot = FakeBot(latency=bot_latency)
+        sender = MessageSender(bot, workers=workers, global_rate=1e9, per_chat_interval=0)
+        notifier = Notifier(sender, storage)
+        storage.set_notification_listeners({f'{chat_id}' for chat_id in range(size)})
+
+        result = measure('fanout', factory.backend, size, lambda i: notifier._notify_all(), 1)
+        result['messages_per_sec'] = len(bot.calls) / (result['p50_ms'] / 1000)
+        results.append(result)
+        sender.shutdown()
+        logging.info('Finished fan-out benchmark for %s with %d listeners', factory.backend, size)
+    return results
+
+
+def bench_fanout_async(factory: StorageFactory, sizes: List[int], bot_latency: float, concurrency: int) -> List[Dict]:
+    results = []
+    engine = AsyncEngine(concurrency=concurrency)
+    engine.start()
+    for size in sizes:
+        storage = factory.fresh()
+        bot = FakeAsyncBotApi(latency=bot_latency)
+        sender = AsyncMessageSender(bot, concurrency=concurrency, global_rate=1e9, per_chat_interval=0)
+        notifier = engine.notifier(sender, storage, message='open')
+        storage.set_notification_listeners({f'{chat_id}' for chat_id in range(size)})
+
+        result = measure('fanout_async', factory.backend, size, lambda i: engine.run(notifier._notify_all_async()), 1)
+        result['messages_per_sec'] = len(bot.calls) / (result['p50_ms'] / 1000)
+        results.append(result)
+        logging.info('Finished asyncio fan-out benchmark for %s with %d listeners', factory.backend, size)
+    engine.stop()
+    return results
+
+
+def compare(baseline_path: str, current_path: str):
+    with open(baseline_path) as file:
+        baseline = {(r['benchmark'], r['backend'], r['size']): r for r in json.load(file)['results']}
+    with open(current_path) as file:
+        current = json.load(file)['results']
+
+    print(f'{"benchmark":<12} {"backend":<8} {"size":>8} {"ops/s":>12} {"change":>8} {"p99 ms":>10} {"change":>8}')
+    for result in current:
+        old = baseline.get((result['benchmark'], result['backend'], result['size']))
+        ops_change = f'{result["ops_per_sec"] / old["ops_per_sec"]:.2f}x' if old else 'new'
+        p99_change = f'{result["p99_ms"] / old["p99_ms"]:.2f}x' if old and old['p99_ms'] else 'new'
+        print(f'{result["benchmark"]:<12} {result["backend"]:<8} {result["size"]:>8} {result["ops_per_sec"]:>12.1f} '
+              f'{ops_change:>8} {result["p99_ms"]:>10.3f} {p99_change:>8}')
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True,
+                                       cwd=Path(__file__).resolve().parent).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', default=','.join(BACKENDS), help='Comma separated storage backends.')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Comma separated listener counts.')
+    parser.add_argument('--ops', type=int, default=200, help='Operations per latency benchmark.')
+    parser.add_argument('--fanout-max', type=int, default=100000, help='Largest listener count for fan-out runs.')
+    parser.add_argument('--fanout-workers', type=int, default=8, help='Worker threads of the message sender.')
+    parser.add_argument('--fanout-concurrency', type=int, default=1000,
+                        help='Messages in flight at the same time with the asyncio engine.')
+    parser.add_argument('--bot-latency', type=float, default=0.0, help='Simulated Bot API latency in seconds.')
+    parser.add_argument('--s3-latency', type=float, default=0.0, help='Simulated S3 latency in seconds.')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout.')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help='Compare two result files.')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stderr)
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for backend in args.backends.split(','):
+            factory = StorageFactory(backend, workdir, s3_latency=args.s3_latency)
+            results.extend(bench_storage(factory, sizes, args.ops))
+            results.extend(bench_fanout(factory, [size for size in sizes if size <= args.fanout_max],
+                                        args.bot_latency, args.fanout_workers))
+            results.extend(bench_fanout_async(factory, [size for size in sizes if size <= args.fanout_max],
+                                              args.bot_latency, args.fanout_concurrency))
+
+    report = {'commit': git_commit(), 'timestamp': int(time.time()), 'python': sys.version.split()[0],
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Cold start benchmark of the command line interface.
+
+Every run starts a fresh interpreter, so imports are measured as they happen on a container start:
+
+    python benchmarks/bench_startup.py --runs 20 --output startup.json
+
+Show the modules that take the longest to import:
+
+    python benchmarks/bench_startup.py --importtime 15
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = {
+    'help': [sys.executable, '-m', 'frundenbot.main', '--help'],
+    'import_main': [sys.executable, '-c', 'import frundenbot.main'],
+    'import_bot': [sys.executable, '-c', 'import frundenbot.bot'],
+    'interpreter': [sys.executable, '-c', 'pass'],
+}
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def environment() -> Dict[str, str]:
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(ROOT), env.get('PYTHONPATH')]))
+    # the command line interface must start without any configuration
+    env.pop('TELEGRAM_BOT_ADMINS', None)
+    return env
+
+
+def measure(name: str, command: List[str], runs: int) -> Dict:
+    env = environment()
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, cwd=ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        durations.append(time.perf_counter() - start)
+    return {
+        'benchmark': name,
+        'runs': runs,
+        'min_ms': min(durations) * 1000,
+        'p50_ms': percentile(durations, 0.5) * 1000,
+        'p90_ms': percentile(durations, 0.9) * 1000,
+    }
+
+
+def import_times(module: str, top: int) -> List[Dict]:
+    """
+    Run the interpreter with "-X importtime" and return the modules with the highest cumulative import time.
+
+    :param module: module that is imported
+    :param top: number of modules that are returned
+    """
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], env=environment(),
+                            cwd=ROOT, check=True, capture_output=True, text=True).stderr
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        # import time:       self [us] | cumulative | imported package
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        entries.append({'module': name.strip(), 'self_ms': int(self_us) / 1000,
+                        'cumulative_ms': int(cumulative_us) / 1000})
+    return sorted(entries, key=lambda entry: entry['cumulative_ms'], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='Interpreter starts per scenario.')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma separated scenarios.')
+    parser.add_argument('--importtime', type=int, metavar='TOP', help='Show the slowest imports of frundenbot.bot.')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout.')
+    args = parser.parse_args()
+
+    if args.importtime:
+        for entry in import_times('frundenbot.bot', args.importtime):
+            print(f'{entry["cumulative_ms"]:>9.1f} ms {entry["self_ms"]:>9.1f} ms  {entry["module"]}')
+        return
+
+    results = [measure(name, SCENARIOS[name], args.runs) for name in args.scenarios.split(',')]
+    report = {'timestamp': int(time.time()), 'python': sys.version.split()[0], 'results': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Offline stand-ins for the services FrundenBot talks to.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+
+class FakeBot:
+    """
+    Records every message instead of sending it, optionally waiting to simulate the Bot API round trip.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls.append((chat_id, text))
+
+    sendMessage = send_message
+
+
+class FakeAsyncBotApi:
+    """
+    Same as FakeBot for the AsyncMessageSender, the simulated round trip does not block a thread.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.calls.append((chat_id, text))
+
+
+class _FakeObject:
+    def __init__(self, s3, bucket: str, key: str):
+        self._s3 = s3
+        self.bucket = bucket
+        self.key = key
+
+    def get(self):
+        self._s3.wait()
+        try:
+            body = self._s3.objects[(self.bucket, self.key)]
+        except KeyError:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        return {'Body': SimpleNamespace(read=lambda: body)}
+
+    def put(self, Body):
+        self._s3.wait()
+        self._s3.objects[(self.bucket, self.key)] = Body.encode('utf-8') if isinstance(Body, str) else Body
+
+
+class _FakeBucket:
+    def __init__(self, s3, name: str):
+        self._s3 = s3
+        self.name = name
+        self.objects = SimpleNamespace(filter=self._filter)
+
+    def _filter(self, Prefix=''):
+        self._s3.wait()
+        return [_FakeObject(self._s3, self.name, key) for bucket, key in list(self._s3.objects)
+                if bucket == self.name and key.startswith(Prefix)]
+
+    def delete_objects(self, Delete):
+        self._s3.wait()
+        for obj in Delete['Objects']:
+            self._s3.objects.pop((self.name, obj['Key']), None)
+
+
+class FakeS3:
+    """
+    In-memory replacement for a boto3 S3 resource with a configurable latency per request.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.objects = {}
+        self.requests = 0
+
+    def wait(self):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def Object(self, bucket: str, key: str):
+        return _FakeObject(self, bucket, key)
+
+    def Bucket(self, name: str):
+        return _FakeBucket(self, name)
+
+
+class _LocalServer:
+    """
+    HTTP server on a random local port that runs in a background thread.
+    """
+
+    def __init__(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return 'http://{}:{}'.format(*self._server.server_address)
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _respond(self, method: str, path: str, body: bytes):
+        raise NotImplementedError()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are written separately, with Nagle's algorithm every response would stall
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self._handle(b'')
+
+            def do_POST(self):
+                self._handle(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+
+            def _handle(self, body: bytes):
+                status, response = server._respond(self.command, self.path, body)
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class FakeBotApi(_LocalServer):
+    """
+    Local Bot API server that accepts every request, optionally waiting to simulate the round trip to Telegram.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        super().__init__()
+
+    def _respond(self, method: str, path: str, body: bytes):
+        if self.latency:
+            time.sleep(self.latency)
+        api_method = path.rsplit('/', 1)[-1]
+        self.calls[api_method] += 1
+        data = json.loads(body) if body else {}
+        if api_method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'FrundenBot', 'username': 'FrundenBot'}
+        elif api_method == 'sendMessage':
+            result = {'message_id': self.calls[api_method], 'date': int(time.time()), 'text': data.get('text'),
+                      'chat': {'id': int(data.get('chat_id', 0)), 'type': 'private'}}
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+
+class StatusStub(_LocalServer):
+    """
+    Local status endpoint that answers every path with the configured state.
+    """
+
+    def __init__(self, state: str = 'OPEN'):
+        self.state = state
+        super().__init__()
+
+    def _respond(self, method: str, path: str, body: bytes):
+        return 200, self.state.encode('utf-8')
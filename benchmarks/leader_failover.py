@@ -0,0 +1,123 @@
+"""
+Local failover test of the leader election with several processes sharing one storage.
+
+Starts a number of replicas, repeatedly stops the current leader and measures how long it takes until another replica
+takes over. Replicas that are killed cannot release their lease, terminated replicas hand it over:
+
+    python benchmarks/leader_failover.py --replicas 3 --rounds 5 --signal kill
+    python benchmarks/leader_failover.py --backend sqlite --ttl 3 --signal term
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from frundenbot.leader import LeaderElection  # noqa: E402
+from frundenbot.storage import FileStorage, SQLiteStorage  # noqa: E402
+
+BACKENDS = ('file', 'sqlite')
+
+
+def replica(backend: str, path: str, ttl: float, events: multiprocessing.Queue):
+    storage = FileStorage(path=path) if backend == 'file' else SQLiteStorage(path=f'{path}/leader.sqlite')
+    election = LeaderElection(storage, ttl=ttl, holder=f'replica-{os.getpid()}')
+    election.add_listener(lambda leader: events.put((os.getpid(), leader, time.time())))
+
+    def terminate(signum, frame):
+        election.stop()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+    election.start()
+    while True:
+        signal.pause()
+
+
+def failover(backend: str, replicas: int, rounds: int, ttl: float, stop_signal: int, timeout: float) -> Dict:
+    context = multiprocessing.get_context('spawn')
+    events = context.Queue()
+    takeovers: List[float] = []
+    overlaps = 0
+    with tempfile.TemporaryDirectory() as path:
+        processes = {}
+
+        def spawn():
+            process = context.Process(target=replica, args=(backend, path, ttl, events), daemon=True)
+            process.start()
+            processes[process.pid] = process
+
+        for _ in range(replicas):
+            spawn()
+
+        leaders = set()
+        stopped = None
+        try:
+            while len(takeovers) < rounds:
+                try:
+                    pid, leader, timestamp = events.get(timeout=timeout)
+                except queue.Empty:
+                    raise RuntimeError(f'No replica took over within {timeout}s')
+                if not leader:
+                    leaders.discard(pid)
+                    continue
+                if leaders:
+                    overlaps += 1
+                    logging.warning('Replica %d was elected while %s still lead', pid, leaders)
+                leaders.add(pid)
+                if stopped is not None:
+                    takeovers.append(timestamp - stopped)
+                    logging.info('Replica %d took over after %.2fs', pid, takeovers[-1])
+
+                # stop the new leader and start a replacement, so the number of replicas stays the same
+                time.sleep(ttl / 2)
+                stopped = time.time()
+                os.kill(pid, stop_signal)
+                processes.pop(pid).join()
+                leaders.discard(pid)
+                spawn()
+        finally:
+            for process in processes.values():
+                process.kill()
+                process.join()
+
+    return {
+        'backend': backend,
+        'replicas': replicas,
+        'ttl': ttl,
+        'signal': signal.Signals(stop_signal).name,
+        'takeovers': len(takeovers),
+        'max_takeover_s': max(takeovers, default=0.0),
+        'mean_takeover_s': sum(takeovers) / len(takeovers) if takeovers else 0.0,
+        'overlapping_leaders': overlaps,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', default=','.join(BACKENDS), help='Comma separated storage backends.')
+    parser.add_argument('--replicas', type=int, default=3, help='Number of processes competing for the lease.')
+    parser.add_argument('--rounds', type=int, default=3, help='Number of times the leader is stopped.')
+    parser.add_argument('--ttl', type=float, default=3.0, help='Lease ttl in seconds.')
+    parser.add_argument('--signal', choices=['kill', 'term'], default='kill', help='How the leader is stopped.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stderr)
+    stop_signal = signal.SIGKILL if args.signal == 'kill' else signal.SIGTERM
+    results = [failover(backend, args.replicas, args.rounds, args.ttl, stop_signal, timeout=args.ttl * 3)
+               for backend in args.backends.split(',')]
+    json.dump({'timestamp': int(time.time()), 'results': results}, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
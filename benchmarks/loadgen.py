@@ -0,0 +1,306 @@
+"""
+Offline load test that replays Telegram updates through the handlers of a real FrundenBot.
+
+The bot talks to a local fake Bot API server and polls a local status stub. Updates are read from a JSONL file with
+one Update per line, or generated from a mix of commands. Every rate runs for a fixed time, the updates are offered at
+that rate and the latency is measured from the time an update was due, so a slow bot cannot slow down the offered load.
+
+Find the highest sustainable rate per backend, in polling mode and with 4 and 16 webhook workers:
+
+    python benchmarks/loadgen.py --rates 50,100,200,400,800 --modes polling,webhook --workers 4,16
+
+Replay a recorded stream:
+
+    python benchmarks/loadgen.py --updates updates.jsonl --rates 100
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench import BACKENDS, StorageFactory, git_commit, percentile  # noqa: E402
+from fakes import FakeBotApi, StatusStub  # noqa: E402
+from telegram import Update  # noqa: E402
+from telegram.ext import TypeHandler  # noqa: E402
+
+from frundenbot import metrics  # noqa: E402
+from frundenbot.bot import FrundenBot  # noqa: E402
+from frundenbot.cache import CachingStorage  # noqa: E402
+from frundenbot.locations import LocationSpec  # noqa: E402
+from frundenbot.messagelog import MessageLog  # noqa: E402
+from frundenbot.webhook import WebhookServer  # noqa: E402
+
+TOKEN = '123456:ABCdefGhIjk'
+DEFAULT_MIX = 'open=0.4,text=0.3,inline=0.2,notify=0.1'
+LAST_GROUP = 1000
+COMMANDS = {'open': '/open', 'notify': '/notify', 'stats': '/stats', 'mate': '/mate'}
+# the records are still formatted by the message log, but not written anywhere
+MESSAGE_LOGGER = logging.getLogger('loadgen.messages')
+MESSAGE_LOGGER.addHandler(logging.NullHandler())
+MESSAGE_LOGGER.setLevel(logging.INFO)
+MESSAGE_LOGGER.propagate = False
+
+
+def generate_updates(mix: Dict[str, float], chats: int, seed: int) -> Iterator[dict]:
+    """
+    Generate an endless stream of updates from random chats.
+
+    :param mix: kind of update ("inline", "text" or a command) and its share of the stream
+    :param chats: number of different chats
+    :param seed: seed of the random generator
+    """
+    rng = random.Random(seed)
+    kinds, weights = zip(*mix.items())
+    for update_id in itertools.count(1):
+        chat_id = rng.randrange(1, chats + 1)
+        user = {'id': chat_id, 'is_bot': False, 'first_name': 'Load', 'last_name': f'{chat_id}'}
+        kind = rng.choices(kinds, weights)[0]
+        if kind == 'inline':
+            yield {'update_id': update_id, 'inline_query': {'id': f'{update_id}', 'from': user, 'query': '',
+                                                            'offset': ''}}
+            continue
+        message = {'message_id': update_id, 'date': int(time.time()), 'from': user,
+                   'chat': {'id': chat_id, 'type': 'private', 'first_name': 'Load', 'last_name': f'{chat_id}'}}
+        if kind == 'text':
+            message['text'] = 'Hat die Frunde offen?'
+        else:
+            message['text'] = COMMANDS[kind]
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(COMMANDS[kind])}]
+        yield {'update_id': update_id, 'message': message}
+
+
+def read_updates(path: str) -> Iterator[dict]:
+    """
+    Replay the updates of a JSONL file over and over, renumbering them so that every update id is unique.
+    """
+    with open(path) as file:
+        updates = [json.loads(line) for line in file if line.strip()]
+    if not updates:
+        raise ValueError(f'{path} does not contain any updates')
+    for update_id, update in zip(itertools.count(1), itertools.cycle(updates)):
+        yield dict(update, update_id=update_id)
+
+
+class LoadTarget:
+    """
+    A FrundenBot with a storage backend that receives updates either like in polling mode, through the update queue
+    of its single dispatcher thread, or through a webhook server with a number of workers.
+    """
+
+    def __init__(self, storage, api: FakeBotApi, status: StatusStub, mode: str, workers: int, queue_size: int):
+        self.bot = FrundenBot(TOKEN, refresh_interval=60, storage=storage, bot_api_url=api.url,
+                              locations=[LocationSpec('frunde', f'{status.url}/status')],
+                              message_log=MessageLog(logger=MESSAGE_LOGGER))
+        self.bot._finish_startup()
+        self.dispatcher = self.bot.updater.dispatcher
+        self.mode = mode
+        self.scheduled: Dict[int, float] = {}
+        self.latencies: List[float] = []
+        self.errors = 0
+        self._lock = threading.Lock()
+
+        # the last handler group sees every update after the handlers of the bot, even if one of them failed
+        self.dispatcher.add_handler(TypeHandler(Update, self._done), group=LAST_GROUP)
+        self.dispatcher.add_error_handler(self._error)
+        self.bot.updater.job_queue.start()
+        if mode == 'webhook':
+            self.webhook = WebhookServer(self.dispatcher, listen='127.0.0.1', port=0, workers=workers,
+                                         queue_size=queue_size)
+            self.webhook.start()
+        else:
+            self._thread = threading.Thread(target=self.dispatcher.start, name='dispatcher', daemon=True)
+            self._thread.start()
+
+    def offer(self, update: dict, due: float) -> bool:
+        """
+        Hand an update to the bot.
+        :return: False if the bot rejected the update because its queue was full
+        """
+        with self._lock:
+            self.scheduled[update['update_id']] = due
+        if self.mode == 'webhook':
+            accepted = self.webhook._accept(json.dumps(update).encode('utf-8')) == 200
+            if not accepted:
+                with self._lock:
+                    self.scheduled.pop(update['update_id'], None)
+            return accepted
+        self.dispatcher.update_queue.put(Update.de_json(update, self.dispatcher.bot))
+        return True
+
+    @property
+    def backlog(self) -> int:
+        with self._lock:
+            return len(self.scheduled)
+
+    def reset(self):
+        with self._lock:
+            self.latencies = []
+            self.errors = 0
+
+    def close(self):
+        if self.mode == 'webhook':
+            self.webhook.stop()
+        else:
+            self.dispatcher.stop()
+        self.bot.updater.job_queue.stop()
+        self.bot.message_log.close()
+
+    def _done(self, update: Update, context):
+        now = time.perf_counter()
+        with self._lock:
+            due = self.scheduled.pop(update.update_id, None)
+            if due is not None:
+                self.latencies.append(now - due)
+
+    def _error(self, update, context):
+        with self._lock:
+            self.errors += 1
+        logging.debug('Handler failed: %s', context.error)
+
+
+def run_rate(target: LoadTarget, updates: Iterator[dict], rate: float, duration: float, drain: float) -> Dict:
+    """
+    Offer updates at a fixed rate and wait until the bot processed them.
+
+    :param target: bot under load
+    :param updates: stream of updates
+    :param rate: updates per second
+    :param duration: time in seconds during which updates are offered
+    :param drain: maximum time in seconds to wait for the backlog afterwards
+    """
+    target.reset()
+    total = int(rate * duration)
+    offered = rejected = 0
+    max_backlog = 0
+    start = time.perf_counter()
+    for i, update in zip(range(total), updates):
+        due = start + i / rate
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        offered += 1
+        if not target.offer(update, due):
+            rejected += 1
+        if i % max(1, int(rate / 10)) == 0:
+            max_backlog = max(max_backlog, target.backlog)
+
+    deadline = time.perf_counter() + drain
+    while target.backlog and time.perf_counter() < deadline:
+        max_backlog = max(max_backlog, target.backlog)
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    latencies = list(target.latencies)
+    return {
+        'rate': rate,
+        'offered': offered,
+        'completed': len(latencies),
+        'rejected': rejected,
+        'unfinished': target.backlog,
+        'errors': target.errors,
+        'throughput': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None,
+        'max_ms': max(latencies) * 1000 if latencies else None,
+        'max_backlog': max_backlog,
+    }
+
+
+def knee(results: List[Dict], slo_ms: float) -> float or None:
+    """
+    Highest rate at which all updates were processed, at least 95% of the offered rate was sustained and the 99th
+    percentile stayed within the latency objective.
+    """
+    sustained = [result['rate'] for result in results
+                 if not result['rejected'] and not result['unfinished'] and result['p99_ms'] is not None
+                 and result['throughput'] >= 0.95 * result['rate']
+                 and result['p99_ms'] <= slo_ms]
+    return max(sustained, default=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', default=','.join(BACKENDS), help='Comma separated storage backends.')
+    parser.add_argument('--modes', default='polling,webhook', help='Comma separated modes, "polling" or "webhook".')
+    parser.add_argument('--workers', default='4', help='Comma separated webhook worker counts.')
+    parser.add_argument('--rates', default='25,50,100,200,400', help='Comma separated rates in updates per second.')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds each rate is offered.')
+    parser.add_argument('--drain', type=float, default=10.0, help='Seconds to wait for the backlog after a rate.')
+    parser.add_argument('--updates', help='JSONL file with recorded updates, generated from --mix if not set.')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Shares of inline, text and /open, /notify, /mate, '
+                                                           '/stats updates.')
+    parser.add_argument('--chats', type=int, default=1000, help='Number of chats the generated updates come from.')
+    parser.add_argument('--seed', type=int, default=1, help='Seed for the generated updates.')
+    parser.add_argument('--record', metavar='PATH', help='Write the generated updates of the first run to a file.')
+    parser.add_argument('--queue-size', type=int, default=1000, help='Webhook queue size.')
+    parser.add_argument('--bot-latency', type=float, default=0.0, help='Simulated Bot API latency in seconds.')
+    parser.add_argument('--s3-latency', type=float, default=0.0, help='Simulated S3 latency in seconds.')
+    parser.add_argument('--cache-ttl', type=float, default=30.0, help='Storage cache ttl, 0 disables the cache.')
+    parser.add_argument('--slo-ms', type=float, default=500.0, help='99th percentile latency that is acceptable.')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(message)s', stream=sys.stderr)
+    # rejected updates are counted, a warning for each of them would only slow down the run
+    logging.getLogger('frundenbot.webhook').setLevel(logging.ERROR)
+    mix = {kind: float(share) for kind, share in (item.split('=') for item in args.mix.split(','))}
+    rates = [float(rate) for rate in args.rates.split(',')]
+    api = FakeBotApi(latency=args.bot_latency)
+    status = StatusStub()
+
+    if args.record:
+        updates = generate_updates(mix, args.chats, args.seed)
+        with open(args.record, 'w') as file:
+            for update in itertools.islice(updates, int(max(rates) * args.duration)):
+                file.write(json.dumps(update) + '\n')
+
+    configurations = [(backend, mode, int(workers) if mode == 'webhook' else 1)
+                      for backend in args.backends.split(',') for mode in args.modes.split(',')
+                      for workers in (args.workers.split(',') if mode == 'webhook' else ['1'])]
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for backend, mode, workers in configurations:
+            factory = StorageFactory(backend, workdir, s3_latency=args.s3_latency)
+            with mock.patch('boto3.resource', return_value=factory.s3):
+                storage = metrics.InstrumentedStorage(factory.fresh())
+            if args.cache_ttl > 0:
+                storage = CachingStorage(storage, ttl=args.cache_ttl)
+            target = LoadTarget(storage, api, status, mode, workers, args.queue_size)
+            updates = read_updates(args.updates) if args.updates else generate_updates(mix, args.chats, args.seed)
+            runs = []
+            try:
+                for rate in rates:
+                    run = run_rate(target, updates, rate, args.duration, args.drain)
+                    runs.append(run)
+                    logging.warning('%-7s %-8s %3d workers %7.0f/s offered %8.1f/s done  p99 %8.1f ms  backlog %5d',
+                                    backend, mode, workers, rate, run['throughput'], run['p99_ms'] or 0,
+                                    run['max_backlog'])
+            finally:
+                target.close()
+            results.append({'backend': backend, 'mode': mode, 'workers': workers, 'knee': knee(runs, args.slo_ms),
+                            'runs': runs})
+
+    api.close()
+    status.close()
+    report = {'commit': git_commit(), 'timestamp': int(time.time()), 'python': sys.version.split()[0],
+              'bot_api_calls': dict(api.calls), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import logging
+import time
+
+from prometheus_client import Gauge
+
+from frundenbot import STATE_CLOSED, STATE_OPEN
+from frundenbot.history import HOURS_PER_WEEK, StateHistory, hour_of_week
+
+LOGGER = logging.getLogger(__name__)
+
+REASONS = ('no_history', 'unknown', 'open', 'likely_transition', 'closed')
+
+POLL_INTERVAL = Gauge('frunde_poll_interval_seconds', 'Interval until the next status poll', ['location'])
+POLL_INTERVAL_REASON = Gauge('frunde_poll_interval_reason', '1 for the reason of the current poll interval',
+                             ['location', 'reason'])
+
+
+class AdaptivePolling:
+    """
+    Chooses the poll interval of a location from the hours of the week in which its state usually changes.
+
+    From lead seconds before until lead seconds after such hours the location is polled every floor seconds. While it
+    is closed and no change is expected, the interval grows with the time until the next likely change, up to the
+    ceiling. Open locations and locations without enough history are polled at their regular interval.
+    """
+
+    def __init__(self, floor: float = 15, ceiling: float = 900, lead: float = 900, min_rate: float = 0.1,
+                 min_weeks: float = 2):
+        """
+        :param floor: shortest interval in seconds, used around likely state changes
+        :param ceiling: longest interval in seconds
+        :param lead: seconds before and after a likely hour in which the floor is used as well
+        :param min_rate: state changes per week in an hour of the week from which a change in that hour is likely
+        :param min_weeks: weeks the history has to cover before it is used
+        """
+        self.floor = floor
+        self.ceiling = ceiling
+        self.lead = lead
+        self.min_rate = min_rate
+        self.min_weeks = min_weeks
+
+    def interval(self, name: str, history: StateHistory, base: float, state: int, now: float = None) -> float:
+        """
+        :param name: name of the location, for the metrics
+        :param history: state history of the location
+        :param base: regular interval of the location
+        :param state: current state of the location
+        :param now: unix timestamp, now if None
+        :return: seconds until the next poll
+        """
+        now = time.time() if now is None else now
+        interval, reason = self._choose(history, base, state, now)
+        interval = min(self.ceiling, max(self.floor, interval))
+
+        POLL_INTERVAL.labels(name).set(interval)
+        for known in REASONS:
+            POLL_INTERVAL_REASON.labels(name, known).set(int(known == reason))
+        LOGGER.debug('Polling %s again in %.0fs (%s)', name, interval, reason)
+        return interval
+
+    def _choose(self, history: StateHistory, base: float, state: int, now: float):
+        weeks, rates = history.transition_rates()
+        if weeks < self.min_weeks:
+            return base, 'no_history'
+        if state not in (STATE_OPEN, STATE_CLOSED):
+            return base, 'unknown'
+
+        likely = [rate >= self.min_rate for rate in rates]
+        current = hour_of_week(now)
+        if likely[current] or likely[hour_of_week(now + self.lead)] or likely[hour_of_week(now - self.lead)]:
+            return self.floor, 'likely_transition'
+        if state == STATE_OPEN:
+            # closing is not announced, but /open should not lag behind much either
+            return base, 'open'
+
+        local = time.localtime(now)
+        start_of_hour = now - local.tm_min * 60 - local.tm_sec
+        for hours in range(1, HOURS_PER_WEEK):
+            if likely[(current + hours) % HOURS_PER_WEEK]:
+                until_window = start_of_hour + hours * 3600 - self.lead - now
+                # half the remaining time, so that a delayed poll still happens before the window
+                return max(base, until_window / 2), 'closed'
+        return self.ceiling, 'closed'
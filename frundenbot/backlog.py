@@ -0,0 +1,71 @@
+import logging
+from typing import Hashable, List, Optional, Tuple
+
+from prometheus_client import Counter
+from telegram import Bot, Update
+
+LOGGER = logging.getLogger(__name__)
+
+# the only update types the handlers of FrundenBot react to
+ALLOWED_UPDATES = [Update.MESSAGE, Update.INLINE_QUERY]
+# commands that are answered with the current state, just like free text
+STATE_COMMANDS = {'open', 'offen'}
+
+BACKLOG_UPDATES = Counter('frunde_backlog_updates', 'Updates that were pending on startup', ['kind', 'action'])
+
+
+def drain_updates(bot: Bot, limit: int = 100) -> List[Update]:
+    """
+    Fetch all updates that are pending at Telegram without waiting for new ones.
+
+    :param bot: bot to fetch the updates with
+    :param limit: updates per request
+    :return: pending updates, the last of them is not confirmed yet
+    """
+    updates: List[Update] = []
+    offset = None
+    while True:
+        batch = bot.get_updates(offset=offset, limit=limit, timeout=0, allowed_updates=ALLOWED_UPDATES)
+        if not batch:
+            return updates
+        updates.extend(batch)
+        offset = batch[-1].update_id + 1
+
+
+def collapse_updates(updates: List[Update]) -> Tuple[List[Update], List[Update]]:
+    """
+    Drop updates whose reply would be superseded by a later update in the same backlog.
+
+    All state queries of a chat, i.e. free text and /open for the same location, are answered once. Repeated identical
+    commands of a chat are handled once, and only the latest inline query of a user is answered.
+
+    :param updates: updates in the order they arrived
+    :return: updates to handle in their original order, and the collapsed updates
+    """
+    keys = [_collapse_key(update) for update in updates]
+    last = {key: index for index, key in enumerate(keys) if key is not None}
+    kept, collapsed = [], []
+    for index, (update, key) in enumerate(zip(updates, keys)):
+        kind = key[0] if key is not None else 'other'
+        if key is None or last[key] == index:
+            kept.append(update)
+            BACKLOG_UPDATES.labels(kind, 'handled').inc()
+        else:
+            collapsed.append(update)
+            BACKLOG_UPDATES.labels(kind, 'collapsed').inc()
+    return kept, collapsed
+
+
+def _collapse_key(update: Update) -> Optional[Hashable]:
+    if update.inline_query:
+        return 'inline_query', update.inline_query.from_user.id
+    message = update.message
+    if not message or not message.text:
+        return None
+    if not message.text.startswith('/'):
+        return 'state', message.chat_id, ''
+    command, *args = message.text.split()
+    command = command[1:].split('@', 1)[0].lower()
+    if command in STATE_COMMANDS:
+        return 'state', message.chat_id, args[0].lower() if args else ''
+    return 'command', message.chat_id, message.text.strip()
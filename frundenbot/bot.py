@@ -0,0 +1,565 @@
+# FrundenBot - A Telegram bot to watch your Freitagsrunde
+# Copyright (C) 2018 Max Rosin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import functools
+import logging
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from emoji import emojize
+from prometheus_client import Gauge
+from telegram import ParseMode, Update
+from telegram.ext import (CallbackContext, CommandHandler, Filters,
+                          InlineQueryHandler, MessageHandler, Updater)
+from telegram.utils.request import Request
+from telegram_click import generate_command_list
+from telegram_click.argument import Argument
+from telegram_click.decorator import command
+
+from frundenbot import STATE_CLOSED, STATE_OPEN, STATE_UNKNOWN, metrics
+from frundenbot.adaptive import AdaptivePolling
+from frundenbot.backlog import ALLOWED_UPDATES, collapse_updates, drain_updates
+from frundenbot.history import StateHistory
+from frundenbot.leader import LeaderElection
+from frundenbot.locations import Location, LocationSpec
+from frundenbot.messagelog import MessageLog
+from frundenbot.notifier import Hysteresis
+from frundenbot.scheduler import PollingScheduler
+from frundenbot.sender import MessageSender
+from frundenbot.startup import STARTUP
+from frundenbot.storage import Storage
+from frundenbot.throttle import ReplyThrottle
+
+if TYPE_CHECKING:
+    # the engine loads aiohttp, which is only needed with --engine asyncio
+    from frundenbot.engine import AsyncEngine
+
+LOGGER = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def admins() -> List[int]:
+    """
+    Chat ids of the admins, parsed from TELEGRAM_BOT_ADMINS when they are needed for the first time.
+    """
+    return [int(x) for x in os.environ.get('TELEGRAM_BOT_ADMINS', '').split(',') if x.strip()]
+
+
+LOCATION_ARGUMENT = Argument(name='location', description='Name of the location.', type=str, example='frunde',
+                             optional=True, default=None)
+
+
+class FrundenBot:
+    FRUNDE_OPEN = Gauge('frunde_status', '1 if Frunde is open,-1 on error, 0 otherwise', ['location'])
+
+    def __init__(self, token, refresh_interval, storage: Storage, locations: List[LocationSpec] = None,
+                 poll_parallelism: int = 8, history_path: str = None, message_log: MessageLog = None,
+                 hysteresis: Hysteresis = None, election: LeaderElection = None,
+                 bot_api_url: str = 'https://api.telegram.org', throttle: ReplyThrottle = None,
+                 engine: 'AsyncEngine' = None, adaptive: AdaptivePolling = None, collapse_backlog: bool = True):
+
+        self.storage = storage
+        # without an election this is the only replica and always the leader
+        self.election = election
+        self._fetching_updates = False
+        self.collapse_backlog = collapse_backlog
+        # one thread, so that pushed states reach the notifiers in the order they arrived
+        self._pushed_states = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pushed-state')
+        self.message_log = message_log or MessageLog()
+        self.throttle = throttle or ReplyThrottle()
+        # polling and notifications run on the event loop of the engine, updates are still handled by threads
+        self.engine = engine
+
+        self.refresh_clock = metrics.RefreshClock()
+
+        workers = 4
+        sender_workers = 8
+        # urllib3 opens and discards extra connections when the pool is exhausted, so every thread that calls the Bot
+        # API gets its own connection: senders, dispatcher workers, long polling and the job queue
+        bot = metrics.InstrumentedBot(token=token, base_url=f'{bot_api_url}/bot',
+                                      base_file_url=f'{bot_api_url}/file/bot',
+                                      request=Request(con_pool_size=sender_workers + workers + 2))
+        updater = Updater(bot=bot, workers=workers, use_context=True)
+        self.updater = updater
+
+        self.sender = MessageSender(updater.bot, workers=sender_workers)
+        notification_sender = engine.sender(token, bot_api_url) if engine else self.sender
+
+        specs = locations or [LocationSpec.default()]
+        self.locations: Dict[str, Location] = {}
+        for spec in specs:
+            # the first location keeps using the unscoped storage, so existing data stays where it is
+            self.locations[spec.name] = Location(
+                spec.name, spec.url, spec.refresh_interval or refresh_interval, notification_sender,
+                storage=storage.scoped(spec.name) if self.locations else storage,
+                title=spec.name if len(specs) > 1 else None,
+                history=StateHistory(f'{history_path}/{spec.name}.bin') if history_path else None,
+                hysteresis=hysteresis, shared=election is not None, engine=engine, adaptive=adaptive)
+        self.default_location = next(iter(self.locations.values()))
+        if election:
+            # standbys read the shared storage, only the leader rewrites it
+            for location in self.locations.values():
+                location.storage.set_compaction(False)
+        LOGGER.info('Watching %s', ', '.join(map(repr, self.locations.values())))
+
+        if engine:
+            self.scheduler = engine.scheduler(self.refresh_location_async, parallelism=poll_parallelism)
+        else:
+            self.scheduler = PollingScheduler(self.refresh_location, parallelism=poll_parallelism)
+        for location in self.locations.values():
+            self.scheduler.add(location)
+        if election:
+            election.add_listener(self._on_leadership)
+
+        dispatcher = updater.dispatcher
+        if not engine:
+            updater.job_queue.run_repeating(self.scheduler.tick, interval=1, first=0)
+
+        # network calls that are needed before the bot is fully up run in parallel to the remaining setup
+        startup = ThreadPoolExecutor(max_workers=len(self.locations) + 1, thread_name_prefix='startup')
+        self._startup_tasks = [startup.submit(self._timed_phase, 'get_me', bot.get_me)]
+        for location in self.locations.values():
+            self._startup_tasks.append(
+                startup.submit(self._timed_phase, f'storage_{location.name}', location.notifier.warm_up))
+        startup.shutdown(wait=False)
+
+        handler_groups = {
+            0: [MessageHandler(None, callback=self._callback_log_message)],
+            1: [
+                InlineQueryHandler(callback=self._callback_inline),
+                CommandHandler(['help', 'h'], callback=self._callback_help),
+                CommandHandler('start', callback=self._callback_start),
+                CommandHandler(['open', 'offen'],
+                               callback=self._callback_is_open),
+                CommandHandler(['mate', 'drinks'],
+                               callback=self._callback_get_drinks),
+                CommandHandler('notify', callback=self._callback_notify),
+                CommandHandler('stats', callback=self._callback_stats),
+                CommandHandler('whoami', callback=self._callback_whoami),
+                CommandHandler('set_mate', callback=self._callback_set_drinks),
+                MessageHandler(Filters.text, callback=self._callback_text)
+            ]
+        }
+
+        for group, handlers in handler_groups.items():
+            for handler in handlers:
+                dispatcher.add_handler(handler, group=group)
+
+    def run_polling(self):
+        """
+        Fetch updates by long polling until the process receives a stop signal.
+        """
+        self._finish_startup()
+        if self.election and not self.is_leader:
+            # Telegram only hands updates to one poller, so standbys wait until they take over
+            LOGGER.info('Standing by until %s becomes the leader', self.election.holder)
+            self.election.wait()
+        self._fetching_updates = True
+        if self.collapse_backlog:
+            self._handle_backlog()
+        self.updater.start_polling(allowed_updates=ALLOWED_UPDATES)
+        self.updater.idle()
+        self._shutdown()
+
+    def run_webhook(self, listen: str, port: int, url: str = None, secret_token: str = None, workers: int = 4,
+                    queue_size: int = 1000):
+        """
+        Receive updates through a local HTTP listener until the process receives a stop signal.
+
+        :param listen: address to bind to
+        :param port: port to bind to
+        :param url: public URL of the listener that is registered at Telegram, nothing is registered if None
+        :param secret_token: secret Telegram has to send with every update
+        :param workers: number of threads processing updates
+        :param queue_size: maximum number of updates waiting for a worker
+        """
+        from frundenbot.webhook import WebhookServer
+
+        server = WebhookServer(self.updater.dispatcher, listen=listen, port=port, secret_token=secret_token,
+                               workers=workers, queue_size=queue_size)
+        stop = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda signum, frame: stop.set())
+
+        self._finish_startup()
+        server.start()
+        self.updater.job_queue.start()
+        if url:
+            self.updater.bot.set_webhook(url=url, secret_token=secret_token, allowed_updates=ALLOWED_UPDATES)
+        while not stop.wait(1):
+            pass
+
+        LOGGER.info('Stopping webhook listener')
+        self.updater.job_queue.stop()
+        server.stop()
+        self._shutdown()
+
+    @property
+    def is_leader(self) -> bool:
+        return self.election is None or self.election.is_leader
+
+    def _on_leadership(self, leader: bool):
+        for location in self.locations.values():
+            location.storage.set_compaction(leader)
+        if leader:
+            # the previous leader changed the state and the listeners in the meantime
+            for location in self.locations.values():
+                location.storage.reload()
+                location.notifier.reset()
+                location.notifier.update_listener_count()
+                self.scheduler.poll_now(location.name)
+        elif self._fetching_updates:
+            LOGGER.error('Lost the leadership, stopping so that only the new leader fetches updates')
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    @staticmethod
+    def _timed_phase(name: str, func):
+        with STARTUP.phase(name):
+            return func()
+
+    def _finish_startup(self):
+        me = self._startup_tasks[0].result()
+        LOGGER.info('Running as %s (%s)', me.username, me.id)
+        for task in self._startup_tasks[1:]:
+            try:
+                task.result()
+            except Exception as e:
+                LOGGER.error('Could not load the storage on startup: %s', e)
+        if self.election:
+            with STARTUP.phase('election'):
+                self.election.start()
+        if self.engine:
+            with STARTUP.phase('engine'):
+                self.engine.start(self.scheduler)
+        STARTUP.report()
+
+    def _handle_backlog(self):
+        """
+        Handle the updates that queued up while the bot was not running, without answering the same chat repeatedly.
+        """
+        try:
+            updates = drain_updates(self.updater.bot)
+        except Exception as e:
+            LOGGER.error('Could not fetch the pending updates, handling them one by one: %s', e)
+            return
+        if not updates:
+            return
+        kept, collapsed = collapse_updates(updates)
+        LOGGER.info('Handling %d pending updates, %d more were collapsed', len(kept), len(collapsed))
+        # the replies are built from the current state, which nothing has polled yet
+        self._refresh_all()
+        # polling continues after the backlog, which also confirms the last update
+        self.updater.last_update_id = updates[-1].update_id + 1
+        for update in collapsed:
+            self.message_log.log(update)
+        for update in kept:
+            self.updater.dispatcher.process_update(update)
+
+    def _refresh_all(self):
+        """
+        Poll all locations right away and wait for the results.
+        """
+
+        def refresh(location: Location):
+            try:
+                if self.engine:
+                    self.engine.run(self.refresh_location_async(location), timeout=60)
+                else:
+                    self.refresh_location(location)
+            except Exception as e:
+                LOGGER.error('Could not refresh %s: %s', location.name, e)
+            self.scheduler.postpone(location.name)
+
+        with ThreadPoolExecutor(max_workers=len(self.locations), thread_name_prefix='refresh') as executor:
+            list(executor.map(refresh, self.locations.values()))
+
+    def _shutdown(self):
+        self._pushed_states.shutdown(wait=True)
+        if self.engine:
+            self.engine.stop()
+        try:
+            # before the lease is handed over, so that the next leader sees every acknowledged write
+            self.storage.flush()
+        except Exception as e:
+            LOGGER.error('Could not flush the storage on shutdown: %s', e)
+        if self.election:
+            self.election.stop()
+        self.message_log.close()
+
+    @metrics.handler('log_message')
+    def _callback_log_message(self, update: Update, context: CallbackContext):
+        self.message_log.log(update)
+
+    @metrics.handler('start')
+    def _callback_start(self, update: Update, context: CallbackContext):
+        context.bot.sendMessage(chat_id=update.message.chat_id,
+                                text='Egal was du sagst, ich sag nur, ob die Freitagsrunde offen hat! Du kannst mich direkt anschreiben oder inline per @FrundenBot in anderen Chats benutzen.')
+
+    @command(name=['help', 'h'], description='List of commands supported by this bot.')
+    def _callback_help(self, update: Update, context: CallbackContext):
+        text = generate_command_list(update, context)
+        context.bot.send_message(
+            chat_id=update.message.chat_id, text=text, parse_mode=ParseMode.MARKDOWN)
+
+    @metrics.handler('open')
+    @command(name='open', description='Is the Freitagsrunde open right now?', arguments=[LOCATION_ARGUMENT])
+    def _callback_is_open(self, update: Update, context: CallbackContext, location: str = None):
+        watched = self._find_location(update, context, location)
+        if watched:
+            context.bot.sendMessage(chat_id=update.message.chat_id, text=watched.responses.current.open_reply)
+
+    @metrics.handler('text')
+    def _callback_text(self, update: Update, context: CallbackContext):
+        chat_id = update.message.chat_id
+        # the reply is rendered when it is sent, a delayed reply shows the state at that time
+        self.throttle.submit(chat_id, lambda: context.bot.sendMessage(
+            chat_id=chat_id, text=self.default_location.responses.current.open_reply), context.job_queue)
+
+    @metrics.handler('notify')
+    @command(name='notify', description='Get a notification when the Freitagsrunde opens up.',
+             arguments=[LOCATION_ARGUMENT])
+    def _callback_notify(self, update: Update, context: CallbackContext, location: str = None):
+        watched = self._find_location(update, context, location)
+        if not watched:
+            return
+        chat_id = update.effective_chat.id
+        watched.notifier.register(chat_id)
+        context.bot.sendMessage(
+            chat_id=update.message.chat_id,
+            text=emojize(
+                "Wir benachrichtigen dich, sobald die Freitagsrunde wieder geöffnet hat :mailbox_with_mail:",
+                language='alias')
+        )
+
+    @metrics.handler('stats')
+    @command(name='stats', description='When is the Freitagsrunde usually open?', arguments=[LOCATION_ARGUMENT])
+    def _callback_stats(self, update: Update, context: CallbackContext, location: str = None):
+        watched = self._find_location(update, context, location)
+        if not watched:
+            return
+        text = watched.history.summary if watched.history else 'Dazu habe ich keine Statistik.'
+        context.bot.sendMessage(chat_id=update.message.chat_id, text=text)
+
+    @metrics.handler('whoami')
+    def _callback_whoami(self, update: Update, context: CallbackContext):
+        context.bot.sendMessage(chat_id=update.message.chat_id,
+                                text='You are: {} ({})'.format(
+                                    update.message.from_user.name, update.message.chat_id))
+        LOGGER.info('This is: {} ({})'.format(
+            update.message.from_user.name, update.message.chat_id))
+
+    @metrics.handler('get_drinks')
+    @command(name=['mate', 'drinks'], description='Are there drinks available at the Freitagsrunde?')
+    def _callback_get_drinks(self, update: Update, context: CallbackContext):
+        try:
+            drinks = self.storage.get_mate()
+            if drinks is None:
+                raise AssertionError("No mate value in storage")
+        except Exception as e:
+            drinks = emojize(
+                'Uhm, das weiß ich nicht. :confused:', language='alias')
+            LOGGER.error(e)
+        context.bot.sendMessage(chat_id=update.message.chat_id, text=drinks)
+
+    @metrics.handler('set_drinks')
+    def _callback_set_drinks(self, update: Update, context: CallbackContext):
+        if update.message.chat_id not in admins():
+            context.bot.sendMessage(chat_id=update.message.chat_id, text=emojize(
+                ':poop: Nö :poop:', language='alias'))
+            return
+
+        mate_message = ' '.join(context.args)
+        LOGGER.info('New mate message: {}'.format(mate_message))
+        try:
+            self.storage.set_mate('{}\n(Aktualisiert: {})'.format(mate_message, time.strftime('%d.%m.%Y um %H:%M')))
+            result = 'Neuer Matepegel:\n{}'.format(mate_message)
+        except Exception as e:
+            result = emojize(
+                'Uhm, das hat nicht geklappt. :confused:', language='alias')
+            LOGGER.error(e)
+        context.bot.sendMessage(
+            chat_id=update.message.chat_id, text=result)
+        self.sender.broadcast(admins(),
+                              text='Neuer Matepegel von {} ({}):\n{}'.format(
+                                  update.message.from_user.name,
+                                  update.message.chat_id, result))
+
+    @metrics.handler('inline')
+    def _callback_inline(self, update: Update, context: CallbackContext):
+        LOGGER.info('Inline Query')
+        watched = self.locations.get(update.inline_query.query.strip().lower(), self.default_location)
+        context.bot.answerInlineQuery(update.inline_query.id, watched.responses.current.inline_results,
+                                      cache_time=watched.responses.cache_time, is_personal=False)
+
+    def _find_location(self, update: Update, context: CallbackContext, name: str = None) -> Optional[Location]:
+        """
+        Look up the location a command refers to and tell the user if it does not exist.
+        :param name: name given by the user, the default location if None
+        :return: location or None if it does not exist
+        """
+        if not name:
+            return self.default_location
+        location = self.locations.get(name.lower())
+        if location is None:
+            context.bot.sendMessage(chat_id=update.message.chat_id,
+                                    text='Den Ort "{}" kenne ich nicht. Ich kenne: {}'.format(
+                                        name, ', '.join(self.locations)))
+        return location
+
+    @metrics.handler('refresh_cache')
+    def refresh_location(self, location: Location):
+        """
+        Poll the status of a location and notify its listeners if it opened.
+        :param location: location to refresh
+        """
+        if not self.is_leader:
+            self._follow(location)
+            return
+        try:
+            LOGGER.debug('Refresh %s', location.name)
+            text = location.fetcher.fetch()
+            if text is None:
+                return
+            state = self._extract_state(text)
+            location.responses.set_state(STATE_OPEN if state == STATE_OPEN else STATE_CLOSED)
+            self.refresh_clock.tick()
+        except Exception as e:
+            state = STATE_UNKNOWN
+            location.responses.set_state(STATE_UNKNOWN)
+            LOGGER.error(e)
+
+        self._apply_state(location, state)
+
+    @metrics.handler('refresh_cache')
+    async def refresh_location_async(self, location: Location):
+        """
+        Same as refresh_location, but for the event loop of the engine.
+        :param location: location to refresh
+        """
+        if not self.is_leader:
+            await self.engine.loop.run_in_executor(self.engine.storage_executor, self._follow, location)
+            return
+        try:
+            LOGGER.debug('Refresh %s', location.name)
+            text = await location.fetcher.fetch()
+            if text is None:
+                return
+            state = self._extract_state(text)
+            location.responses.set_state(STATE_OPEN if state == STATE_OPEN else STATE_CLOSED)
+            self.refresh_clock.tick()
+        except Exception as e:
+            state = STATE_UNKNOWN
+            location.responses.set_state(STATE_UNKNOWN)
+            LOGGER.error('Could not refresh %s: %r', location.name, e)
+
+        self._record_state(location, state)
+        if self.is_leader:
+            await location.notifier.on_state_async(state)
+
+    @metrics.handler('ingest')
+    def ingest_status(self, name: Optional[str], text: str) -> int:
+        """
+        Handle a status that was pushed by a status source.
+        :param name: name of the location, the default location if None
+        :param text: status text, "OPEN" or "CLOSED"
+        :return: HTTP status for the response
+        """
+        location = self.locations.get(name) if name else self.default_location
+        if location is None:
+            return 404
+        state = self._extract_state(text)
+        if state == STATE_UNKNOWN:
+            return 400
+
+        LOGGER.info('Received pushed status %s for %s', text.strip(), location.name)
+        location.responses.set_state(state)
+        self.refresh_clock.tick()
+        self.scheduler.postpone(location.name)
+        self._record_state(location, state)
+        if self.is_leader:
+            # the fan-out can take minutes, the status source only waits until the state is applied
+            self._pushed_states.submit(self._notify_pushed, location, state)
+        return 200
+
+    @staticmethod
+    def _notify_pushed(location: Location, state: int):
+        try:
+            location.notifier.on_state(state)
+        except Exception as e:
+            LOGGER.error('Could not handle pushed status for %s: %s', location.name, e)
+
+    def start_ingest(self, listen: str, port: int, secret: str = None, fallback_interval: int = 600):
+        """
+        Accept pushed status updates and only poll as a fallback.
+        :param listen: address to bind to
+        :param port: port to bind to
+        :param secret: shared secret for the request signatures
+        :param fallback_interval: interval in seconds in which locations are still polled
+        """
+        from frundenbot.ingest import IngestServer
+
+        for location in self.locations.values():
+            location.poll_interval = max(location.refresh_interval, fallback_interval)
+            # pushed states arrive right away, polling faster around likely changes would not help
+            location.adaptive = None
+        IngestServer(self.ingest_status, listen=listen, port=port, secret=secret).start()
+
+    def _follow(self, location: Location):
+        """
+        Take over the state that the leader persisted, standbys neither poll nor notify.
+        :param location: location to refresh
+        """
+        try:
+            location.storage.reload()
+            state = location.storage.get_open()
+            self.refresh_clock.tick()
+        except Exception as e:
+            state = STATE_UNKNOWN
+            LOGGER.error('Could not read the state of %s: %s', location.name, e)
+        location.responses.set_state(state)
+        # a standby only learns about new listeners through the storage
+        location.notifier.update_listener_count()
+        self._apply_state(location, state)
+
+    def _apply_state(self, location: Location, state: int):
+        self._record_state(location, state)
+        if self.is_leader:
+            location.notifier.on_state(state)
+
+    def _record_state(self, location: Location, state: int):
+        location.state = state
+        if location.history and self.is_leader:
+            # standbys may share the history file, only the replica that polls appends to it
+            location.history.record(state)
+        self.FRUNDE_OPEN.labels(location.name).set(state)
+
+    @staticmethod
+    def _extract_state(text) -> int:
+        """
+        Extracts the "open state" from the given text
+        :param text: text from watchyour.freitagsrunde
+        :return: state
+        """
+        if text.strip() == "OPEN":
+            return STATE_OPEN
+        elif text.strip() == "CLOSED":
+            return STATE_CLOSED
+        else:
+            return STATE_UNKNOWN
@@ -0,0 +1,165 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Callable, Dict, Iterable, Set
+
+from prometheus_client import Counter
+
+from frundenbot.storage import Storage
+
+LOGGER = logging.getLogger(__name__)
+
+CACHE_REQUESTS = Counter('frunde_storage_cache_requests', 'Reads served by the storage cache', ['key', 'result'])
+CACHE_REFRESH_ERRORS = Counter('frunde_storage_cache_refresh_errors', 'Failed background refreshes', ['key'])
+
+
+class _Entry:
+    def __init__(self, value, loaded: float):
+        self.value = value
+        self.loaded = loaded
+
+
+class CachingStorage(Storage):
+    """
+    Storage decorator that serves reads from memory and revalidates stale entries in the background.
+    """
+
+    def __init__(self, backend: Storage, ttl: float = 30, latency_budget: float = 0.25):
+        """
+        :param backend: storage that is wrapped
+        :param ttl: time in seconds for which a cached value is served without asking the backend
+        :param latency_budget: time in seconds a read waits for the backend before the stale value is returned
+        """
+        self._backend = backend
+        self._ttl = ttl
+        self._latency_budget = latency_budget
+        self._entries: Dict[str, _Entry] = {}
+        self._generations: Dict[str, int] = {}
+        self._refreshing: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cache-refresh')
+
+    @property
+    def backend(self) -> Storage:
+        return self._backend
+
+    def set_mate(self, text):
+        self._backend.set_mate(text)
+        self._store('mate', text)
+
+    def get_mate(self) -> str or None:
+        return self._get('mate', self._backend.get_mate)
+
+    def set_open(self, state: int):
+        self._backend.set_open(state)
+        self._store('open', state)
+
+    def get_open(self) -> int:
+        return self._get('open', self._backend.get_open)
+
+    def set_notification_listeners(self, listeners: Set[str]):
+        self._backend.set_notification_listeners(listeners)
+
+    def get_notification_listeners(self) -> Set[str]:
+        return self._backend.get_notification_listeners()
+
+    def add_notification_listener(self, chat_id: int):
+        self._backend.add_notification_listener(chat_id)
+
+    def has_notification_listener(self, chat_id: int) -> bool:
+        return self._backend.has_notification_listener(chat_id)
+
+    def iter_notification_listeners(self) -> Iterable[int]:
+        return self._backend.iter_notification_listeners()
+
+    def clear_notification_listeners(self):
+        self._backend.clear_notification_listeners()
+
+    def remove_notification_listeners(self, chat_ids: Iterable[int]):
+        self._backend.remove_notification_listeners(chat_ids)
+
+    def count_notification_listeners(self) -> int:
+        return self._backend.count_notification_listeners()
+
+    def reload(self):
+        self.invalidate()
+        self._backend.reload()
+
+    def flush(self):
+        self._backend.flush()
+
+    def set_compaction(self, enabled: bool):
+        self._backend.set_compaction(enabled)
+
+    def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        return self._backend.acquire_lease(name, holder, ttl)
+
+    def release_lease(self, name: str, holder: str):
+        self._backend.release_lease(name, holder)
+
+    def scoped(self, name: str) -> 'CachingStorage':
+        return CachingStorage(self._backend.scoped(name), ttl=self._ttl, latency_budget=self._latency_budget)
+
+    def invalidate(self, key: str = None):
+        """
+        Drop cached values so that the next read goes to the backend.
+        :param key: key to drop, all keys if None
+        """
+        with self._lock:
+            for k in [key] if key else list(self._entries):
+                self._entries.pop(k, None)
+                self._generations[k] = self._generations.get(k, 0) + 1
+
+    def _store(self, key: str, value):
+        with self._lock:
+            # a refresh that started before this write must not overwrite it
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._entries[key] = _Entry(value, time.monotonic())
+
+    def _get(self, key: str, loader: Callable):
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.loaded < self._ttl:
+            CACHE_REQUESTS.labels(key, 'hit').inc()
+            return entry.value
+
+        future = self._refresh(key, loader)
+        if entry is None:
+            CACHE_REQUESTS.labels(key, 'miss').inc()
+            return future.result()
+
+        try:
+            value = future.result(timeout=self._latency_budget)
+            CACHE_REQUESTS.labels(key, 'refreshed').inc()
+            return value
+        except TimeoutError:
+            LOGGER.warning('Storage did not answer within %ss, serving stale %s', self._latency_budget, key)
+        except Exception as e:
+            LOGGER.error('Could not refresh %s, serving stale value: %s', key, e)
+        CACHE_REQUESTS.labels(key, 'stale').inc()
+        return entry.value
+
+    def _refresh(self, key: str, loader: Callable) -> Future:
+        with self._lock:
+            future = self._refreshing.get(key)
+            if future is None:
+                generation = self._generations.get(key, 0)
+                future = self._executor.submit(self._load, key, loader, generation)
+                self._refreshing[key] = future
+            return future
+
+    def _load(self, key: str, loader: Callable, generation: int):
+        try:
+            value = loader()
+        except Exception:
+            CACHE_REFRESH_ERRORS.labels(key).inc()
+            raise
+        finally:
+            with self._lock:
+                self._refreshing.pop(key, None)
+        with self._lock:
+            if self._generations.get(key, 0) == generation:
+                self._entries[key] = _Entry(value, time.monotonic())
+            else:
+                value = self._entries[key].value if key in self._entries else value
+        return value
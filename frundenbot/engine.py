@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional
+
+from frundenbot.fetcher import AsyncStatusFetcher
+from frundenbot.httpclient import AsyncBotApi, AsyncHttpClient
+from frundenbot.notifier import AsyncNotifier
+from frundenbot.scheduler import AsyncPollingScheduler
+from frundenbot.sender import AsyncMessageSender
+from frundenbot.storage import Storage
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AsyncEngine:
+    """
+    Event loop in a background thread that polls the status endpoints and sends the notifications.
+
+    Everything that waits on the network runs as a task on this loop, so a broadcast to many chats does not need a
+    thread per message in flight. The storage backends block, their calls run in a small thread pool.
+    """
+
+    def __init__(self, connections_per_host: int = 100, concurrency: int = 1000, storage_threads: int = 8):
+        """
+        :param connections_per_host: maximum number of open connections to one host
+        :param concurrency: number of messages of a broadcast that are in flight at the same time
+        :param storage_threads: number of threads for the storage calls
+        """
+        self._concurrency = concurrency
+        self.loop = asyncio.new_event_loop()
+        self.client = AsyncHttpClient(connections_per_host=connections_per_host)
+        self.storage_executor = ThreadPoolExecutor(max_workers=storage_threads, thread_name_prefix='async-storage')
+        self._scheduler: Optional[AsyncPollingScheduler] = None
+        self._thread = threading.Thread(target=self.loop.run_forever, name='asyncio-engine', daemon=True)
+
+    def sender(self, token: str, bot_api_url: str = 'https://api.telegram.org') -> AsyncMessageSender:
+        """
+        :param token: bot token
+        :param bot_api_url: base URL of the Bot API
+        """
+        return AsyncMessageSender(AsyncBotApi(self.client, token, base_url=bot_api_url),
+                                  concurrency=self._concurrency)
+
+    def fetcher(self, url: str, backoff: float) -> AsyncStatusFetcher:
+        return AsyncStatusFetcher(self.client, url, backoff=backoff)
+
+    def notifier(self, sender: AsyncMessageSender, storage: Storage, **kwargs) -> AsyncNotifier:
+        return AsyncNotifier(self.loop, sender, storage, self.storage_executor, **kwargs)
+
+    def scheduler(self, poll: Callable[..., Awaitable[None]], parallelism: int) -> AsyncPollingScheduler:
+        return AsyncPollingScheduler(poll, parallelism=parallelism)
+
+    def start(self, scheduler: AsyncPollingScheduler = None):
+        """
+        Start the event loop and, if given, the polling.
+        :param scheduler: scheduler created with scheduler()
+        """
+        self._thread.start()
+        if scheduler:
+            self._scheduler = scheduler
+            self.run(scheduler.start())
+
+    def run(self, coro: Awaitable, timeout: float = None):
+        """
+        Run a coroutine on the event loop and wait for its result, must not be called from the loop itself.
+        :param coro: coroutine to run
+        :param timeout: seconds to wait, forever if None
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def stop(self):
+        """
+        Stop polling, close the connections and stop the event loop.
+        """
+        if not self._thread.is_alive():
+            return
+        try:
+            if self._scheduler:
+                self.run(self._scheduler.shutdown(), timeout=10)
+            self.run(self.client.close(), timeout=10)
+        except Exception as e:
+            LOGGER.warning('Could not shut down the event loop cleanly: %s', e)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.storage_executor.shutdown(wait=True)
+        self.loop.close()
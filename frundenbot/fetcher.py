@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import random
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+import requests
+from prometheus_client import Counter, Histogram
+from requests.adapters import HTTPAdapter
+
+if TYPE_CHECKING:
+    # aiohttp is only loaded with the asyncio engine
+    from frundenbot.httpclient import AsyncHttpClient
+
+LOGGER = logging.getLogger(__name__)
+
+STATUS_URL = 'https://watchyour.freitagsrunde.org/status'
+
+FETCH_TIME = Histogram('frunde_status_fetch_seconds', 'Latency of status polls', ['outcome'])
+FETCH_OUTCOMES = Counter('frunde_status_fetch', 'Status polls by outcome', ['outcome'])
+
+
+class _PollState:
+    """
+    Remembers the last response for conditional requests and the failures for the backoff.
+    """
+
+    def __init__(self, url: str, backoff: float, max_backoff: float):
+        self.url = url
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._body: Optional[str] = None
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def _backing_off(self) -> bool:
+        if time.monotonic() < self._retry_at:
+            FETCH_OUTCOMES.labels('skipped').inc()
+            LOGGER.debug('Skipping status poll, backing off after %d failures', self._failures)
+            return True
+        return False
+
+    def _conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self._body is not None:
+            if self._etag:
+                headers['If-None-Match'] = self._etag
+            if self._last_modified:
+                headers['If-Modified-Since'] = self._last_modified
+        return headers
+
+    def _succeeded(self):
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def _failed(self):
+        self._failures += 1
+        delay = min(self._max_backoff, self._backoff * 2 ** (self._failures - 1))
+        delay *= random.uniform(0.5, 1.5)
+        self._retry_at = time.monotonic() + delay
+        LOGGER.warning('Status poll failed %d times in a row, next attempt in %.0f seconds', self._failures, delay)
+
+
+class StatusFetcher(_PollState):
+    """
+    Polls the status endpoint over a persistent connection, using conditional requests and backing off on errors.
+    """
+
+    def __init__(self, url: str = STATUS_URL, connect_timeout: float = 3.05, read_timeout: float = 10,
+                 backoff: float = 60, max_backoff: float = 900):
+        """
+        :param url: status endpoint
+        :param connect_timeout: seconds to wait for the TCP/TLS connection
+        :param read_timeout: seconds to wait for the response
+        :param backoff: delay in seconds after the first failed poll, doubled with every further failure
+        :param max_backoff: upper bound for the delay in seconds
+        """
+        super().__init__(url, backoff, max_backoff)
+        self._timeout = (connect_timeout, read_timeout)
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+
+    def fetch(self) -> Optional[str]:
+        """
+        Get the current status text.
+        :return: body of the status endpoint or None if the endpoint is backed off after previous errors
+        :raises requests.RequestException: if the request failed
+        """
+        if self._backing_off():
+            return None
+        headers = self._conditional_headers()
+
+        start = time.monotonic()
+        outcome = 'error'
+        try:
+            r = self._session.get(self.url, headers=headers, timeout=self._timeout)
+            if r.status_code == 304:
+                outcome = 'not_modified'
+            else:
+                r.raise_for_status()
+                outcome = 'ok'
+                self._body = r.text
+                self._etag = r.headers.get('ETag')
+                self._last_modified = r.headers.get('Last-Modified')
+        except requests.Timeout:
+            outcome = 'timeout'
+            self._failed()
+            raise
+        except Exception:
+            self._failed()
+            raise
+        finally:
+            FETCH_TIME.labels(outcome).observe(time.monotonic() - start)
+            FETCH_OUTCOMES.labels(outcome).inc()
+
+        self._succeeded()
+        return self._body
+
+    def close(self):
+        self._session.close()
+
+
+class AsyncStatusFetcher(_PollState):
+    """
+    Same as StatusFetcher, but the request is made on the event loop with an AsyncHttpClient.
+    """
+
+    def __init__(self, client: 'AsyncHttpClient', url: str = STATUS_URL, read_timeout: float = 10, backoff: float = 60,
+                 max_backoff: float = 900):
+        """
+        :param client: client that is shared with the other locations
+        :param url: status endpoint
+        :param read_timeout: seconds to wait for the response
+        :param backoff: delay in seconds after the first failed poll, doubled with every further failure
+        :param max_backoff: upper bound for the delay in seconds
+        """
+        super().__init__(url, backoff, max_backoff)
+        self._client = client
+        self._timeout = read_timeout
+
+    async def fetch(self) -> Optional[str]:
+        """
+        Get the current status text.
+        :return: body of the status endpoint or None if the endpoint is backed off after previous errors
+        :raises OSError: if the request failed
+        :raises asyncio.TimeoutError: if the response did not arrive in time
+        """
+        if self._backing_off():
+            return None
+
+        start = time.monotonic()
+        outcome = 'error'
+        try:
+            response = await self._client.request('GET', self.url, headers=self._conditional_headers(),
+                                                  timeout=self._timeout)
+            if response.status == 304:
+                outcome = 'not_modified'
+            elif response.status >= 400:
+                raise OSError(f'{response.status} error for url: {self.url}')
+            else:
+                outcome = 'ok'
+                self._body = response.text
+                self._etag = response.headers.get('Etag')
+                self._last_modified = response.headers.get('Last-Modified')
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+            self._failed()
+            raise
+        except Exception:
+            self._failed()
+            raise
+        finally:
+            FETCH_TIME.labels(outcome).observe(time.monotonic() - start)
+            FETCH_OUTCOMES.labels(outcome).inc()
+
+        self._succeeded()
+        return self._body
+
+    def close(self):
+        pass
@@ -0,0 +1,180 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from frundenbot import STATE_OPEN, STATE_UNKNOWN
+
+LOGGER = logging.getLogger(__name__)
+
+# unix timestamp and state, padded to 16 bytes
+RECORD = struct.Struct('<qb7x')
+
+HOURS_PER_WEEK = 7 * 24
+WEEKDAYS = ['Mo', 'Di', 'Mi', 'Do', 'Fr', 'Sa', 'So']
+BARS = ' ▁▂▃▄▅▆▇█'
+
+# longer sessions are most likely gaps in the history, e.g. because the bot was not running
+MAX_SESSION = 24 * 3600
+
+
+def hour_of_week(timestamp: float) -> int:
+    local = time.localtime(timestamp)
+    return local.tm_wday * 24 + local.tm_hour
+
+
+class HistoryStats:
+    """
+    Aggregates over all opening sessions, updated incrementally with every session.
+    """
+
+    def __init__(self):
+        self.open_seconds: List[float] = [0.0] * HOURS_PER_WEEK
+        # openings and closings per hour of the week
+        self.transitions: List[int] = [0] * HOURS_PER_WEEK
+        self.sessions = 0
+        self.total_seconds = 0.0
+        self.first: Optional[int] = None
+        self.last: Optional[int] = None
+
+    def observe(self, timestamp: int):
+        if self.first is None:
+            self.first = timestamp
+        self.last = timestamp
+
+    def add_session(self, start: int, end: int):
+        """
+        Add a time span in which the location was open.
+        :param start: unix timestamp of the opening
+        :param end: unix timestamp of the closing
+        """
+        if end <= start or end - start > MAX_SESSION:
+            return
+        self.sessions += 1
+        self.total_seconds += end - start
+        self.transitions[hour_of_week(start)] += 1
+        self.transitions[hour_of_week(end)] += 1
+        current = start
+        while current < end:
+            # split the session at full hours
+            next_hour = min(end, (current // 3600 + 1) * 3600)
+            self.open_seconds[hour_of_week(current)] += next_hour - current
+            current = next_hour
+
+    @property
+    def weeks(self) -> float:
+        return (self.last - self.first) / (7 * 24 * 3600) if self.first is not None else 0.0
+
+    def render(self) -> str:
+        if not self.sessions:
+            return 'Dazu habe ich noch keine Statistik.'
+
+        weeks = max(1.0, self.weeks)
+        share = [seconds / (weeks * 3600) for seconds in self.open_seconds]
+        average = self.total_seconds / self.sessions
+        lines = [
+            'Seit {}: {} Mal geöffnet, im Schnitt {}:{:02d} Stunden.'.format(
+                time.strftime('%d.%m.%Y', time.localtime(self.first)), self.sessions,
+                int(average // 3600), int(average % 3600 // 60)),
+            'Meistens offen: {}'.format(self._usually_open(share)),
+            '',
+        ]
+        for day, name in enumerate(WEEKDAYS):
+            hours = share[day * 24:(day + 1) * 24]
+            lines.append('{} {}'.format(name, ''.join(BARS[min(8, round(value * 8))] for value in hours)))
+        return '\n'.join(lines)
+
+    @staticmethod
+    def _usually_open(share: List[float]) -> str:
+        hours = [hour for hour, value in enumerate(share) if value >= 0.5]
+        if not hours:
+            hours = sorted(sorted(range(HOURS_PER_WEEK), key=lambda hour: share[hour], reverse=True)[:3])
+        ranges = []
+        for hour in hours:
+            if ranges and ranges[-1][1] == hour - 1 and hour % 24:
+                ranges[-1][1] = hour
+            else:
+                ranges.append([hour, hour])
+        return ', '.join('{} {}–{} Uhr'.format(WEEKDAYS[start // 24], start % 24, end % 24 + 1)
+                         for start, end in ranges)
+
+
+class StateHistory:
+    """
+    Append-only log of state transitions in a file of fixed width records, which is memory-mapped for reading.
+
+    The /stats summary is updated with every appended transition, so reading it never scans the log.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: log file, created if it does not exist
+        """
+        self._path = Path(path).expanduser().absolute()
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._stats = HistoryStats()
+        self._last: Optional[Tuple[int, int]] = None
+
+        self._file = open(self._path, 'ab')
+        size = os.path.getsize(self._path)
+        if size % RECORD.size:
+            LOGGER.warning('Dropping incomplete record at the end of %s', self._path)
+            size -= size % RECORD.size
+            self._file.truncate(size)
+        for timestamp, state in self.records():
+            self._add(timestamp, state)
+        self.summary = self._stats.render()
+
+    def record(self, state: int, timestamp: float = None):
+        """
+        Append the state if it differs from the last recorded one.
+        :param state: observed state
+        :param timestamp: time of the observation, now if None
+        """
+        if state == STATE_UNKNOWN:
+            return
+        timestamp = int(timestamp if timestamp is not None else time.time())
+        with self._lock:
+            if self._last is not None and self._last[1] == state:
+                return
+            self._file.write(RECORD.pack(timestamp, state))
+            self._file.flush()
+            self._add(timestamp, state)
+            self.summary = self._stats.render()
+
+    def transition_rates(self) -> Tuple[float, List[float]]:
+        """
+        How often the state changed in every hour of the week.
+        :return: number of weeks the history covers and the average number of transitions per week for every hour
+        """
+        with self._lock:
+            weeks = self._stats.weeks
+            return weeks, [count / max(1.0, weeks) for count in self._stats.transitions]
+
+    def records(self) -> Iterator[Tuple[int, int]]:
+        """
+        Iterate over all recorded transitions.
+        :return: tuples of unix timestamp and state
+        """
+        size = os.path.getsize(self._path)
+        size -= size % RECORD.size
+        if not size:
+            return
+        with open(self._path, 'rb') as file, mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ) as data:
+            # unpack_from does not keep the map exported, so it can be closed when the iteration stops early
+            for offset in range(0, size, RECORD.size):
+                yield RECORD.unpack_from(data, offset)
+
+    def close(self):
+        self._file.close()
+
+    def _add(self, timestamp: int, state: int):
+        self._stats.observe(timestamp)
+        if self._last is not None and self._last[1] == STATE_OPEN:
+            self._stats.add_session(self._last[0], timestamp)
+        self._last = (timestamp, state)
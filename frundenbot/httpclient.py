@@ -0,0 +1,129 @@
+import asyncio
+import json
+import logging
+from typing import Mapping, Optional
+
+import aiohttp
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError, TimedOut, Unauthorized
+
+from frundenbot import metrics
+
+LOGGER = logging.getLogger(__name__)
+
+
+class HttpResponse:
+    def __init__(self, status: int, headers: Mapping[str, str], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def text(self) -> str:
+        return self.body.decode('utf-8')
+
+
+class AsyncHttpClient:
+    """
+    HTTP client on an aiohttp session that keeps connections alive and limits the connections per host.
+
+    Proxies are taken from the HTTP_PROXY/HTTPS_PROXY environment variables. The session is created on first use, so
+    it belongs to the event loop the requests run on.
+    """
+
+    def __init__(self, connections_per_host: int = 100, connect_timeout: float = 3.05):
+        """
+        :param connections_per_host: maximum number of open connections to one host
+        :param connect_timeout: seconds to wait for the TCP/TLS connection
+        """
+        self._connections_per_host = connections_per_host
+        self._connect_timeout = connect_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def request(self, method: str, url: str, headers: Mapping[str, str] = None, body: bytes = b'',
+                      timeout: float = 10) -> HttpResponse:
+        """
+        :param method: HTTP method
+        :param url: absolute http or https URL
+        :param headers: additional request headers
+        :param body: request body
+        :param timeout: seconds to wait for the whole response
+        :raises asyncio.TimeoutError: if the response did not arrive in time
+        :raises OSError: if the connection failed or the response was malformed
+        """
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=0, limit_per_host=self._connections_per_host)
+            self._session = aiohttp.ClientSession(connector=connector, trust_env=True)
+        try:
+            async with self._session.request(method, url, headers=headers, data=body or None,
+                                             timeout=aiohttp.ClientTimeout(total=timeout,
+                                                                           connect=self._connect_timeout)) as response:
+                return HttpResponse(response.status, response.headers, await response.read())
+        except asyncio.TimeoutError:
+            raise
+        except aiohttp.ClientError as e:
+            raise OSError(f'{type(e).__name__}: {e}') from e
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class AsyncBotApi:
+    """
+    Calls Bot API methods through an AsyncHttpClient and raises the same errors as python-telegram-bot.
+    """
+
+    def __init__(self, client: AsyncHttpClient, token: str, base_url: str = 'https://api.telegram.org',
+                 timeout: float = 10):
+        """
+        :param client: client for the requests
+        :param token: bot token
+        :param base_url: base URL of the Bot API
+        :param timeout: seconds to wait for a response
+        """
+        self._client = client
+        self._url = f'{base_url}/bot{token}'
+        self._timeout = timeout
+
+    async def call(self, method: str, **params) -> Optional[object]:
+        """
+        :param method: Bot API method, e.g. sendMessage
+        :param params: parameters of the method
+        :return: result of the method
+        """
+        body = json.dumps({key: value for key, value in params.items() if value is not None}).encode('utf-8')
+        with metrics.timed(metrics.TELEGRAM_TIME, method=method):
+            try:
+                response = await self._client.request('POST', f'{self._url}/{method}', body=body,
+                                                      timeout=self._timeout,
+                                                      headers={'Content-Type': 'application/json'})
+            except asyncio.TimeoutError:
+                raise TimedOut()
+            except OSError as e:
+                raise NetworkError(f'{type(e).__name__}: {e}')
+            return self._result(response)
+
+    @staticmethod
+    def _result(response: HttpResponse) -> Optional[object]:
+        try:
+            data = json.loads(response.body)
+        except ValueError:
+            raise NetworkError(f'Invalid server response with status {response.status}')
+        if data.get('ok'):
+            return data.get('result')
+
+        description = data.get('description', 'Unknown error')
+        parameters = data.get('parameters') or {}
+        if 'retry_after' in parameters:
+            raise RetryAfter(parameters['retry_after'])
+        if response.status in (401, 403):
+            raise Unauthorized(description)
+        if response.status == 400:
+            raise BadRequest(description)
+        if response.status >= 500:
+            raise NetworkError(description)
+        raise TelegramError(description)
+
+    async def send_message(self, chat_id, text: str, **kwargs):
+        return await self.call('sendMessage', chat_id=chat_id, text=text, **kwargs)
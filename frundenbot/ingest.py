@@ -0,0 +1,135 @@
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+from prometheus_client import Counter, Histogram
+
+LOGGER = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'X-Signature'
+TIMESTAMP_HEADER = 'X-Timestamp'
+MAX_BODY = 1024
+
+INGEST_REQUESTS = Counter('frunde_ingest_requests', 'Pushed status updates by response status', ['status'])
+INGEST_TIME = Histogram('frunde_ingest_seconds', 'Time from receiving a pushed status to the end of its processing')
+
+
+def sign(secret: str, timestamp: str, body: bytes) -> str:
+    """
+    Compute the signature a status source has to send in the X-Signature header.
+
+    :param secret: shared secret
+    :param timestamp: value of the X-Timestamp header, the unix time of the request in seconds
+    :param body: request body
+    :return: header value
+    """
+    payload = timestamp.encode('utf-8') + b'.' + body
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), payload, hashlib.sha256).hexdigest()
+
+
+class IngestServer:
+    """
+    Accepts status updates pushed by a status source, e.g. "curl -d OPEN http://bot:8001/status/frunde".
+
+    If a secret is configured, every request has to be signed with HMAC-SHA256 over its timestamp and body, see
+    sign(). Requests with a timestamp older than max_age and repeated signatures are rejected, so a captured request
+    cannot be replayed.
+    """
+
+    def __init__(self, ingest: Callable[[Optional[str], str], int], listen: str = '0.0.0.0', port: int = 8001,
+                 secret: str = None, max_age: float = 300):
+        """
+        :param ingest: called with the location name (None for the default location) and the body, returns the
+                       HTTP status of the response
+        :param listen: address to bind to
+        :param port: port to bind to
+        :param secret: shared secret for the signature, no validation if None
+        :param max_age: seconds a signed request is accepted after its timestamp, and before it
+        """
+        self._ingest = ingest
+        self._secret = secret
+        self._max_age = max_age
+        # signatures of the accepted requests that are not too old yet, mapped to their timestamp
+        self._seen: Dict[str, float] = {}
+        self._seen_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((listen, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='ingest-server', daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        LOGGER.info('Accepting pushed status updates on %s:%d', *self._server.server_address[:2])
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _accept(self, path: str, signature: Optional[str], timestamp: Optional[str], body: bytes) -> int:
+        parts = [part for part in path.split('/') if part]
+        if not parts or parts[0] != 'status' or len(parts) > 2:
+            return 404
+        if self._secret and not self._verify(signature, timestamp, body):
+            return 401
+        try:
+            text = body.decode('utf-8')
+        except UnicodeDecodeError:
+            return 400
+        return self._ingest(parts[1].lower() if len(parts) == 2 else None, text)
+
+    def _verify(self, signature: Optional[str], timestamp: Optional[str], body: bytes) -> bool:
+        if not signature or not timestamp:
+            return False
+        if not hmac.compare_digest(signature, sign(self._secret, timestamp, body)):
+            return False
+        try:
+            sent = float(timestamp)
+        except ValueError:
+            return False
+        now = time.time()
+        if abs(now - sent) > self._max_age:
+            LOGGER.warning('Rejecting pushed status with a timestamp %.0fs off', now - sent)
+            return False
+        with self._seen_lock:
+            for seen, seen_at in list(self._seen.items()):
+                if abs(now - seen_at) > self._max_age:
+                    del self._seen[seen]
+            if signature in self._seen:
+                LOGGER.warning('Rejecting replayed pushed status')
+                return False
+            self._seen[signature] = sent
+        return True
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                start = time.perf_counter()
+                length = int(self.headers.get('Content-Length', 0))
+                if length > MAX_BODY:
+                    status = 413
+                else:
+                    try:
+                        status = server._accept(self.path, self.headers.get(SIGNATURE_HEADER),
+                                                self.headers.get(TIMESTAMP_HEADER), self.rfile.read(length))
+                    except Exception as e:
+                        LOGGER.error('Could not process pushed status: %s', e)
+                        status = 500
+                INGEST_REQUESTS.labels(status).inc()
+                INGEST_TIME.observe(time.perf_counter() - start)
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                LOGGER.debug(format, *args)
+
+        return Handler
@@ -0,0 +1,113 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, List
+
+from prometheus_client import Counter, Gauge
+
+from frundenbot.storage import Storage
+
+LOGGER = logging.getLogger(__name__)
+
+LEADER = Gauge('frunde_leader', '1 if this replica is the leader, 0 otherwise')
+LEADER_CHANGES = Counter('frunde_leader_changes', 'Times this replica became or stopped being the leader', ['change'])
+
+
+class LeaderElection:
+    """
+    Elects one leader among several replicas that share a storage, using a lease in the storage.
+
+    The lease is renewed every third of its ttl. A leader only considers itself the leader for two thirds of the ttl
+    after its last successful renewal, so it steps down before a standby can take over, even with a slightly skewed
+    clock. A standby takes over at most 4/3 of the ttl after the leader stopped renewing.
+    """
+
+    def __init__(self, storage: Storage, ttl: float = 15, name: str = 'leader', holder: str = None):
+        """
+        :param storage: storage that is shared by all replicas
+        :param ttl: time in seconds after which the lease of a leader that stopped renewing it expires
+        :param name: name of the lease
+        :param holder: unique id of this replica, generated from host name and process id if None
+        """
+        self.holder = holder or f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._storage = storage
+        self._ttl = ttl
+        self._name = name
+        self._valid_until = 0.0
+        self._leader = False
+        self._listeners: List[Callable[[bool], None]] = []
+        self._changed = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='leader-election', daemon=True)
+        LEADER.set_function(lambda: int(self.is_leader))
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self._valid_until
+
+    def add_listener(self, listener: Callable[[bool], None]):
+        """
+        Register a callback that is called with the new role whenever this replica becomes or stops being the leader.
+        :param listener: callback, called from the election thread
+        """
+        self._listeners.append(listener)
+
+    def start(self):
+        self._campaign()
+        self._thread.start()
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Block until this replica is the leader.
+        :param timeout: maximum time to wait in seconds, forever if None
+        :return: True if this replica is the leader
+        """
+        with self._changed:
+            return self._changed.wait_for(lambda: self._leader, timeout)
+
+    def stop(self):
+        """
+        Stop campaigning and hand the lease over if this replica holds it.
+        """
+        self._stop.set()
+        self._thread.join()
+        if self._leader:
+            self._valid_until = 0.0
+            try:
+                self._storage.release_lease(self._name, self.holder)
+            except Exception as e:
+                LOGGER.warning('Could not release the leader lease: %s', e)
+            self._set_leader(False)
+
+    def _run(self):
+        while not self._stop.wait(self._ttl / 3):
+            self._campaign()
+
+    def _campaign(self):
+        started = time.monotonic()
+        try:
+            if self._storage.acquire_lease(self._name, self.holder, self._ttl):
+                self._valid_until = started + self._ttl * 2 / 3
+            else:
+                self._valid_until = 0.0
+        except Exception as e:
+            # keep the role until the lease runs out, the next renewal might succeed
+            LOGGER.error('Could not renew the leader lease: %s', e)
+        self._set_leader(self.is_leader)
+
+    def _set_leader(self, leader: bool):
+        with self._changed:
+            if leader == self._leader:
+                return
+            self._leader = leader
+            self._changed.notify_all()
+        LEADER_CHANGES.labels('elected' if leader else 'demoted').inc()
+        LOGGER.info('%s is %s', self.holder, 'the leader now' if leader else 'no longer the leader')
+        for listener in self._listeners:
+            try:
+                listener(leader)
+            except Exception as e:
+                LOGGER.error('Leader election listener failed: %s', e)
@@ -0,0 +1,210 @@
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from typing import Callable, Iterable, Iterator, Optional, Set, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+# chat ids are stored as packed signed 64 bit integers in native byte order
+RECORD_TYPE = 'q'
+RECORD_SIZE = array(RECORD_TYPE).itemsize
+
+
+class JournalBackend:
+    """
+    Interface for the raw persistence used by a ListenerJournal.
+    """
+
+    def read_snapshot(self) -> Optional[bytes]:
+        """
+        Get the last compacted snapshot.
+        :return: packed sorted chat ids or None if no snapshot exists yet
+        """
+        raise NotImplementedError()
+
+    def write_snapshot(self, data: bytes):
+        """
+        Replace the compacted snapshot.
+        :param data: packed sorted chat ids
+        """
+        raise NotImplementedError()
+
+    def append_journal(self, data: bytes, marker=None) -> object:
+        """
+        Append records to the journal.
+        :param data: packed chat ids
+        :param marker: marker of the records that are known already
+        :return: marker that also covers the appended records, unless records of other processes could precede them
+        """
+        raise NotImplementedError()
+
+    def read_journal(self, after=None) -> Tuple[bytes, object]:
+        """
+        Get the records in the journal that are not covered by the given marker.
+        :param after: marker of the records that are known already, all records are returned if None
+        :return: packed chat ids and a marker covering all records in the journal
+        """
+        raise NotImplementedError()
+
+    def journal_marker(self) -> object:
+        """
+        Get a marker covering all records in the journal without reading them, e.g. to drop them all.
+        """
+        raise NotImplementedError()
+
+    def truncate_journal(self, marker):
+        """
+        Drop all records up to the given marker because they are part of the snapshot now.
+        :param marker: marker returned by read_journal or journal_marker
+        """
+        raise NotImplementedError()
+
+
+class ListenerJournal:
+    """
+    Set of chat ids which is persisted as an append-only journal plus a compacted, sorted snapshot.
+
+    Additions only append a single record, membership tests are answered from memory and the journal is merged into
+    the snapshot when it is loaded and once it grew past a threshold. Replacing the set never reads the journal.
+    Without compaction, e.g. on a standby replica, loading never writes and additions never trigger a compaction.
+    """
+
+    def __init__(self, backend: JournalBackend, compact_after: int = 1024,
+                 legacy: Callable[[], Iterable[str]] = None):
+        """
+        :param backend: persistence for snapshot and journal
+        :param compact_after: number of journal records that trigger a compaction
+        :param legacy: returns the listeners of an older storage format, used once if no snapshot exists yet
+        """
+        self._backend = backend
+        self._compact_after = compact_after
+        self._legacy = legacy
+        self._lock = threading.RLock()
+        self._snapshot: Optional[array] = None
+        self._added = set()
+        self._journal_records = 0
+        # covers the journal records that are part of _added
+        self._marker = None
+        self.compaction = True
+
+    def add(self, chat_id: int):
+        """
+        Add a chat id, only touching the backend if it is not already part of the set.
+        :param chat_id: chat id
+        """
+        chat_id = int(chat_id)
+        with self._lock:
+            self._load()
+            if self._contains(chat_id):
+                return
+            record = array(RECORD_TYPE, [chat_id])
+            self._marker = self._backend.append_journal(record.tobytes(), self._marker)
+            self._added.add(chat_id)
+            self._journal_records += 1
+            if self.compaction and self._journal_records >= self._compact_after:
+                self.compact()
+
+    def __contains__(self, chat_id) -> bool:
+        with self._lock:
+            self._load()
+            return self._contains(int(chat_id))
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._snapshot) + len(self._added)
+
+    def __iter__(self) -> Iterator[int]:
+        with self._lock:
+            self._load()
+            return iter(list(merge(self._snapshot, sorted(self._added))))
+
+    def replace(self, chat_ids: Iterable):
+        """
+        Replace the whole set.
+        :param chat_ids: new members
+        """
+        with self._lock:
+            self._load()
+            self._write(array(RECORD_TYPE, sorted({int(x) for x in chat_ids})), self._backend.journal_marker())
+
+    def clear(self):
+        self.replace(())
+
+    def remove(self, chat_ids: Iterable):
+        """
+        Remove members, chat ids that were added in the meantime, also by other processes, are kept.
+        :param chat_ids: members to remove
+        """
+        with self._lock:
+            self._compact({int(x) for x in chat_ids})
+
+    def reload(self):
+        """
+        Read snapshot and journal again on the next access, e.g. because another process changed them.
+        """
+        with self._lock:
+            self._snapshot = None
+
+    def compact(self):
+        """
+        Merge the journal into the snapshot.
+        """
+        with self._lock:
+            self._compact(set())
+
+    def _compact(self, removed: Set[int]):
+        self._load()
+        # only the records that other processes appended in the meantime are read
+        journal, marker = self._backend.read_journal(self._marker)
+        self._added.update(x for x in self._unpack(journal) if not self._contains(x))
+        members = merge(self._snapshot, sorted(self._added))
+        self._write(array(RECORD_TYPE, (x for x in members if x not in removed)), marker)
+
+    def _write(self, snapshot: array, marker):
+        self._backend.write_snapshot(snapshot.tobytes())
+        self._backend.truncate_journal(marker)
+        self._snapshot = snapshot
+        self._added = set()
+        self._journal_records = 0
+        self._marker = None
+        LOGGER.debug('Compacted listener journal into %d entries', len(snapshot))
+
+    def _contains(self, chat_id: int) -> bool:
+        if chat_id in self._added:
+            return True
+        index = bisect_left(self._snapshot, chat_id)
+        return index < len(self._snapshot) and self._snapshot[index] == chat_id
+
+    def _load(self):
+        if self._snapshot is not None:
+            return
+        snapshot = array(RECORD_TYPE)
+        data = self._backend.read_snapshot()
+        if data is None and self._legacy is not None:
+            legacy = sorted({int(x) for x in self._legacy() or () if x.strip()})
+            snapshot.extend(legacy)
+            if legacy and self.compaction:
+                LOGGER.info('Migrating %d listeners to the listener journal', len(legacy))
+                self._backend.write_snapshot(snapshot.tobytes())
+        elif data:
+            snapshot.frombytes(data)
+        journal, marker = self._backend.read_journal()
+        records = self._unpack(journal)
+
+        self._snapshot = snapshot
+        self._added = {x for x in records if not self._contains(x)}
+        self._journal_records = len(records)
+        self._marker = marker
+        if records and self.compaction:
+            # the next load only has to read the snapshot
+            self._write(array(RECORD_TYPE, merge(self._snapshot, sorted(self._added))), marker)
+
+    @staticmethod
+    def _unpack(journal: bytes) -> array:
+        records = array(RECORD_TYPE)
+        # a torn write at the end of the journal is ignored
+        records.frombytes(journal[:len(journal) - len(journal) % records.itemsize])
+        return records
@@ -0,0 +1,99 @@
+from typing import TYPE_CHECKING, Optional, Union
+
+from frundenbot import MESSAGE_OPEN, STATE_UNKNOWN
+from frundenbot.adaptive import AdaptivePolling
+from frundenbot.fetcher import STATUS_URL, StatusFetcher
+from frundenbot.history import StateHistory
+from frundenbot.notifier import Hysteresis, Notifier
+from frundenbot.responses import ResponseRenderer
+from frundenbot.sender import AsyncMessageSender, MessageSender
+from frundenbot.storage import Storage
+
+if TYPE_CHECKING:
+    # the engine imports the scheduler, which imports this module
+    from frundenbot.engine import AsyncEngine
+
+DEFAULT_LOCATION = 'frunde'
+
+
+class Location:
+    """
+    A watched place with its own status endpoint, refresh interval, current state and subscribers.
+    """
+
+    def __init__(self, name: str, url: str, refresh_interval: int, sender: Union[MessageSender, AsyncMessageSender],
+                 storage: Storage, title: str = None, history: StateHistory = None, hysteresis: Hysteresis = None,
+                 shared: bool = False, engine: 'AsyncEngine' = None, adaptive: AdaptivePolling = None):
+        """
+        :param name: name that is used in commands, e.g. /open <name>
+        :param url: status endpoint that returns OPEN or CLOSED
+        :param refresh_interval: interval in seconds in which the status is polled
+        :param sender: sender for the notifications
+        :param storage: storage for the data of this location
+        :param title: name that is put in front of all messages about this location
+        :param history: log of the state transitions, no history is kept if None
+        :param hysteresis: damping of flapping states before notifications are sent
+        :param shared: the storage is shared with other replicas
+        :param engine: event loop that polls and notifies, the calling threads do if None; sender has to be an
+            AsyncMessageSender then
+        :param adaptive: adapts the poll interval to the history, the refresh interval is always used if None or if no
+            history is kept
+        """
+        self.name = name
+        self.refresh_interval = refresh_interval
+        # polling can be slower than the refresh interval if the status is pushed, see FrundenBot.start_ingest
+        self.poll_interval = refresh_interval
+        self.storage = storage
+        self.state = STATE_UNKNOWN
+        self.history = history
+        self.adaptive = adaptive if history else None
+        self.responses = ResponseRenderer(cache_time=refresh_interval, title=title)
+        message = f'{title}: {MESSAGE_OPEN}' if title else MESSAGE_OPEN
+        if engine is None:
+            self.fetcher = StatusFetcher(url, backoff=refresh_interval)
+            self.notifier = Notifier(sender, storage, message=message, hysteresis=hysteresis, name=name, shared=shared)
+        else:
+            self.fetcher = engine.fetcher(url, backoff=refresh_interval)
+            self.notifier = engine.notifier(sender, storage, message=message, hysteresis=hysteresis, name=name,
+                                            shared=shared)
+
+    def next_poll_interval(self) -> float:
+        """
+        Seconds until the location should be polled again.
+        """
+        if self.adaptive is None:
+            return self.poll_interval
+        return self.adaptive.interval(self.name, self.history, self.poll_interval, self.state)
+
+    def __repr__(self):
+        return f'Location({self.name}, {self.fetcher.url}, every {self.poll_interval}s)'
+
+
+class LocationSpec:
+    """
+    Configuration of a location as given on the command line, "NAME=URL" or "NAME=URL@INTERVAL".
+    """
+
+    def __init__(self, name: str, url: str, refresh_interval: Optional[int] = None):
+        self.name = name
+        self.url = url
+        self.refresh_interval = refresh_interval
+
+    @classmethod
+    def parse(cls, value: str) -> 'LocationSpec':
+        """
+        :param value: location as given on the command line
+        :raises ValueError: if the value is not a valid location
+        """
+        name, separator, url = value.partition('=')
+        if not separator or not name or not url:
+            raise ValueError(f'Expected NAME=URL[@INTERVAL], got "{value}"')
+        refresh_interval = None
+        rest, separator, interval = url.rpartition('@')
+        if separator and interval.isdigit():
+            url, refresh_interval = rest, int(interval)
+        return cls(name.strip().lower(), url.strip(), refresh_interval)
+
+    @classmethod
+    def default(cls) -> 'LocationSpec':
+        return cls(DEFAULT_LOCATION, STATUS_URL)
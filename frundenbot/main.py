@@ -18,26 +18,12 @@
 
 import logging
 import os
-import string
 import sys
-import time
+from typing import List
 
 import click
-import requests
-from emoji import emojize
-from prometheus_client import Gauge, Summary, start_http_server
-from telegram import (InlineQueryResultArticle, InputTextMessageContent,
-                      ParseMode, Update)
-from telegram.ext import (CallbackContext, CommandHandler, Filters,
-                          InlineQueryHandler, MessageHandler, Updater)
-from telegram_click import generate_command_list
-from telegram_click.decorator import command
 
-from frundenbot import MESSAGE_OPEN, STATE_CLOSED, STATE_OPEN, STATE_UNKNOWN
-from frundenbot.notifier import Notifier
-from frundenbot.storage import Storage
-
-cache = emojize('Sorry, ich weiß es nicht! :confused:', language='alias')
+from frundenbot.startup import STARTUP
 
 logging.getLogger('JobQueue').setLevel(logging.INFO)
 logging.getLogger('telegram').setLevel(logging.INFO)
@@ -45,255 +31,216 @@ logging.getLogger('requests').setLevel(logging.INFO)
 
 logging_format = '[%(asctime)s: %(levelname)s/%(name)s] %(message)s'
 logging.basicConfig(level=logging.INFO, format=logging_format)
+# the message log is written as plain JSON lines, without the prefix of the other log output
+message_log_handler = logging.StreamHandler()
+message_log_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.getLogger('frundenbot.messages').addHandler(message_log_handler)
+logging.getLogger('frundenbot.messages').propagate = False
 
 LOGGER = logging.getLogger(__name__)
 
-LIST_OF_ADMINS = [
-    int(x) for x in os.environ.get('TELEGRAM_BOT_ADMINS').split(',')
-]
-
-
-class FrundenBot:
-    def __init__(self, token, refresh_interval, storage: Storage):
-
-        self.storage = storage
-        self.FRUNDE_OPEN = Gauge(
-            'frunde_status', '1 if Frunde is open,-1 on error, 0 otherwise')
-
-        updater = Updater(token=token, use_context=True)
-
-        self.notifier = Notifier(updater.bot, storage)
-
-        dispatcher = updater.dispatcher
-        queue = updater.job_queue
-        queue.run_repeating(self.refresh_cache,
-                            interval=refresh_interval, first=0)
-        me = dispatcher.bot.get_me()
-        LOGGER.info('Running as %s (%s)', me.username, me.id)
-
-        handler_groups = {
-            0: [MessageHandler(None, callback=self._callback_log_message)],
-            1: [
-                InlineQueryHandler(callback=self._callback_inline),
-                CommandHandler(['help', 'h'], callback=self._callback_help),
-                CommandHandler('start', callback=self._callback_start),
-                CommandHandler(['open', 'offen'],
-                               callback=self._callback_is_open),
-                CommandHandler(['mate', 'drinks'],
-                               callback=self._callback_get_drinks),
-                CommandHandler('notify', callback=self._callback_notify),
-                CommandHandler('whoami', callback=self._callback_whoami),
-                CommandHandler('set_mate', callback=self._callback_set_drinks),
-                MessageHandler(Filters.text, callback=self._callback_is_open)
-            ]
-        }
-
-        for group, handlers in handler_groups.items():
-            for handler in handlers:
-                dispatcher.add_handler(handler, group=group)
-
-        updater.start_polling()
-        updater.idle()
-
-    LOG_TIME = Summary('frunde_log_seconds',
-                       'Time spent logging incomming message')
-
-    @LOG_TIME.time()
-    def _callback_log_message(self, update: Update, context: CallbackContext):
-        chat = update.message.chat
-        target_chat = ''
-        if chat.type == 'group':
-            target_chat = chat.title
-        elif chat.type == 'private':
-            if chat.first_name:
-                target_chat += chat.first_name
-            if chat.last_name:
-                target_chat += ' %s' % chat.last_name
-            if chat.username:
-                target_chat += ' (%s)' % chat.username
-        LOGGER.info('In:  %s: %s' % (target_chat, update.message.text))
-
-    START_TIME = Summary('frunde_start_seconds',
-                         'Time spent executing /start handler')
-
-    @START_TIME.time()
-    def _callback_start(self, update: Update, context: CallbackContext):
-        context.bot.sendMessage(chat_id=update.message.chat_id,
-                                text='Egal was du sagst, ich sag nur, ob die Freitagsrunde offen hat! Du kannst mich direkt anschreiben oder inline per @FrundenBot in anderen Chats benutzen.')
-
-    @command(name=['help', 'h'], description='List of commands supported by this bot.')
-    def _callback_help(self, update: Update, context: CallbackContext):
-        text = generate_command_list(update, context)
-        context.bot.send_message(
-            chat_id=update.message.chat_id, text=text, parse_mode=ParseMode.MARKDOWN)
-
-    OPEN_TIME = Summary('frunde_open_seconds',
-                        'Time spent executing /open handler')
-
-    @OPEN_TIME.time()
-    @command(name='open', description='Is the Freitagsrunde open right now?')
-    def _callback_is_open(self, update: Update, context: CallbackContext):
-        context.bot.sendMessage(chat_id=update.message.chat_id,
-                                text='{}\nÜbrigens kannst du mit /mate nachgucken, ob es noch Getränke gibt.'.format(
-                                    cache))
-
-    NOTIFY_TIME = Summary('notify_seconds',
-                          'Time spent executing /notify handler')
-
-    @NOTIFY_TIME.time()
-    @command(name='notify', description='Get a notification when the Freitagsrunde opens up.')
-    def _callback_notify(self, update: Update, context: CallbackContext):
-        chat_id = update.effective_chat.id
-        self.notifier.register(chat_id)
-        context.bot.sendMessage(
-            chat_id=update.message.chat_id,
-            text=emojize(
-                "Wir benachrichtigen dich, sobald die Freitagsrunde wieder geöffnet hat :mailbox_with_mail:",
-                language='alias')
-        )
-
-    WHOAMI_TIME = Summary('frunde_whoami_seconds', 'Time spent executing /whoami handler')
-
-    @WHOAMI_TIME.time()
-    def _callback_whoami(self, update: Update, context: CallbackContext):
-        context.bot.sendMessage(chat_id=update.message.chat_id,
-                                text='You are: {} ({})'.format(
-                                    update.message.from_user.name, update.message.chat_id))
-        LOGGER.info('This is: {} ({})'.format(
-            update.message.from_user.name, update.message.chat_id))
-
-    GET_DRINKS_TIME = Summary(
-        'frunde_get_drinks_seconds', 'Time spent executing /mate (/drinks) handler')
-
-    @GET_DRINKS_TIME.time()
-    @command(name=['mate', 'drinks'], description='Are there drinks available at the Freitagsrunde?')
-    def _callback_get_drinks(self, update: Update, context: CallbackContext):
-        try:
-            drinks = self.storage.get_mate()
-            if drinks is None:
-                raise AssertionError("No mate value in storage")
-        except Exception as e:
-            drinks = emojize(
-                'Uhm, das weiß ich nicht. :confused:', language='alias')
-            LOGGER.error(e)
-        context.bot.sendMessage(chat_id=update.message.chat_id, text=drinks)
 
-    SET_DRINKS = Summary('frunde_set_drinks_seconds',
-                         'Time spent executing /set_mate handler')
-
-    @SET_DRINKS.time()
-    def _callback_set_drinks(self, update: Update, context: CallbackContext):
-        if update.message.chat_id not in LIST_OF_ADMINS:
-            context.bot.sendMessage(chat_id=update.message.chat_id, text=emojize(
-                ':poop: Nö :poop:', language='alias'))
-            return
-
-        mate_message = ' '.join(context.args)
-        LOGGER.info('New mate message: {}'.format(mate_message))
-        try:
-            self.storage.set_mate('{}\n(Aktualisiert: {})'.format(mate_message, time.strftime('%d.%m.%Y um %H:%M')))
-            result = 'Neuer Matepegel:\n{}'.format(mate_message)
-        except Exception as e:
-            result = emojize(
-                'Uhm, das hat nicht geklappt. :confused:', language='alias')
-            LOGGER.error(e)
-        context.bot.sendMessage(
-            chat_id=update.message.chat_id, text=result)
-        for admin in LIST_OF_ADMINS:
-            context.bot.sendMessage(chat_id=admin,
-                                    text='Neuer Matepegel von {} ({}):\n{}'.format(
-                                        update.message.from_user.name,
-                                        update.message.chat_id, result))
-
-    INLINE_TIME = Summary('frunde_inline_seconds',
-                          'Time spent executing inline handler')
-
-    @INLINE_TIME.time()
-    def _callback_inline(self, update: Update, context: CallbackContext):
-        query = update.inline_query.query
-        if not query:
-            return
-        results = list()
-        results.append(
-            InlineQueryResultArticle(
-                id=0,
-                title='Jemand da?',
-                input_message_content=InputTextMessageContent(cache)
-            )
-        )
-        LOGGER.info('Inline Query')
-        context.bot.answerInlineQuery(update.inline_query.id, results)
-
-    CACHE_REFRESH_TIME = Summary(
-        'frunde_cache_refresh_seconds', 'Time spent refreshing cache')
-
-    @CACHE_REFRESH_TIME.time()
-    def refresh_cache(self, context: CallbackContext):
-        global cache
-        try:
-            LOGGER.debug('Refresh cache')
-            r = requests.get('https://watchyour.freitagsrunde.org/status')
-            r.raise_for_status()
-            state = self._extract_state(r.text)
-            if state == STATE_OPEN:
-                cache = emojize(MESSAGE_OPEN, language='alias')
-            else:
-                cache = emojize(
-                    ':red_circle: Leider haben wir gerade zu.', language='alias')
-        except Exception as e:
-            state = STATE_UNKNOWN
-            cache = emojize(
-                'Sorry, ich weiß es nicht! :confused:', language='alias')
-            LOGGER.error(e)
-
-        self.FRUNDE_OPEN.set(state)
-        self.notifier.on_state(state)
-
-    @staticmethod
-    def _extract_state(text) -> int:
-        """
-        Extracts the "open state" from the given text
-        :param text: text from watchyour.freitagsrunde
-        :return: state
-        """
-        if text.strip() == "OPEN":
-            return STATE_OPEN
-        elif text.strip() == "CLOSED":
-            return STATE_CLOSED
-        else:
-            return STATE_UNKNOWN
+def __getattr__(name):
+    # FrundenBot used to live in this module, it is only imported when it is actually used
+    if name == 'FrundenBot':
+        from frundenbot.bot import FrundenBot
+        return FrundenBot
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 @click.command()
 @click.option('--token', envvar='FRUNDE_TOKEN', help='Telegram bot token.', required=True)
 @click.option('--refresh-interval', envvar='FRUNDE_REFRESH_INTERVAL', default=60,
               help='Interval in seconds in which the bot should check if the Freitagsrunde is open.', show_default=True)
+@click.option('--location', 'locations', envvar='FRUNDE_LOCATIONS', multiple=True,
+              help='Location to watch as NAME=URL or NAME=URL@INTERVAL, can be given multiple times. '
+                   'Defaults to the Freitagsrunde.')
+@click.option('--poll-parallelism', envvar='FRUNDE_POLL_PARALLELISM', default=8,
+              help='Maximum number of locations that are polled at the same time.', show_default=True)
+@click.option('--history-path', envvar='FRUNDE_HISTORY_PATH',
+              help='Directory for the state transition logs used by /stats. No history is kept if unset.')
+@click.option('--adaptive-polling', envvar='FRUNDE_ADAPTIVE_POLLING', is_flag=True, default=False,
+              help='Poll faster around the times the state usually changes and slower while it is closed, '
+                   'based on the history in --history-path.')
+@click.option('--poll-floor', envvar='FRUNDE_POLL_FLOOR', default=15.0,
+              help='Shortest poll interval in seconds with --adaptive-polling.', show_default=True)
+@click.option('--poll-ceiling', envvar='FRUNDE_POLL_CEILING', default=900.0,
+              help='Longest poll interval in seconds with --adaptive-polling.', show_default=True)
+@click.option('--confirmations', envvar='FRUNDE_CONFIRMATIONS', default=1,
+              help='Consecutive observations of a new state before it is accepted.', show_default=True)
+@click.option('--min-dwell', envvar='FRUNDE_MIN_DWELL', default=0.0,
+              help='Seconds a new state has to be observed before it is accepted.', show_default=True)
+@click.option('--text-chat-rate', envvar='FRUNDE_TEXT_CHAT_RATE', default=0.2,
+              type=click.FloatRange(min=0, min_open=True),
+              help='Replies per second to free text messages of one chat, further messages get one delayed reply.',
+              show_default=True)
+@click.option('--text-chat-burst', envvar='FRUNDE_TEXT_CHAT_BURST', default=3, type=click.IntRange(min=1),
+              help='Free text messages of one chat that are answered at once.', show_default=True)
+@click.option('--text-global-rate', envvar='FRUNDE_TEXT_GLOBAL_RATE', default=20.0,
+              type=click.FloatRange(min=0, min_open=True),
+              help='Replies per second to free text messages of all chats.', show_default=True)
+@click.option('--message-log-rate', envvar='FRUNDE_MESSAGE_LOG_RATE', default=1.0,
+              help='Messages per second and chat that are logged once a chat exceeds the burst.', show_default=True)
+@click.option('--message-log-burst', envvar='FRUNDE_MESSAGE_LOG_BURST', default=5,
+              help='Messages a chat can send at once before its messages are sampled.', show_default=True)
+@click.option('--message-log-queue-size', envvar='FRUNDE_MESSAGE_LOG_QUEUE_SIZE', default=10000,
+              help='Maximum number of messages waiting to be logged, further messages are dropped.',
+              show_default=True)
 @click.option('--s3-region-name', envvar='FRUNDE_S3_REGION_NAME', help='Region name of the s3 bucket.')
 @click.option('--s3-bucket', envvar='FRUNDE_S3_BUCKET', help='Name of the s3 bucket.')
 @click.option('--s3-key', envvar='FRUNDE_S3_KEY', help='Key ID of the S3 user.')
 @click.option('--s3-secret', envvar='FRUNDE_S3_SECRET', help='Secret of the S3 user.')
 @click.option('--file-path', envvar='FRUNDE_FILE_PATH', default='/var/frunde/',
               help='Path to store local data, if S3 is not used.')
+@click.option('--sqlite-path', envvar='FRUNDE_SQLITE_PATH',
+              help='Path to a SQLite database to store data in, instead of S3 or the local directory.')
+@click.option('--sqlite-migrate', envvar='FRUNDE_SQLITE_MIGRATE', is_flag=True,
+              help='Copy the data of the S3 bucket or local directory into an empty SQLite database on startup.')
+@click.option('--cache-ttl', envvar='FRUNDE_CACHE_TTL', default=30.0,
+              help='Seconds for which storage reads are served from memory, 0 disables the cache.', show_default=True)
+@click.option('--cache-latency-budget', envvar='FRUNDE_CACHE_LATENCY_BUDGET', default=0.25,
+              help='Seconds to wait for the storage before a stale cached value is served.', show_default=True)
+@click.option('--write-behind-interval', envvar='FRUNDE_WRITE_BEHIND_INTERVAL', default=0.0,
+              help='Seconds for which storage writes are buffered before they are flushed, 0 writes right away.',
+              show_default=True)
+@click.option('--write-behind-journal', envvar='FRUNDE_WRITE_BEHIND_JOURNAL',
+              help='Local file that keeps buffered writes across crashes, write-behind.jsonl in --file-path if not '
+                   'set.')
+@click.option('--leader-election', envvar='FRUNDE_LEADER_ELECTION', is_flag=True,
+              help='Run as one of several replicas sharing the storage, only the elected leader polls and notifies.')
+@click.option('--leader-lease-ttl', envvar='FRUNDE_LEADER_LEASE_TTL', default=15.0,
+              help='Seconds after which the lease of a leader that stopped renewing it expires.', show_default=True)
+@click.option('--bot-api-url', envvar='FRUNDE_BOT_API_URL', default='https://api.telegram.org',
+              help='Base URL of the Bot API, e.g. of a self-hosted Bot API server.', show_default=True)
+@click.option('--engine', envvar='FRUNDE_ENGINE', type=click.Choice(['threads', 'asyncio']), default='threads',
+              help='How status polls and notifications are run, asyncio sends large broadcasts concurrently.',
+              show_default=True)
+@click.option('--async-concurrency', envvar='FRUNDE_ASYNC_CONCURRENCY', default=1000,
+              help='Notifications in flight at the same time with the asyncio engine.', show_default=True)
+@click.option('--collapse-backlog/--no-collapse-backlog', envvar='FRUNDE_COLLAPSE_BACKLOG', default=True,
+              help='On startup, answer the updates that queued up in the meantime once per chat instead of one by one.',
+              show_default=True)
+@click.option('--mode', envvar='FRUNDE_MODE', type=click.Choice(['polling', 'webhook']), default='polling',
+              help='How updates are received from Telegram.', show_default=True)
+@click.option('--webhook-listen', envvar='FRUNDE_WEBHOOK_LISTEN', default='0.0.0.0',
+              help='Address the webhook listener binds to.', show_default=True)
+@click.option('--webhook-port', envvar='FRUNDE_WEBHOOK_PORT', default=8443, help='Port of the webhook listener.',
+              show_default=True)
+@click.option('--webhook-url', envvar='FRUNDE_WEBHOOK_URL',
+              help='Public URL of the webhook listener. If unset, no webhook is registered at Telegram.')
+@click.option('--webhook-secret', envvar='FRUNDE_WEBHOOK_SECRET',
+              help='Secret token Telegram has to send with every webhook update.')
+@click.option('--webhook-workers', envvar='FRUNDE_WEBHOOK_WORKERS', default=4,
+              help='Number of threads processing webhook updates.', show_default=True)
+@click.option('--webhook-queue-size', envvar='FRUNDE_WEBHOOK_QUEUE_SIZE', default=1000,
+              help='Maximum number of webhook updates waiting for a worker.', show_default=True)
+@click.option('--ingest-port', envvar='FRUNDE_INGEST_PORT', type=int,
+              help='Port to accept pushed status updates on, e.g. "POST /status/<location>" with OPEN or CLOSED. '
+                   'Disabled if unset.')
+@click.option('--ingest-listen', envvar='FRUNDE_INGEST_LISTEN', default='0.0.0.0',
+              help='Address the status ingestion listener binds to.', show_default=True)
+@click.option('--ingest-secret', envvar='FRUNDE_INGEST_SECRET',
+              help='Shared secret for the HMAC-SHA256 signature of pushed status updates.')
+@click.option('--ingest-fallback-interval', envvar='FRUNDE_INGEST_FALLBACK_INTERVAL', default=600,
+              help='Interval in seconds in which locations are still polled if status updates are pushed.',
+              show_default=True)
 @click.option('--metrics-port', envvar='FRUNDE_METRICS_PORT', default=8000, help='Port to expose Prometheus metrics.',
               show_default=True)
-def cli(token, refresh_interval: int, s3_region_name: str, s3_bucket: str, s3_key: str, s3_secret: str, file_path: str,
-        metrics_port: int):
+def cli(token, refresh_interval: int, locations: List[str], poll_parallelism: int, history_path: str,
+        adaptive_polling: bool, poll_floor: float, poll_ceiling: float, confirmations: int, min_dwell: float,
+        text_chat_rate: float, text_chat_burst: int, text_global_rate: float,
+        message_log_rate: float, message_log_burst: int, message_log_queue_size: int, s3_region_name: str,
+        s3_bucket: str, s3_key: str, s3_secret: str, file_path: str, sqlite_path: str, sqlite_migrate: bool,
+        cache_ttl: float, cache_latency_budget: float, write_behind_interval: float, write_behind_journal: str,
+        leader_election: bool, leader_lease_ttl: float, bot_api_url: str, engine: str, async_concurrency: int,
+        collapse_backlog: bool, mode: str, webhook_listen: str, webhook_port: int, webhook_url: str,
+        webhook_secret: str, webhook_workers: int, webhook_queue_size: int, ingest_port: int, ingest_listen: str,
+        ingest_secret: str, ingest_fallback_interval: int, metrics_port: int):
     """
     All options are also available as environment variables, e.g. "--refresh-interval=30" can be set by "export REFRESH_INTERVAL=30".
     """
 
-    if s3_region_name and s3_bucket and s3_key and s3_secret:
-        from frundenbot.storage import S3Storage
-        storage = S3Storage(region_name=s3_region_name, bucket=s3_bucket, key=s3_key, secret=s3_secret)
-    elif s3_region_name or s3_bucket or s3_key or s3_secret:
+    with STARTUP.phase('imports'):
+        from prometheus_client import start_http_server
+
+        from frundenbot import metrics
+        from frundenbot.adaptive import AdaptivePolling
+        from frundenbot.bot import FrundenBot
+        from frundenbot.locations import LocationSpec
+        from frundenbot.messagelog import MessageLog
+        from frundenbot.leader import LeaderElection
+        from frundenbot.notifier import Hysteresis
+        from frundenbot.throttle import ReplyThrottle
+
+    try:
+        specs = [LocationSpec.parse(location) for location in locations]
+    except ValueError as e:
+        LOGGER.error(e)
+        sys.exit(1)
+
+    if (s3_region_name or s3_bucket or s3_key or s3_secret) and not (s3_region_name and s3_bucket and s3_key and s3_secret):
         LOGGER.error('Either all S3 settings need to be specified or none.')
         sys.exit(1)
-    else:
-        from frundenbot.storage import FileStorage
-        storage = FileStorage(path=file_path)
+
+    if adaptive_polling and not history_path:
+        LOGGER.error('Adaptive polling needs the history, please set --history-path.')
+        sys.exit(1)
+
+    with STARTUP.phase('storage'):
+        if s3_region_name and (not sqlite_path or sqlite_migrate):
+            from frundenbot.storage import S3Storage
+            storage = S3Storage(region_name=s3_region_name, bucket=s3_bucket, key=s3_key, secret=s3_secret)
+        elif not sqlite_path or sqlite_migrate:
+            from frundenbot.storage import FileStorage
+            storage = FileStorage(path=file_path)
+
+        if sqlite_path:
+            from frundenbot.storage import SQLiteStorage, migrate
+            source = storage if sqlite_migrate else None
+            storage = SQLiteStorage(path=sqlite_path)
+            if source:
+                if storage.is_empty():
+                    migrate(source, storage)
+                else:
+                    LOGGER.info('SQLite database %s already contains data, skipping migration', sqlite_path)
+
+        storage = metrics.InstrumentedStorage(storage)
+
+        if write_behind_interval > 0:
+            from frundenbot.writebehind import WriteBehindStorage
+            if not write_behind_journal:
+                write_behind_journal = os.path.join(file_path, 'write-behind.jsonl')
+            storage = WriteBehindStorage(storage, journal_path=write_behind_journal, interval=write_behind_interval)
+
+        if cache_ttl > 0:
+            from frundenbot.cache import CachingStorage
+            storage = CachingStorage(storage, ttl=cache_ttl, latency_budget=cache_latency_budget)
 
     start_http_server(metrics_port)
-    FrundenBot(token=token, refresh_interval=refresh_interval, storage=storage)
+    with STARTUP.phase('setup'):
+        election = LeaderElection(storage, ttl=leader_lease_ttl) if leader_election else None
+        async_engine = None
+        if engine == 'asyncio':
+            from frundenbot.engine import AsyncEngine
+            async_engine = AsyncEngine(concurrency=async_concurrency)
+        message_log = MessageLog(chat_rate=message_log_rate, chat_burst=message_log_burst,
+                                 queue_size=message_log_queue_size)
+        bot = FrundenBot(token=token, refresh_interval=refresh_interval, storage=storage, locations=specs,
+                         poll_parallelism=poll_parallelism, history_path=history_path, message_log=message_log,
+                         hysteresis=Hysteresis(confirmations, min_dwell), election=election,
+                         bot_api_url=bot_api_url.rstrip('/'), engine=async_engine, collapse_backlog=collapse_backlog,
+                         adaptive=AdaptivePolling(floor=poll_floor, ceiling=poll_ceiling) if adaptive_polling else None,
+                         throttle=ReplyThrottle(chat_rate=text_chat_rate, chat_burst=text_chat_burst,
+                                                global_rate=text_global_rate,
+                                                global_burst=max(1, int(2 * text_global_rate))))
+    if ingest_port:
+        bot.start_ingest(listen=ingest_listen, port=ingest_port, secret=ingest_secret,
+                         fallback_interval=ingest_fallback_interval)
+    if mode == 'webhook':
+        bot.run_webhook(listen=webhook_listen, port=webhook_port, url=webhook_url, secret_token=webhook_secret,
+                        workers=webhook_workers, queue_size=webhook_queue_size)
+    else:
+        bot.run_polling()
 
 
 if __name__ == '__main__':
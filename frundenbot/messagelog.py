@@ -0,0 +1,120 @@
+import json
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List
+
+from prometheus_client import Counter, Gauge
+from telegram import Update
+
+from frundenbot.sender import ChatRateLimiter
+
+LOGGER = logging.getLogger(__name__)
+# the records go to their own logger, so that they can be routed apart from the other log output
+MESSAGE_LOGGER = logging.getLogger('frundenbot.messages')
+
+MESSAGE_LOG_RECORDS = Counter('frunde_message_log_records', 'Incoming messages written to the message log')
+MESSAGE_LOG_DROPPED = Counter('frunde_message_log_dropped', 'Incoming messages not written to the message log',
+                              ['reason'])
+MESSAGE_LOG_QUEUE_DEPTH = Gauge('frunde_message_log_queue_depth', 'Messages waiting for the message log writer')
+
+# records written in one go by the writer thread
+BATCH_SIZE = 256
+
+
+class MessageLog:
+    """
+    Logs incoming messages as JSON lines from a background thread.
+
+    The dispatcher thread only copies a few fields into a bounded queue. Formatting and logging happen on the writer
+    thread.
+    Chats that send more messages than their rate allows are sampled, the next record of the chat contains the number
+    of skipped messages. If the writer falls behind and the queue is full, records are dropped.
+    """
+
+    def __init__(self, logger: logging.Logger = MESSAGE_LOGGER, chat_rate: float = 1.0, chat_burst: int = 5,
+                 queue_size: int = 10000, max_chats: int = 10000):
+        """
+        :param logger: logger the JSON lines are logged to with level INFO
+        :param chat_rate: messages per second and chat that are logged when a chat sends more than its burst
+        :param chat_burst: messages a chat can send at once before it is sampled
+        :param queue_size: maximum number of records waiting for the writer
+        :param max_chats: number of chats whose skipped messages are counted, the least recently sampled is forgotten
+        """
+        self._logger = logger
+        self._limiter = ChatRateLimiter(chat_rate, burst=chat_burst, max_chats=max_chats)
+        self._max_chats = max_chats
+        self._skipped: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = threading.Thread(target=self._write, name='message-log', daemon=True)
+        self._writer.start()
+        MESSAGE_LOG_QUEUE_DEPTH.set_function(self._queue.qsize)
+
+    def log(self, update: Update):
+        """
+        Queue a record of the message, never blocks.
+        :param update: update with a message
+        """
+        message = update.effective_message
+        chat = update.effective_chat
+        if message is None or chat is None:
+            return
+        if not self._limiter.try_acquire(chat.id):
+            with self._lock:
+                self._skipped[chat.id] = self._skipped.pop(chat.id, 0) + 1
+                if len(self._skipped) > self._max_chats:
+                    self._skipped.popitem(last=False)
+            MESSAGE_LOG_DROPPED.labels('sampled').inc()
+            return
+        with self._lock:
+            skipped = self._skipped.pop(chat.id, 0)
+        try:
+            self._queue.put_nowait((time.time(), chat, message.text, skipped))
+        except queue.Full:
+            MESSAGE_LOG_DROPPED.labels('queue_full').inc()
+
+    def close(self):
+        """
+        Write all queued records and stop the writer.
+        """
+        self._queue.put(None)
+        self._writer.join()
+
+    @staticmethod
+    def _record(timestamp: float, chat, text: str, skipped: int) -> Dict:
+        record = {
+            'time': round(timestamp, 3),
+            'chat_id': chat.id,
+            'chat_type': chat.type,
+            'chat': chat.title if chat.type != 'private' else
+            ' '.join(filter(None, [chat.first_name, chat.last_name])),
+            'text': text,
+        }
+        if chat.username:
+            record['username'] = chat.username
+        if skipped:
+            record['skipped'] = skipped
+        return record
+
+    def _write(self):
+        while True:
+            items: List = [self._queue.get()]
+            while len(items) < BATCH_SIZE:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in items
+            lines = [json.dumps(self._record(*item), ensure_ascii=False) for item in items if item is not None]
+            for line in lines:
+                try:
+                    self._logger.info(line)
+                    MESSAGE_LOG_RECORDS.inc()
+                except Exception as e:
+                    MESSAGE_LOG_DROPPED.labels('write_error').inc()
+                    LOGGER.error('Could not write the message log: %s', e)
+            if stop:
+                return
@@ -0,0 +1,130 @@
+import asyncio
+import functools
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+from prometheus_client import Gauge, Histogram
+from telegram import Bot
+
+from frundenbot.storage import Storage
+
+HANDLER_TIME = Histogram('frunde_handler_seconds', 'Time spent executing update handlers', ['handler', 'outcome'])
+STORAGE_TIME = Histogram('frunde_storage_seconds', 'Time spent in storage calls', ['backend', 'operation', 'outcome'])
+TELEGRAM_TIME = Histogram('frunde_telegram_seconds', 'Time spent in Bot API calls', ['method', 'outcome'])
+
+LISTENERS = Gauge('frunde_notification_listeners', 'Number of chats waiting for a notification', ['location'])
+LAST_REFRESH_AGE = Gauge('frunde_last_refresh_age_seconds', 'Seconds since the status was refreshed successfully')
+
+# long polling blocks on purpose, its duration says nothing about the Bot API latency
+UNTIMED_METHODS = {'getUpdates'}
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels):
+    """
+    Observe the duration of the block, labelled with the given labels and the outcome ("ok" or "error").
+
+    :param histogram: histogram with an "outcome" label
+    :param labels: values for the other labels
+    """
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        histogram.labels(outcome=outcome, **labels).observe(time.perf_counter() - start)
+
+
+def handler(name: str) -> Callable:
+    """
+    Decorator that times an update handler, which can also be a coroutine function.
+
+    :param name: name of the handler in the metrics
+    """
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timed(HANDLER_TIME, handler=name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(HANDLER_TIME, handler=name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class RefreshClock:
+    """
+    Remembers when the status was refreshed successfully for the last time.
+    """
+
+    def __init__(self):
+        self.last = None
+        LAST_REFRESH_AGE.set_function(self.age)
+
+    def tick(self):
+        self.last = time.time()
+
+    def age(self) -> float:
+        return time.time() - self.last if self.last is not None else float('inf')
+
+
+class InstrumentedBot(Bot):
+    """
+    Bot that times every Bot API request.
+    """
+
+    def _post(self, endpoint: str, *args, **kwargs):
+        if endpoint in UNTIMED_METHODS:
+            return super()._post(endpoint, *args, **kwargs)
+        with timed(TELEGRAM_TIME, method=endpoint):
+            return super()._post(endpoint, *args, **kwargs)
+
+
+class InstrumentedStorage(Storage):
+    """
+    Storage decorator that times every call to the wrapped storage.
+    """
+
+    def __init__(self, backend: Storage):
+        """
+        :param backend: storage that is wrapped
+        """
+        self._backend = backend
+        self._name = type(backend).__name__
+
+    @property
+    def backend(self) -> Storage:
+        return self._backend
+
+    def scoped(self, name: str) -> 'InstrumentedStorage':
+        return InstrumentedStorage(self._backend.scoped(name))
+
+    def __getattr__(self, item):
+        # backend specific methods, e.g. SQLiteStorage.is_empty
+        return getattr(self._backend, item)
+
+
+def _instrumented(operation: str):
+    def method(self, *args, **kwargs):
+        with timed(STORAGE_TIME, backend=self._name, operation=operation):
+            return getattr(self._backend, operation)(*args, **kwargs)
+
+    method.__name__ = operation
+    method.__doc__ = getattr(Storage, operation).__doc__
+    return method
+
+
+for _operation in [name for name in vars(Storage)
+                   if not name.startswith('_') and name != 'scoped' and callable(getattr(Storage, name))]:
+    setattr(InstrumentedStorage, _operation, _instrumented(_operation))
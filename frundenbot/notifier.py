@@ -1,67 +1,227 @@
+import asyncio
 import logging
+import threading
+import time
+from concurrent.futures import Executor
 
 from emoji import emojize
-from telegram import Bot, ParseMode
+from prometheus_client import Counter
+from telegram import ParseMode
 
-from frundenbot import MESSAGE_OPEN, STATE_OPEN, STATE_UNKNOWN
-from frundenbot.storage import Storage
+from frundenbot import MESSAGE_OPEN, STATE_OPEN, STATE_UNKNOWN, metrics
+from frundenbot.sender import AsyncMessageSender, MessageSender
+from frundenbot.storage import AsyncStorage, Storage
 
 LOGGER = logging.getLogger(__name__)
 
+SUPPRESSED_TRANSITIONS = Counter('frunde_suppressed_transitions', 'State changes that did not lead to a notification',
+                                 ['location', 'reason'])
+
+
+class Hysteresis:
+    """
+    Rules that decide when a changed state is accepted.
+    """
+
+    def __init__(self, confirmations: int = 1, min_dwell: float = 0):
+        """
+        :param confirmations: number of consecutive observations of a new state before it is accepted
+        :param min_dwell: time in seconds a new state has to be observed before it is accepted
+        """
+        self.confirmations = max(1, confirmations)
+        self.min_dwell = min_dwell
+
+    def __repr__(self):
+        return f'Hysteresis({self.confirmations}x, {self.min_dwell}s)'
+
 
 class Notifier:
     """
     Used to send notifications when the "open" status changes
     """
 
-    def __init__(self, bot: Bot, storage: Storage):
-        self._bot = bot
+    def __init__(self, sender: MessageSender, storage: Storage, message: str = MESSAGE_OPEN,
+                 hysteresis: Hysteresis = None, name: str = '', shared: bool = False):
+        """
+        :param sender: sender used for the notifications
+        :param storage: storage of the listeners and the last state
+        :param message: notification text with emoji aliases
+        :param hysteresis: damping of flapping states, every change is accepted immediately if None
+        :param name: name of the location in the metrics
+        :param shared: the storage is shared with other replicas, so the listeners are reloaded before a broadcast
+        """
+        self._sender = sender
         self._storage = storage
+        self._message = emojize(message, language='alias')
+        self._hysteresis = hysteresis or Hysteresis()
+        self._name = name
+        self._shared = shared
+        # the state can be pushed and polled at the same time, but every change must only be handled once
+        self._lock = threading.Lock()
+        # last state that was written to the storage, None until it was read once
+        self._persisted_state = None
+        # state that was observed but not accepted yet, with the time of its first observation and its observations
+        self._candidate = None
+        self._candidate_since = 0.0
+        self._candidate_count = 0
 
     def register(self, chat_id: int):
         """
         Registers a chat_id to be notified
         :param chat_id: chat id
         """
-        listeners = self._storage.get_notification_listeners()
-        listeners.add(f"{chat_id}")
-        self._storage.set_notification_listeners(listeners)
+        self._storage.add_notification_listener(chat_id)
+        self.update_listener_count()
 
-    def unregister_all(self):
-        self._storage.set_notification_listeners(set())
+    def warm_up(self):
+        """
+        Load the last state and the listeners, so that the first refresh and /notify do not wait for the storage.
+        """
+        self._last_state()
+        self.update_listener_count()
 
-    def on_state(self, state: int):
+    def update_listener_count(self):
+        """
+        Set the listener gauge of the location to the number of listeners in the storage.
+        """
+        try:
+            count = self._storage.count_notification_listeners()
+        except Exception as e:
+            LOGGER.warning('%s: could not count the listeners: %s', self._name, e)
+            return
+        metrics.LISTENERS.labels(self._name).set(count)
+
+    def reset(self):
+        """
+        Forget the last state and any unconfirmed change, e.g. because another replica handled the state until now.
+        """
+        with self._lock:
+            self._persisted_state = None
+            self._candidate = None
+
+    def on_state(self, state: int, now: float = None):
         """
         Listener for state changes
+
+        A changed state is accepted once it was observed often and long enough, see Hysteresis. Unknown states neither
+        count as an observation nor interrupt the confirmation of a new state.
         :param state: new state
+        :param now: monotonic time of the observation, now if None
         """
         if state == STATE_UNKNOWN:
             return
+        with self._lock:
+            if self._transition(state, time.monotonic() if now is None else now):
+                self._notify_all()
 
-        try:
-            old_state = self._storage.get_open()
-            if old_state == STATE_UNKNOWN:
-                # this will only happen once for a given storage
-                return
-            if old_state != state:
-                self._storage.set_open(state)
-                if state == STATE_OPEN:
-                    self._notify_all()
-        finally:
-            self._storage.set_open(state)
+    def _transition(self, state: int, now: float) -> bool:
+        """
+        Persist the state if it is accepted, must be called with the lock held.
+        :return: True if the listeners have to be notified
+        """
+        old_state = self._last_state()
+        if old_state == state:
+            if self._candidate is not None:
+                SUPPRESSED_TRANSITIONS.labels(self._name, 'unconfirmed').inc()
+                LOGGER.info('%s: state %s was not confirmed, staying at %s', self._name, self._candidate, state)
+                self._candidate = None
+            return False
+
+        if self._candidate != state:
+            self._candidate = state
+            self._candidate_since = now
+            self._candidate_count = 0
+        self._candidate_count += 1
+        if self._candidate_count < self._hysteresis.confirmations or \
+                now - self._candidate_since < self._hysteresis.min_dwell:
+            return False
+        self._candidate = None
+
+        self._storage.set_open(state)
+        self._persisted_state = state
+        # old_state is only unknown once for a given storage
+        return old_state != STATE_UNKNOWN and state == STATE_OPEN
+
+    def _last_state(self) -> int:
+        if self._persisted_state is None:
+            try:
+                self._persisted_state = self._storage.get_open()
+            except Exception as e:
+                LOGGER.error('Could not read the last state: %s', e)
+                return STATE_UNKNOWN
+        return self._persisted_state
 
     def _notify_all(self):
         """
         Notifies all currently registered chats
         """
-        for chat_id in self._storage.get_notification_listeners():
-            try:
-                self._bot.send_message(
-                    chat_id=chat_id,
-                    text=emojize(MESSAGE_OPEN, language='alias'),
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            except Exception as e:
-                LOGGER.error(e)
+        # buffered writes, e.g. the new state, must be persisted before anyone is told about them
+        self._storage.flush()
+        if self._shared:
+            self._storage.reload()
+        listeners = list(self._storage.iter_notification_listeners())
+        self._sender.broadcast(
+            listeners,
+            text=self._message,
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+        # chats that ran /notify during the broadcast are notified at the next opening
+        self._storage.remove_notification_listeners(listeners)
+        self.update_listener_count()
+
+
+class AsyncNotifier(Notifier):
+    """
+    Notifier whose state changes and fan-out run on an event loop, sending with an AsyncMessageSender.
+
+    on_state can still be called from other threads, e.g. for pushed updates, it waits until the loop handled the state.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, sender: AsyncMessageSender, storage: Storage,
+                 executor: Executor, **kwargs):
+        """
+        :param loop: event loop the notifier runs on
+        :param sender: sender used for the notifications
+        :param storage: storage of the listeners and the last state
+        :param executor: thread pool for the storage calls
+        :param kwargs: further arguments of Notifier
+        """
+        super().__init__(sender, storage, **kwargs)
+        self._loop = loop
+        self._executor = executor
+        self._async_storage = AsyncStorage(storage, executor)
+        self._async_lock = asyncio.Lock()
+
+    def on_state(self, state: int, now: float = None):
+        asyncio.run_coroutine_threadsafe(self.on_state_async(state, now), self._loop).result()
+
+    async def on_state_async(self, state: int, now: float = None):
+        """
+        Same as on_state, but for the event loop.
+        :param state: new state
+        :param now: monotonic time of the observation, now if None
+        """
+        if state == STATE_UNKNOWN:
+            return
+        now = time.monotonic() if now is None else now
+        async with self._async_lock:
+            if await self._loop.run_in_executor(self._executor, self._locked_transition, state, now):
+                await self._notify_all_async()
+
+    def _locked_transition(self, state: int, now: float) -> bool:
+        with self._lock:
+            return self._transition(state, now)
 
-        self.unregister_all()
+    async def _notify_all_async(self):
+        await self._async_storage.flush()
+        if self._shared:
+            await self._async_storage.reload()
+        listeners = await self._async_storage.iter_notification_listeners()
+        await self._sender.broadcast(
+            listeners,
+            text=self._message,
+            parse_mode=ParseMode.MARKDOWN
+        )
+        await self._async_storage.remove_notification_listeners(listeners)
+        await self._loop.run_in_executor(self._executor, self.update_listener_count)
@@ -0,0 +1,62 @@
+from typing import Dict, List
+
+from emoji import emojize
+from telegram import InlineQueryResult, InlineQueryResultArticle, InputTextMessageContent
+
+from frundenbot import MESSAGE_OPEN, STATE_CLOSED, STATE_OPEN, STATE_UNKNOWN
+
+MESSAGE_CLOSED = ':red_circle: Leider haben wir gerade zu.'
+MESSAGE_UNKNOWN = 'Sorry, ich weiß es nicht! :confused:'
+
+
+class StateResponse:
+    """
+    All replies that depend on one "open" state, rendered once.
+    """
+
+    def __init__(self, state: int, message: str, title: str = None):
+        """
+        :param state: state the replies belong to
+        :param message: status message with emoji aliases
+        :param title: name of the location that is put in front of the message
+        """
+        self.state = state
+        self.status = emojize(message, language='alias')
+        if title:
+            self.status = f'{title}: {self.status}'
+        self.open_reply = '{}\nÜbrigens kannst du mit /mate nachgucken, ob es noch Getränke gibt.'.format(self.status)
+        self.inline_results: List[InlineQueryResult] = [
+            InlineQueryResultArticle(
+                id=f'{state}',
+                title=f'Jemand da? ({title})' if title else 'Jemand da?',
+                input_message_content=InputTextMessageContent(self.status)
+            )
+        ]
+
+
+class ResponseRenderer:
+    """
+    Holds the prerendered replies for every state and switches between them when the state changes.
+    """
+
+    def __init__(self, cache_time: int, title: str = None):
+        """
+        :param cache_time: seconds Telegram may cache inline answers, should match the refresh interval
+        :param title: name of the location that is put in front of all messages
+        """
+        self.cache_time = cache_time
+        self._responses: Dict[int, StateResponse] = {
+            STATE_OPEN: StateResponse(STATE_OPEN, MESSAGE_OPEN, title),
+            STATE_CLOSED: StateResponse(STATE_CLOSED, MESSAGE_CLOSED, title),
+            STATE_UNKNOWN: StateResponse(STATE_UNKNOWN, MESSAGE_UNKNOWN, title),
+        }
+        self.current = self._responses[STATE_UNKNOWN]
+
+    def set_state(self, state: int) -> StateResponse:
+        """
+        Switch to the replies of the given state. Readers either see the old or the new replies, never a mix.
+        :param state: new state
+        :return: replies for the new state
+        """
+        self.current = self._responses.get(state, self._responses[STATE_UNKNOWN])
+        return self.current
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from prometheus_client import Gauge
+
+from frundenbot.locations import Location
+
+LOGGER = logging.getLogger(__name__)
+
+POLLS_IN_FLIGHT = Gauge('frunde_polls_in_flight', 'Status polls that are currently running')
+
+
+class PollingScheduler:
+    """
+    Polls the status of many locations concurrently, each one in its own interval.
+
+    tick() is meant to be called often, e.g. every second by the JobQueue. It only starts the polls that are due, so a
+    slow location never delays the others.
+    """
+
+    def __init__(self, poll: Callable[[Location], None], parallelism: int = 8):
+        """
+        :param poll: called with a location whenever it is due
+        :param parallelism: maximum number of polls running at the same time
+        """
+        self._poll = poll
+        self._executor = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='poller')
+        self._locations: List[Location] = []
+        self._due: Dict[str, float] = {}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        POLLS_IN_FLIGHT.set_function(lambda: len(self._in_flight))
+
+    def add(self, location: Location):
+        with self._lock:
+            self._locations.append(location)
+            self._due[location.name] = 0.0
+
+    def poll_now(self, name: str):
+        """
+        Poll a location on the next tick, regardless of its interval.
+        :param name: name of the location
+        """
+        with self._lock:
+            self._due[name] = 0.0
+
+    def postpone(self, name: str):
+        """
+        Restart the interval of a location, e.g. because its status was just pushed.
+        :param name: name of the location
+        """
+        with self._lock:
+            location = next(location for location in self._locations if location.name == name)
+            self._due[name] = time.monotonic() + location.next_poll_interval()
+
+    def tick(self, *args):
+        now = time.monotonic()
+        with self._lock:
+            due = [location for location in self._locations
+                   if location.name not in self._in_flight and self._due[location.name] <= now]
+            for location in due:
+                self._in_flight.add(location.name)
+        for location in due:
+            self._executor.submit(self._run, location)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def _run(self, location: Location):
+        try:
+            self._poll(location)
+        except Exception as e:
+            LOGGER.error('Polling %s failed: %s', location.name, e)
+        finally:
+            with self._lock:
+                self._due[location.name] = time.monotonic() + location.next_poll_interval()
+                self._in_flight.discard(location.name)
+
+
+class AsyncPollingScheduler:
+    """
+    Same as PollingScheduler, but every location is polled by its own task on the event loop instead of a thread.
+
+    poll_now() and postpone() can be called from any thread.
+    """
+
+    def __init__(self, poll: Callable[[Location], Awaitable[None]], parallelism: int = 8):
+        """
+        :param poll: coroutine function called with a location whenever it is due
+        :param parallelism: maximum number of polls running at the same time
+        """
+        self._poll = poll
+        self._parallelism = parallelism
+        self._locations: List[Location] = []
+        self._due: Dict[str, float] = {}
+        self._in_flight = set()
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        POLLS_IN_FLIGHT.set_function(lambda: len(self._in_flight))
+
+    def add(self, location: Location):
+        with self._lock:
+            self._locations.append(location)
+            self._due[location.name] = 0.0
+
+    def poll_now(self, name: str):
+        """
+        Poll a location right away, regardless of its interval.
+        :param name: name of the location
+        """
+        self._set_due(name, 0.0)
+
+    def postpone(self, name: str):
+        """
+        Restart the interval of a location, e.g. because its status was just pushed.
+        :param name: name of the location
+        """
+        location = next(location for location in self._locations if location.name == name)
+        self._set_due(name, time.monotonic() + location.next_poll_interval())
+
+    async def start(self):
+        """
+        Start polling, must be awaited on the event loop.
+        """
+        self._loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self._parallelism)
+        for location in self._locations:
+            self._wakeups[location.name] = asyncio.Event()
+            self._tasks.append(asyncio.create_task(self._run(location, slots), name=f'poll-{location.name}'))
+
+    async def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _set_due(self, name: str, due: float):
+        with self._lock:
+            self._due[name] = due
+        if self._loop is not None and name in self._wakeups:
+            self._loop.call_soon_threadsafe(self._wakeups[name].set)
+
+    async def _run(self, location: Location, slots: asyncio.Semaphore):
+        wakeup = self._wakeups[location.name]
+        while True:
+            delay = self._due[location.name] - time.monotonic()
+            if delay > 0:
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            async with slots:
+                self._in_flight.add(location.name)
+                try:
+                    await self._poll(location)
+                except Exception as e:
+                    LOGGER.error('Polling %s failed: %s', location.name, e)
+                finally:
+                    self._in_flight.discard(location.name)
+            with self._lock:
+                self._due[location.name] = time.monotonic() + location.next_poll_interval()
@@ -0,0 +1,343 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable
+
+from prometheus_client import Counter, Gauge, Summary
+from telegram import Bot
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut, Unauthorized
+
+LOGGER = logging.getLogger(__name__)
+
+# Telegram allows roughly 30 messages per second in total and one message per second to the same chat.
+GLOBAL_RATE = 30
+PER_CHAT_INTERVAL = 1.0
+
+OUTBOUND_MESSAGES = Counter('frunde_outbound_messages', 'Outbound messages by outcome', ['outcome'])
+OUTBOUND_RETRIES = Counter('frunde_outbound_retries', 'Retried outbound messages by reason', ['reason'])
+BATCH_TIME = Summary('frunde_outbound_batch_seconds', 'Time spent delivering a batch of outbound messages')
+BATCH_THROUGHPUT = Gauge('frunde_outbound_batch_throughput', 'Messages per second of the last delivered batch')
+
+
+class RateLimiter:
+    """
+    Thread safe token bucket that blocks until a token is available.
+    """
+
+    def __init__(self, rate: float, burst: int = None):
+        """
+        :param rate: tokens added per second
+        :param burst: maximum number of tokens that can be spent at once
+        """
+        self._rate = rate
+        self._capacity = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self._capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take one token, sleeping as long as necessary.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = max(self._blocked_until - now, (1 - self._tokens) / self._rate)
+            time.sleep(delay)
+
+    def try_acquire(self) -> bool:
+        """
+        Take one token if one is available, without waiting.
+        :return: True if the token was taken
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            if now >= self._blocked_until and self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def block(self, seconds: float):
+        """
+        Stop handing out tokens for the given time, e.g. after a flood control error.
+        :param seconds: pause in seconds
+        """
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+class ChatRateLimiter:
+    """
+    Thread safe token buckets per chat that never block. Only the most recently seen chats are remembered.
+    """
+
+    def __init__(self, rate: float, burst: int = None, max_chats: int = 10000):
+        """
+        :param rate: tokens added per second and chat
+        :param burst: maximum number of tokens a chat can spend at once
+        :param max_chats: number of chats whose buckets are kept, the least recently seen chat is forgotten first
+        """
+        self._rate = rate
+        self._capacity = burst if burst is not None else max(1, int(rate))
+        self._max_chats = max_chats
+        self._buckets: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, chat_id: Hashable) -> bool:
+        """
+        Take one token of the chat if one is available.
+        :param chat_id: chat that spends the token
+        :return: True if the token was taken
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(chat_id, (self._capacity, now))
+            tokens = min(self._capacity, tokens + (now - updated) * self._rate)
+            allowed = tokens >= 1
+            self._buckets[chat_id] = (tokens - 1 if allowed else tokens, now)
+            if len(self._buckets) > self._max_chats:
+                self._buckets.popitem(last=False)
+            return allowed
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class BatchResult:
+    """
+    Outcome of a batch delivered by the MessageSender
+    """
+
+    def __init__(self, sent: int, failed: int, duration: float):
+        self.sent = sent
+        self.failed = failed
+        self.duration = duration
+
+    @property
+    def throughput(self) -> float:
+        return self.sent / self.duration if self.duration > 0 else float(self.sent)
+
+    def __repr__(self):
+        return f'BatchResult(sent={self.sent}, failed={self.failed}, duration={self.duration:.3f}s)'
+
+
+class MessageSender:
+    """
+    Delivers outbound messages in parallel while keeping within Telegram's global and per-chat rate limits.
+    """
+
+    def __init__(self, bot: Bot, workers: int = 8, global_rate: float = GLOBAL_RATE,
+                 per_chat_interval: float = PER_CHAT_INTERVAL, max_retries: int = 3, backoff: float = 0.5):
+        """
+        :param bot: bot used to send the messages
+        :param workers: number of messages that are in flight at the same time
+        :param global_rate: maximum number of messages per second across all chats
+        :param per_chat_interval: minimum time in seconds between two messages to the same chat
+        :param max_retries: how often a message is retried after a transient error
+        :param backoff: base delay in seconds for the exponential backoff between retries
+        """
+        self._bot = bot
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sender')
+        self._limiter = RateLimiter(global_rate)
+        self._per_chat_interval = per_chat_interval
+        self._next_per_chat: Dict[int, float] = {}
+        self._chat_lock = threading.Lock()
+        self._max_retries = max_retries
+        self._backoff = backoff
+
+    @property
+    def bot(self) -> Bot:
+        return self._bot
+
+    def broadcast(self, chat_ids: Iterable, text: str, **kwargs) -> BatchResult:
+        """
+        Sends the same message to all given chats and blocks until every message was delivered or given up on.
+        :param chat_ids: receiving chats
+        :param text: message text
+        :param kwargs: further arguments for Bot.send_message
+        :return: summary of the delivery
+        """
+        start = time.monotonic()
+        futures = [self._executor.submit(self._deliver, chat_id, text, kwargs) for chat_id in chat_ids]
+        wait(futures)
+        sent = sum(1 for future in futures if future.result())
+        result = BatchResult(sent=sent, failed=len(futures) - sent, duration=time.monotonic() - start)
+
+        BATCH_TIME.observe(result.duration)
+        BATCH_THROUGHPUT.set(result.throughput)
+        LOGGER.info('Delivered batch: %s (%.1f messages/s)', result, result.throughput)
+        return result
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def _deliver(self, chat_id, text: str, kwargs: dict) -> bool:
+        for attempt in range(self._max_retries + 1):
+            self._wait_for_chat(chat_id)
+            self._limiter.acquire()
+            try:
+                self._bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                OUTBOUND_MESSAGES.labels('sent').inc()
+                return True
+            except RetryAfter as e:
+                # flood control applies to the whole bot, so everybody has to wait
+                OUTBOUND_RETRIES.labels('retry_after').inc()
+                LOGGER.warning('Flood control exceeded, pausing for %s seconds', e.retry_after)
+                self._limiter.block(e.retry_after)
+            except (BadRequest, Unauthorized) as e:
+                # the chat does not exist anymore or blocked the bot, retrying will not help
+                LOGGER.error('Could not send message to %s: %s', chat_id, e)
+                break
+            except (TimedOut, NetworkError) as e:
+                OUTBOUND_RETRIES.labels('network').inc()
+                LOGGER.warning('Sending message to %s failed (attempt %d): %s', chat_id, attempt + 1, e)
+                time.sleep(self._backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+            except Exception as e:
+                LOGGER.error('Could not send message to %s: %s', chat_id, e)
+                break
+        OUTBOUND_MESSAGES.labels('failed').inc()
+        return False
+
+    def _wait_for_chat(self, chat_id):
+        with self._chat_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_per_chat.get(chat_id, 0.0))
+            self._next_per_chat[chat_id] = slot + self._per_chat_interval
+            if len(self._next_per_chat) > 10000:
+                self._next_per_chat = {k: v for k, v in self._next_per_chat.items() if v > now}
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class AsyncRateLimiter:
+    """
+    Token bucket for coroutines on one event loop, waiting tasks sleep instead of blocking a thread.
+    """
+
+    def __init__(self, rate: float, burst: int = None):
+        """
+        :param rate: tokens added per second
+        :param burst: maximum number of tokens that can be spent at once
+        """
+        self._rate = rate
+        self._capacity = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self._capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+    async def acquire(self):
+        """
+        Take one token, sleeping as long as necessary.
+        """
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            if now >= self._blocked_until and self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep(max(self._blocked_until - now, (1 - self._tokens) / self._rate))
+
+    def block(self, seconds: float):
+        """
+        Stop handing out tokens for the given time, e.g. after a flood control error.
+        :param seconds: pause in seconds
+        """
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+class AsyncMessageSender:
+    """
+    Same as MessageSender, but every message is a task on the event loop, so thousands can be in flight at once.
+    """
+
+    def __init__(self, api, concurrency: int = 1000, global_rate: float = GLOBAL_RATE,
+                 per_chat_interval: float = PER_CHAT_INTERVAL, max_retries: int = 3, backoff: float = 0.5):
+        """
+        :param api: AsyncBotApi used to send the messages
+        :param concurrency: number of messages that are in flight at the same time
+        :param global_rate: maximum number of messages per second across all chats
+        :param per_chat_interval: minimum time in seconds between two messages to the same chat
+        :param max_retries: how often a message is retried after a transient error
+        :param backoff: base delay in seconds for the exponential backoff between retries
+        """
+        self._api = api
+        self._concurrency = concurrency
+        self._limiter = AsyncRateLimiter(global_rate)
+        self._per_chat_interval = per_chat_interval
+        self._next_per_chat: Dict[int, float] = {}
+        self._max_retries = max_retries
+        self._backoff = backoff
+
+    async def broadcast(self, chat_ids: Iterable, text: str, **kwargs) -> BatchResult:
+        """
+        Sends the same message to all given chats and returns once every message was delivered or given up on.
+        :param chat_ids: receiving chats
+        :param text: message text
+        :param kwargs: further arguments for the sendMessage method
+        :return: summary of the delivery
+        """
+        start = time.monotonic()
+        # a fixed number of workers share the iterator, so memory does not grow with the number of chats
+        remaining = iter(chat_ids)
+        outcomes = {True: 0, False: 0}
+
+        async def work():
+            for chat_id in remaining:
+                outcomes[await self._deliver(chat_id, text, kwargs)] += 1
+
+        await asyncio.gather(*(work() for _ in range(self._concurrency)))
+        result = BatchResult(sent=outcomes[True], failed=outcomes[False], duration=time.monotonic() - start)
+
+        BATCH_TIME.observe(result.duration)
+        BATCH_THROUGHPUT.set(result.throughput)
+        LOGGER.info('Delivered batch: %s (%.1f messages/s)', result, result.throughput)
+        return result
+
+    async def _deliver(self, chat_id, text: str, kwargs: dict) -> bool:
+        for attempt in range(self._max_retries + 1):
+            await self._wait_for_chat(chat_id)
+            await self._limiter.acquire()
+            try:
+                await self._api.send_message(chat_id=chat_id, text=text, **kwargs)
+                OUTBOUND_MESSAGES.labels('sent').inc()
+                return True
+            except RetryAfter as e:
+                OUTBOUND_RETRIES.labels('retry_after').inc()
+                LOGGER.warning('Flood control exceeded, pausing for %s seconds', e.retry_after)
+                self._limiter.block(e.retry_after)
+            except (BadRequest, Unauthorized) as e:
+                LOGGER.error('Could not send message to %s: %s', chat_id, e)
+                break
+            except (TimedOut, NetworkError) as e:
+                OUTBOUND_RETRIES.labels('network').inc()
+                LOGGER.warning('Sending message to %s failed (attempt %d): %s', chat_id, attempt + 1, e)
+                await asyncio.sleep(self._backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+            except Exception as e:
+                LOGGER.error('Could not send message to %s: %s', chat_id, e)
+                break
+        OUTBOUND_MESSAGES.labels('failed').inc()
+        return False
+
+    async def _wait_for_chat(self, chat_id):
+        now = time.monotonic()
+        slot = max(now, self._next_per_chat.get(chat_id, 0.0))
+        self._next_per_chat[chat_id] = slot + self._per_chat_interval
+        if len(self._next_per_chat) > 10000:
+            self._next_per_chat = {k: v for k, v in self._next_per_chat.items() if v > now}
+        if slot > now:
+            await asyncio.sleep(slot - now)
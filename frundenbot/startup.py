@@ -0,0 +1,55 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+LOGGER = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """
+    Measures how long the phases of the startup take.
+
+    Phases may run in parallel, so their durations do not necessarily add up to the total.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._gauge = None
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Time the block as the given phase.
+        :param name: name of the phase
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def report(self):
+        """
+        Log the breakdown and export it to Prometheus.
+        """
+        # imported here, so that the timer itself can be used before the heavy imports
+        from prometheus_client import Gauge
+
+        total = time.perf_counter() - self.started
+        with self._lock:
+            if self._gauge is None:
+                self._gauge = Gauge('frunde_startup_phase_seconds', 'Duration of the startup phases', ['phase'])
+            phases = dict(self.phases)
+        for name, seconds in phases.items():
+            self._gauge.labels(name).set(seconds)
+        self._gauge.labels('total').set(total)
+        LOGGER.info('Started in %.3fs (%s)', total,
+                    ', '.join(f'{name} {seconds:.3f}s' for name, seconds in phases.items()))
+
+
+STARTUP = StartupTimer()
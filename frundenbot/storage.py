@@ -1,10 +1,20 @@
+import asyncio
+import copy
+import fcntl
+import functools
+import json
 import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Executor
 from pathlib import Path
-from typing import Set
-
-from botocore.exceptions import ClientError
+from typing import Dict, Iterable, Optional, Set, Tuple
 
 from frundenbot import STATE_UNKNOWN
+from frundenbot.listeners import RECORD_SIZE, JournalBackend, ListenerJournal
 
 LOGGER = logging.getLogger(__name__)
 
@@ -58,8 +68,201 @@ class Storage:
         """
         raise NotImplementedError()
 
+    def add_notification_listener(self, chat_id: int):
+        """
+        Add a single chat_id to the list of notification listeners
+        :param chat_id: chat id
+        """
+        listeners = self.get_notification_listeners()
+        listeners.add(f'{chat_id}')
+        self.set_notification_listeners(listeners)
+
+    def has_notification_listener(self, chat_id: int) -> bool:
+        """
+        Check if a chat_id registered for a notification
+        :param chat_id: chat id
+        """
+        return f'{chat_id}' in self.get_notification_listeners()
+
+    def iter_notification_listeners(self) -> Iterable[int]:
+        """
+        Iterate over all chat_ids that registered for a notification
+        """
+        return (int(chat_id) for chat_id in self.get_notification_listeners())
+
+    def clear_notification_listeners(self):
+        """
+        Remove all notification listeners
+        """
+        self.set_notification_listeners(set())
+
+    def remove_notification_listeners(self, chat_ids: Iterable[int]):
+        """
+        Remove the given chat_ids, e.g. after they were notified, chats that registered in the meantime are kept
+        :param chat_ids: chat ids to remove
+        """
+        removed = {int(chat_id) for chat_id in chat_ids}
+        self.set_notification_listeners({f'{chat_id}' for chat_id in self.iter_notification_listeners()
+                                         if chat_id not in removed})
+
+    def count_notification_listeners(self) -> int:
+        """
+        Get the number of chat_ids that registered for a notification
+        """
+        return len(self.get_notification_listeners())
+
+    def scoped(self, name: str) -> 'Storage':
+        """
+        Get a storage for the data of one location, which is separate from the data of all other locations.
+
+        :param name: name of the location
+        """
+        raise NotImplementedError()
+
+    def reload(self):
+        """
+        Forget data that is cached in memory, so that the next read sees the writes of other processes.
+        """
+        pass
+
+    def flush(self):
+        """
+        Write changes that are buffered in memory to the backend.
+        """
+        pass
+
+    def set_compaction(self, enabled: bool):
+        """
+        Allow or forbid rewriting data on reads, e.g. to compact the listener journal.
+
+        With several replicas only the leader compacts, so a standby never writes back data that the leader changed.
+        :param enabled: True if this process may compact
+        """
+        pass
+
+    def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        """
+        Acquire or renew a lease that can only be held by one holder at a time, e.g. across several replicas.
+
+        :param name: name of the lease
+        :param holder: unique id of the holder
+        :param ttl: time in seconds after which the lease expires if it is not renewed
+        :return: True if the holder owns the lease now
+        """
+        raise NotImplementedError()
+
+    def release_lease(self, name: str, holder: str):
+        """
+        Give up a lease, so that another holder can acquire it right away.
+
+        :param name: name of the lease
+        :param holder: unique id of the holder
+        """
+        raise NotImplementedError()
+
 
-class S3Storage(Storage):
+class BlobStorage(Storage):
+    """
+    Base class for storage backends that persist named blobs.
+
+    The open state and the mate message are kept in one versioned JSON document which is loaded with a single read and
+    cached in memory for reads. Writes read the current document first, so they do not overwrite the values another
+    replica wrote in the meantime. The listeners are kept in a ListenerJournal, so a cold start reads the document, the
+    listener snapshot and the journal listing.
+    """
+
+    DOCUMENT = 'state.json'
+
+    def __init__(self, journal: JournalBackend):
+        self._listeners = ListenerJournal(journal, legacy=self._legacy_listeners)
+        self._document: Optional[dict] = None
+        self._document_lock = threading.RLock()
+
+    def set_mate(self, text):
+        self._update_document(mate=text)
+
+    def get_mate(self) -> str or None:
+        return self._load_document().get('mate')
+
+    def set_open(self, state: int):
+        self._update_document(open=state)
+
+    def get_open(self) -> int:
+        return self._load_document().get('open', STATE_UNKNOWN)
+
+    def set_notification_listeners(self, listeners: Set[str]):
+        self._listeners.replace(listeners)
+
+    def get_notification_listeners(self) -> Set[str]:
+        return {f'{chat_id}' for chat_id in self._listeners}
+
+    def add_notification_listener(self, chat_id: int):
+        self._listeners.add(chat_id)
+
+    def has_notification_listener(self, chat_id: int) -> bool:
+        return chat_id in self._listeners
+
+    def iter_notification_listeners(self) -> Iterable[int]:
+        return iter(self._listeners)
+
+    def clear_notification_listeners(self):
+        self._listeners.clear()
+
+    def remove_notification_listeners(self, chat_ids: Iterable[int]):
+        self._listeners.remove(chat_ids)
+
+    def set_compaction(self, enabled: bool):
+        self._listeners.compaction = enabled
+
+    def count_notification_listeners(self) -> int:
+        return len(self._listeners)
+
+    def reload(self):
+        with self._document_lock:
+            self._document = None
+        self._listeners.reload()
+
+    def _load_document(self) -> dict:
+        with self._document_lock:
+            if self._document is None:
+                value = self._read(self.DOCUMENT)
+                self._document = json.loads(value) if value else self._legacy_document()
+            return self._document
+
+    def _update_document(self, **values):
+        with self._document_lock:
+            self._document = None
+            document = dict(self._load_document())
+            # written by older versions, the listeners are only kept in the journal
+            document.pop('listeners', None)
+            if all(document.get(key) == value for key, value in values.items()):
+                return
+            document.update(values)
+            document['version'] = document.get('version', 0) + 1
+            self._write(self.DOCUMENT, json.dumps(document))
+            self._document = document
+
+    def _legacy_document(self) -> dict:
+        # data written by older versions is only read once, the next write stores it in the document
+        open_state = self._read('open.txt')
+        return {
+            'version': 0,
+            'open': int(open_state) if open_state else STATE_UNKNOWN,
+            'mate': self._read('mate/status.txt'),
+        }
+
+    def _legacy_listeners(self) -> Iterable[str]:
+        value = self._read('listeners.txt')
+        return value.splitlines() if value else ()
+
+    def _read(self, path: str) -> str or None:
+        raise NotImplementedError()
+
+    def _write(self, path: str, value: str):
+        raise NotImplementedError()
+
+
+class S3Storage(BlobStorage):
     """
     Storage implementation that uses AWS S3 as a storage backend.
     """
@@ -77,35 +280,27 @@ class S3Storage(Storage):
         self.s3_client = boto3.resource('s3', region_name=region_name, aws_access_key_id=key,
                                         aws_secret_access_key=secret)
         self.bucket = bucket
+        self.prefix = ''
+        super().__init__(_S3Journal(self))
 
-    def set_mate(self, text):
-        self._write('mate/status.txt', text)
-
-    def get_mate(self) -> str or None:
-        value = self._read('mate/status.txt')
-        return value
-
-    def set_open(self, state: int):
-        self._write('open.txt', f'{state}')
-
-    def get_open(self) -> int:
-        value = self._read('open.txt')
-        return int(value) if value else STATE_UNKNOWN
+    def scoped(self, name: str) -> 'S3Storage':
+        storage = copy.copy(self)
+        storage.prefix = f'{self.prefix}locations/{name}/'
+        BlobStorage.__init__(storage, _S3Journal(storage))
+        return storage
 
-    def set_notification_listeners(self, listeners: Set[str]):
-        self._write('listeners.txt', '\n'.join(listeners))
-
-    def get_notification_listeners(self) -> Set[str]:
-        value = self._read('listeners.txt')
-        if value:
-            return set(value.splitlines())
-        else:
-            return set()
+    def _key(self, path: str) -> str:
+        return f'{self.prefix}{path}'
 
     def _read(self, path: str) -> str or None:
-        obj = self.s3_client.Object(self.bucket, path)
+        value = self._read_bytes(path)
+        return value.decode('utf-8') if value is not None else None
+
+    def _read_bytes(self, path: str) -> Optional[bytes]:
+        from botocore.exceptions import ClientError
+        obj = self.s3_client.Object(self.bucket, self._key(path))
         try:
-            return obj.get()['Body'].read().decode('utf-8')
+            return obj.get()['Body'].read()
         except ClientError as ex:
             if ex.response['Error']['Code'] == 'NoSuchKey':
                 return None
@@ -113,11 +308,44 @@ class S3Storage(Storage):
                 raise ex
 
     def _write(self, path: str, value: str):
-        obj = self.s3_client.Object(self.bucket, path)
+        obj = self.s3_client.Object(self.bucket, self._key(path))
         obj.put(Body=value)
 
+    def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        # the lease object is only replaced if it did not change since it was read, so only one holder can win
+        from botocore.exceptions import ClientError
+        obj = self.s3_client.Object(self.bucket, self._key(f'leases/{name}.json'))
+        try:
+            response = obj.get()
+            lease, condition = json.loads(response['Body'].read()), {'IfMatch': response['ETag']}
+        except ClientError as ex:
+            if ex.response['Error']['Code'] != 'NoSuchKey':
+                raise ex
+            lease, condition = None, {'IfNoneMatch': '*'}
+
+        now = time.time()
+        if lease and lease['holder'] != holder and lease['expires'] > now:
+            return False
+        try:
+            obj.put(Body=json.dumps({'holder': holder, 'expires': now + ttl}), **condition)
+        except ClientError as ex:
+            if ex.response['Error']['Code'] in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                return False
+            raise ex
+        return True
+
+    def release_lease(self, name: str, holder: str):
+        from botocore.exceptions import ClientError
+        obj = self.s3_client.Object(self.bucket, self._key(f'leases/{name}.json'))
+        try:
+            response = obj.get()
+            if json.loads(response['Body'].read())['holder'] == holder:
+                obj.put(Body=json.dumps({'holder': holder, 'expires': 0}), IfMatch=response['ETag'])
+        except ClientError as ex:
+            LOGGER.warning('Could not release lease %s: %s', name, ex)
+
 
-class FileStorage(Storage):
+class FileStorage(BlobStorage):
     """
     Storage implementation that uses a local directory as a storage backend.
     """
@@ -129,40 +357,338 @@ class FileStorage(Storage):
         :param path: Path to the directory that should be used.
         """
         self.root_path = path
+        # open lock files of the held leases, the locks are released by the OS if the process dies
+        self._leases: Dict[str, Tuple[str, object]] = {}
+        self._leases_lock = threading.Lock()
+        super().__init__(_FileJournal(self._path('listeners')))
+
+    def scoped(self, name: str) -> 'FileStorage':
+        return FileStorage(path=f'{self.root_path}/locations/{name}')
+
+    def _path(self, path: str) -> Path:
+        return Path(f'{self.root_path}/{path}').expanduser().absolute()
+
+    def _read(self, path: str) -> str or None:
+        path = self._path(path)
+        if path.exists() and path.is_file():
+            with open(path, 'r') as file:
+                return file.read()
+        else:
+            return None
+
+    def _write(self, path: str, value: str):
+        path = self._path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'.{path.name}.tmp')
+        with open(tmp, 'w+') as file:
+            file.write(value)
+        os.replace(tmp, path)
+
+    def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        # the ttl is not needed, a lock held by a process that died is released immediately
+        with self._leases_lock:
+            if name in self._leases:
+                return self._leases[name][0] == holder
+            path = self._path(f'leases/{name}.lock')
+            path.parent.mkdir(parents=True, exist_ok=True)
+            file = open(path, 'a+')
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                file.close()
+                return False
+            file.truncate(0)
+            file.write(holder)
+            file.flush()
+            self._leases[name] = (holder, file)
+            return True
+
+    def release_lease(self, name: str, holder: str):
+        with self._leases_lock:
+            if name in self._leases and self._leases[name][0] == holder:
+                _, file = self._leases.pop(name)
+                fcntl.flock(file, fcntl.LOCK_UN)
+                file.close()
+
+
+class SQLiteStorage(Storage):
+    """
+    Storage implementation that uses a local SQLite database in WAL mode as a storage backend.
+    """
+
+    def __init__(self, path: str, location: str = ''):
+        """
+        Create a new SQLite storage backend.
+
+        :param path: Path to the database file, created if it does not exist.
+        :param location: Location whose data is accessed, the empty string is the default location.
+        """
+        self.path = str(Path(path).expanduser().absolute())
+        self.location = location
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        # every thread gets its own connection, WAL mode allows readers to run while another thread writes
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT)')
+            connection.execute('CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT, expires REAL)')
+            columns = [row[1] for row in connection.execute('PRAGMA table_info(listeners)')]
+            if columns and 'location' not in columns:
+                connection.execute('ALTER TABLE listeners RENAME TO listeners_old')
+            connection.execute('CREATE TABLE IF NOT EXISTS listeners (location TEXT NOT NULL, chat_id INTEGER NOT NULL, '
+                               'PRIMARY KEY (location, chat_id)) WITHOUT ROWID')
+            if columns and 'location' not in columns:
+                connection.execute("INSERT INTO listeners SELECT '', chat_id FROM listeners_old")
+                connection.execute('DROP TABLE listeners_old')
+
+    def scoped(self, name: str) -> 'SQLiteStorage':
+        return SQLiteStorage(path=self.path, location=name)
 
     def set_mate(self, text):
-        self._write('mate/status.txt', text)
+        self._set('mate', text)
 
     def get_mate(self) -> str or None:
-        return self._read('mate/status.txt')
+        return self._get('mate')
 
     def set_open(self, state: int):
-        self._write('open.txt', f'{state}')
+        self._set('open', f'{state}')
 
     def get_open(self) -> int:
-        value = self._read('open.txt')
+        value = self._get('open')
         return int(value) if value else STATE_UNKNOWN
 
     def set_notification_listeners(self, listeners: Set[str]):
-        self._write('listeners.txt', '\n'.join(listeners))
+        with self._connection() as connection:
+            connection.execute('DELETE FROM listeners WHERE location = ?', (self.location,))
+            connection.executemany('INSERT OR IGNORE INTO listeners (location, chat_id) VALUES (?, ?)',
+                                   ((self.location, int(chat_id)) for chat_id in listeners))
 
     def get_notification_listeners(self) -> Set[str]:
-        value = self._read('listeners.txt')
-        if value:
-            return set(value.splitlines())
-        else:
-            return set()
+        return {f'{chat_id}' for chat_id in self.iter_notification_listeners()}
+
+    def add_notification_listener(self, chat_id: int):
+        with self._connection() as connection:
+            connection.execute('INSERT OR IGNORE INTO listeners (location, chat_id) VALUES (?, ?)',
+                               (self.location, int(chat_id)))
+
+    def has_notification_listener(self, chat_id: int) -> bool:
+        row = self._connection().execute('SELECT 1 FROM listeners WHERE location = ? AND chat_id = ?',
+                                         (self.location, int(chat_id))).fetchone()
+        return row is not None
+
+    def iter_notification_listeners(self) -> Iterable[int]:
+        rows = self._connection().execute('SELECT chat_id FROM listeners WHERE location = ? ORDER BY chat_id',
+                                          (self.location,)).fetchall()
+        return [chat_id for chat_id, in rows]
+
+    def clear_notification_listeners(self):
+        with self._connection() as connection:
+            connection.execute('DELETE FROM listeners WHERE location = ?', (self.location,))
+
+    def remove_notification_listeners(self, chat_ids: Iterable[int]):
+        with self._connection() as connection:
+            connection.executemany('DELETE FROM listeners WHERE location = ? AND chat_id = ?',
+                                   ((self.location, int(chat_id)) for chat_id in chat_ids))
+
+    def count_notification_listeners(self) -> int:
+        return self._connection().execute('SELECT COUNT(*) FROM listeners WHERE location = ?',
+                                          (self.location,)).fetchone()[0]
+
+    def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        now = time.time()
+        with self._connection() as connection:
+            cursor = connection.execute(
+                'INSERT INTO leases (name, holder, expires) VALUES (?, ?, ?) ON CONFLICT (name) DO UPDATE '
+                'SET holder = excluded.holder, expires = excluded.expires '
+                'WHERE leases.holder = excluded.holder OR leases.expires < ?',
+                (self._key(name), holder, now + ttl, now))
+            return cursor.rowcount == 1
+
+    def release_lease(self, name: str, holder: str):
+        with self._connection() as connection:
+            connection.execute('DELETE FROM leases WHERE name = ? AND holder = ?', (self._key(name), holder))
+
+    def is_empty(self) -> bool:
+        """
+        Check if nothing was stored yet, e.g. to decide if data should be migrated.
+        """
+        connection = self._connection()
+        return (connection.execute('SELECT 1 FROM kv LIMIT 1').fetchone() is None
+                and connection.execute('SELECT 1 FROM listeners LIMIT 1').fetchone() is None)
 
-    def _read(self, path: str) -> str or None:
-        path = Path(f'{self.root_path}/{path}').expanduser().absolute()
-        if path.exists() and path.is_file():
-            with open(path, 'r') as file:
-                return file.read()
-        else:
-            return None
+    def _get(self, key: str) -> Optional[str]:
+        row = self._connection().execute('SELECT value FROM kv WHERE key = ?', (self._key(key),)).fetchone()
+        return row[0] if row else None
 
-    def _write(self, path: str, value: str):
-        path = Path(f'{self.root_path}/{path}').expanduser().absolute()
-        path.parent.mkdir(parents=True, exist_ok=True)
-        with open(path, 'w+') as file:
-            file.write(value)
+    def _set(self, key: str, value: str):
+        with self._connection() as connection:
+            connection.execute('INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)', (self._key(key), value))
+
+    def _key(self, key: str) -> str:
+        return f'{self.location}/{key}' if self.location else key
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+
+class AsyncStorage:
+    """
+    Coroutine version of a Storage. The calls run in a thread pool, so the event loop never waits for blocking I/O.
+
+    Every public method of Storage is available as a coroutine with the same arguments.
+    """
+
+    def __init__(self, storage: Storage, executor: Executor):
+        """
+        :param storage: storage that is wrapped
+        :param executor: thread pool the calls run in
+        """
+        self.storage = storage
+        self._executor = executor
+
+    async def _run(self, operation: str, *args, **kwargs):
+        call = functools.partial(getattr(self.storage, operation), *args, **kwargs)
+        if operation == 'iter_notification_listeners':
+            # a lazy iterator would do its I/O on the event loop
+            call = functools.partial(lambda method: list(method()), call)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+
+def _async_operation(operation: str):
+    async def method(self, *args, **kwargs):
+        return await self._run(operation, *args, **kwargs)
+
+    method.__name__ = operation
+    method.__doc__ = getattr(Storage, operation).__doc__
+    return method
+
+
+for _operation in [name for name in vars(Storage) if not name.startswith('_') and callable(getattr(Storage, name))
+                   and name != 'scoped']:
+    setattr(AsyncStorage, _operation, _async_operation(_operation))
+
+
+def migrate(source: Storage, target: Storage):
+    """
+    Copy all data from one storage backend to another.
+
+    :param source: storage to read from
+    :param target: storage to write to
+    """
+    mate = source.get_mate()
+    if mate is not None:
+        target.set_mate(mate)
+    target.set_open(source.get_open())
+    listeners = source.get_notification_listeners()
+    target.set_notification_listeners(listeners)
+    LOGGER.info('Migrated %d notification listeners from %s to %s', len(listeners), type(source).__name__,
+                type(target).__name__)
+
+
+class _S3Journal(JournalBackend):
+    """
+    Listener journal on S3. Every journal record is a separate object, so appending never rewrites existing data.
+    """
+
+    SNAPSHOT = 'listeners/snapshot.bin'
+    JOURNAL_PREFIX = 'listeners/journal/'
+
+    def __init__(self, storage: S3Storage):
+        self._storage = storage
+
+    def read_snapshot(self) -> Optional[bytes]:
+        return self._storage._read_bytes(self.SNAPSHOT)
+
+    def write_snapshot(self, data: bytes):
+        self._storage.s3_client.Object(self._storage.bucket, self._storage._key(self.SNAPSHOT)).put(Body=data)
+
+    def append_journal(self, data: bytes, marker=None) -> object:
+        name = f'{self.JOURNAL_PREFIX}{time.time_ns():020d}-{uuid.uuid4().hex}'
+        self._storage.s3_client.Object(self._storage.bucket, self._storage._key(name)).put(Body=data)
+        # the marker is the list of known record objects, so records of other processes are never skipped
+        return (marker or []) + [name]
+
+    def read_journal(self, after=None) -> Tuple[bytes, object]:
+        keys = self.journal_marker()
+        known = set(after or ())
+        return b''.join(self._storage._read_bytes(key) or b'' for key in keys if key not in known), keys
+
+    def journal_marker(self) -> object:
+        bucket = self._storage.s3_client.Bucket(self._storage.bucket)
+        prefix = self._storage._key(self.JOURNAL_PREFIX)
+        return sorted(obj.key[len(self._storage.prefix):] for obj in bucket.objects.filter(Prefix=prefix))
+
+    def truncate_journal(self, marker):
+        bucket = self._storage.s3_client.Bucket(self._storage.bucket)
+        for i in range(0, len(marker), 1000):
+            bucket.delete_objects(Delete={'Objects': [{'Key': self._storage._key(key)} for key in marker[i:i + 1000]]})
+
+
+class _FileJournal(JournalBackend):
+    """
+    Listener journal in a local directory, using one append-only file and an atomically replaced snapshot.
+    """
+
+    def __init__(self, path: Path):
+        self._snapshot = path / 'snapshot.bin'
+        self._journal = path / 'journal.bin'
+
+    def read_snapshot(self) -> Optional[bytes]:
+        if self._snapshot.is_file():
+            return self._snapshot.read_bytes()
+        return None
+
+    def write_snapshot(self, data: bytes):
+        self._snapshot.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._snapshot.with_suffix('.tmp')
+        with open(tmp, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, self._snapshot)
+
+    def append_journal(self, data: bytes, marker=None) -> object:
+        self._journal.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._journal, 'ab') as file:
+            offset = file.tell()
+            if offset % RECORD_SIZE:
+                # a torn record of a crashed process, the next record has to start at a record boundary
+                offset -= offset % RECORD_SIZE
+                file.truncate(offset)
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        # the marker is an offset, it cannot skip records that another process appended before these
+        return offset + len(data) if offset == (marker or 0) else marker
+
+    def read_journal(self, after=None) -> Tuple[bytes, object]:
+        if not self._journal.is_file():
+            return b'', 0
+        with open(self._journal, 'rb') as file:
+            file.seek(after or 0)
+            data = file.read()
+        # a torn record at the end is not covered, so it is dropped by the next append
+        data = data[:len(data) - len(data) % RECORD_SIZE]
+        return data, (after or 0) + len(data)
+
+    def journal_marker(self) -> object:
+        if not self._journal.is_file():
+            return 0
+        size = self._journal.stat().st_size
+        return size - size % RECORD_SIZE
+
+    def truncate_journal(self, marker):
+        if not self._journal.is_file():
+            return
+        with open(self._journal, 'r+b') as file:
+            file.seek(marker)
+            rest = file.read()
+            rest = rest[:len(rest) - len(rest) % RECORD_SIZE]
+            file.seek(0)
+            file.write(rest)
+            file.truncate()
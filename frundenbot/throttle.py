@@ -0,0 +1,95 @@
+import logging
+import threading
+from typing import Callable, Dict
+
+from prometheus_client import Counter, Gauge
+from telegram.ext import CallbackContext, JobQueue
+
+from frundenbot.sender import ChatRateLimiter, RateLimiter
+
+LOGGER = logging.getLogger(__name__)
+
+THROTTLED_MESSAGES = Counter('frunde_throttled_messages', 'Incoming messages over a rate limit',
+                             ['limit', 'action'])
+DELAYED_REPLIES = Gauge('frunde_delayed_replies', 'Chats waiting for a delayed reply')
+
+
+class ReplyThrottle:
+    """
+    Limits how often the bot answers incoming messages, per chat and in total.
+
+    A message over a limit is not answered right away. Instead the chat gets a single delayed reply, no matter how many
+    more messages it sends until then. If too many chats are waiting already, the message is dropped quietly. A delayed
+    reply still needs a token of the global limit when it is due, otherwise it is dropped as well.
+    """
+
+    def __init__(self, chat_rate: float = 0.2, chat_burst: int = 3, global_rate: float = 20, global_burst: int = 40,
+                 max_chats: int = 10000, max_delayed: int = 1000):
+        """
+        :param chat_rate: replies per second and chat
+        :param chat_burst: replies a chat can get at once
+        :param global_rate: replies per second to all chats
+        :param global_burst: replies that can be sent at once to all chats
+        :param max_chats: number of chats whose limits are kept, the least recently seen chat is forgotten first
+        :param max_delayed: maximum number of chats waiting for a delayed reply
+        :raises ValueError: if a rate is not positive or a burst is smaller than one reply
+        """
+        if chat_rate <= 0 or global_rate <= 0:
+            raise ValueError(f'Reply rates have to be positive, got {chat_rate} per chat and {global_rate} in total')
+        if chat_burst < 1 or global_burst < 1:
+            raise ValueError(f'Reply bursts have to be at least 1, got {chat_burst} per chat and {global_burst} in '
+                             f'total')
+        self._chats = ChatRateLimiter(chat_rate, burst=chat_burst, max_chats=max_chats)
+        self._global = RateLimiter(global_rate, burst=global_burst)
+        self._delay = 1 / chat_rate
+        self._max_delayed = max_delayed
+        self._delayed: Dict[int, Callable[[], None]] = {}
+        self._lock = threading.Lock()
+        DELAYED_REPLIES.set_function(lambda: len(self._delayed))
+
+    def submit(self, chat_id: int, reply: Callable[[], None], job_queue: JobQueue) -> bool:
+        """
+        Send a reply now if the limits allow it, otherwise delay or drop it.
+
+        :param chat_id: chat the reply goes to
+        :param reply: sends the reply
+        :param job_queue: queue that runs the delayed reply
+        :return: True if the reply was sent right away
+        """
+        if not self._chats.try_acquire(chat_id):
+            limit = 'chat'
+        elif not self._global.try_acquire():
+            limit = 'global'
+        else:
+            reply()
+            return True
+
+        with self._lock:
+            if chat_id in self._delayed:
+                # the delayed reply is rendered when it is sent, so it is just as current as this one would be
+                self._delayed[chat_id] = reply
+                action = 'coalesced'
+            elif len(self._delayed) < self._max_delayed:
+                self._delayed[chat_id] = reply
+                action = 'delayed'
+            else:
+                action = 'dropped'
+        if action == 'delayed':
+            job_queue.run_once(self._send_delayed, self._delay, context=chat_id, name=f'delayed-reply-{chat_id}')
+        THROTTLED_MESSAGES.labels(limit, action).inc()
+        return False
+
+    def _send_delayed(self, context: CallbackContext):
+        with self._lock:
+            reply = self._delayed.pop(context.job.context, None)
+        if reply is None:
+            return
+        if not self._global.try_acquire():
+            # delayed replies count towards the global limit as well, otherwise they could all go out at once
+            THROTTLED_MESSAGES.labels('global', 'dropped').inc()
+            LOGGER.debug('Dropping delayed reply to %s, over the global limit', context.job.context)
+            return
+        try:
+            reply()
+        except Exception as e:
+            LOGGER.error('Could not send delayed reply to %s: %s', context.job.context, e)
@@ -0,0 +1,136 @@
+import hmac
+import json
+import logging
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+from prometheus_client import Counter, Gauge, Histogram
+from telegram import Update
+from telegram.ext import Dispatcher
+
+LOGGER = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+# far above any update Telegram sends, larger bodies are rejected without reading them
+MAX_BODY = 1024 * 1024
+
+WEBHOOK_REQUESTS = Counter('frunde_webhook_requests', 'Webhook requests by response status', ['status'])
+WEBHOOK_QUEUE_DEPTH = Gauge('frunde_webhook_queue_depth', 'Updates waiting for a dispatcher worker')
+WEBHOOK_LAG = Histogram('frunde_webhook_lag_seconds', 'Time between receiving an update and processing it')
+WEBHOOK_PROCESS_TIME = Histogram('frunde_webhook_process_seconds', 'Time spent processing an update')
+
+
+class WebhookServer:
+    """
+    Receives Telegram updates over HTTP and hands them to a pool of dispatcher workers.
+
+    Requests are acknowledged as soon as the update is queued. If the queue is full the request is rejected with 503,
+    so Telegram delivers the update again later.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, listen: str = '0.0.0.0', port: int = 8443, path: str = '/',
+                 secret_token: str = None, workers: int = 4, queue_size: int = 1000):
+        """
+        :param dispatcher: dispatcher that processes the updates
+        :param listen: address to bind to
+        :param port: port to bind to
+        :param path: URL path that accepts updates
+        :param secret_token: expected value of the secret token header, no validation if None
+        :param workers: number of threads processing updates
+        :param queue_size: maximum number of queued updates
+        """
+        self._dispatcher = dispatcher
+        self._path = path
+        self._secret_token = secret_token
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._workers: List[threading.Thread] = [
+            threading.Thread(target=self._work, name=f'webhook-worker-{i}', daemon=True) for i in range(workers)
+        ]
+        self._server = ThreadingHTTPServer((listen, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._server_thread = threading.Thread(target=self._server.serve_forever, name='webhook-server', daemon=True)
+        WEBHOOK_QUEUE_DEPTH.set_function(self._queue.qsize)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+        self._server_thread.start()
+        LOGGER.info('Listening for webhook updates on %s:%d%s', *self._server.server_address[:2], self._path)
+
+    def stop(self):
+        """
+        Stop accepting updates and wait until all queued updates are processed.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def _authorize(self, path: str, secret_token: str, length: int) -> int:
+        """
+        Check a request before its body is read.
+        :return: HTTP status, 200 if the body can be read
+        """
+        if path != self._path:
+            return 404
+        if self._secret_token and not hmac.compare_digest(secret_token or '', self._secret_token):
+            return 403
+        if length > MAX_BODY:
+            return 413
+        return 200
+
+    def _accept(self, body: bytes) -> int:
+        try:
+            self._queue.put_nowait((time.monotonic(), body))
+        except queue.Full:
+            LOGGER.warning('Webhook queue is full, rejecting update')
+            return 503
+        return 200
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            received, body = item
+            WEBHOOK_LAG.observe(time.monotonic() - received)
+            try:
+                with WEBHOOK_PROCESS_TIME.time():
+                    update = Update.de_json(json.loads(body), self._dispatcher.bot)
+                    self._dispatcher.process_update(update)
+            except Exception as e:
+                LOGGER.error('Could not process webhook update: %s', e)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                except ValueError:
+                    length = -1
+                status = server._authorize(self.path, self.headers.get(SECRET_HEADER), length) if length >= 0 else 400
+                if status == 200:
+                    status = server._accept(self.rfile.read(length))
+                else:
+                    # the unread body must not be taken for the next request
+                    self.close_connection = True
+                WEBHOOK_REQUESTS.labels(status).inc()
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                LOGGER.debug(format, *args)
+
+        return Handler
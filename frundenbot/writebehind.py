@@ -0,0 +1,356 @@
+import copy
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from prometheus_client import Counter, Gauge
+
+from frundenbot.storage import Storage
+
+LOGGER = logging.getLogger(__name__)
+
+BUFFERED_WRITES = Counter('frunde_write_behind_writes', 'Writes acknowledged before they reached the storage', ['op'])
+WRITE_BEHIND_FLUSHES = Counter('frunde_write_behind_flushes', 'Flushes of the buffered writes', ['outcome'])
+PENDING_WRITES = Gauge('frunde_write_behind_pending', 'Buffered writes that have not been flushed yet')
+
+
+class _PendingWrites:
+    """
+    Writes of one scope that have not reached the backend yet, repeated writes to the same key are coalesced.
+    """
+
+    def __init__(self):
+        self.values: Dict[str, object] = {}
+        # None if the listeners were neither replaced nor cleared, so the backend still holds the base set
+        self.listeners: Optional[Set[int]] = None
+        self.added: Set[int] = set()
+
+    def __bool__(self):
+        return bool(self.values) or self.listeners is not None or bool(self.added)
+
+    def __len__(self):
+        return len(self.values) + (self.listeners is not None) + len(self.added)
+
+    def apply(self, op: str, value):
+        if op in ('mate', 'open'):
+            self.values[op] = value
+        elif op == 'add':
+            self.added.add(int(value))
+        elif op == 'replace':
+            self.listeners = {int(chat_id) for chat_id in value}
+            self.added.clear()
+        else:
+            raise ValueError(f'Unknown write-behind operation {op}')
+
+    def merge(self, newer: '_PendingWrites'):
+        self.values.update(newer.values)
+        if newer.listeners is not None:
+            self.listeners = newer.listeners
+            self.added = set(newer.added)
+        else:
+            self.added |= newer.added
+
+    def contains(self, chat_id: int) -> Optional[bool]:
+        """
+        :return: whether the chat is a listener after these writes, None if that depends on the backend
+        """
+        if chat_id in self.added:
+            return True
+        if self.listeners is not None:
+            return chat_id in self.listeners
+        return None
+
+
+class _Group:
+    """
+    State shared by a WriteBehindStorage and its scopes: the journal, the lock and the flush thread.
+    """
+
+    def __init__(self, journal_path: str, interval: float):
+        self.journal_path = journal_path
+        self.interval = interval
+        self.lock = threading.RLock()
+        self.flush_lock = threading.Lock()
+        self.scopes: Dict[str, 'WriteBehindStorage'] = {}
+        self.journal = None
+        self.stop = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+
+class WriteBehindStorage(Storage):
+    """
+    Storage decorator that acknowledges writes right away and writes them to the backend in the background.
+
+    Writes are coalesced per key and flushed every interval, before notification listeners are read for a broadcast,
+    on reload() and on close(). Until then reads see the buffered writes. Every acknowledged write is appended to a
+    local journal first, which is replayed on startup, so a crashed process loses no acknowledged write. The journal is
+    flushed to the operating system, but not synced to disk.
+    """
+
+    def __init__(self, backend: Storage, journal_path: str, interval: float = 1.0):
+        """
+        :param backend: storage that is wrapped
+        :param journal_path: local file for the writes that were not flushed yet
+        :param interval: seconds between two flushes
+        """
+        self._backend = backend
+        self._scope = ''
+        self._pending = _PendingWrites()
+        self._in_flight = _PendingWrites()
+        self._group = _Group(journal_path, interval)
+        self._group.scopes[''] = self
+        PENDING_WRITES.set_function(self._count_pending)
+
+        # the journal may live in a directory that the backend never creates, e.g. with S3
+        os.makedirs(os.path.dirname(os.path.abspath(journal_path)), exist_ok=True)
+        self._recover()
+        self._group.journal = open(journal_path, 'a', encoding='utf-8')
+        self._group.thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._group.thread.start()
+
+    @property
+    def backend(self) -> Storage:
+        return self._backend
+
+    def set_mate(self, text):
+        self._buffer('mate', text)
+
+    def get_mate(self) -> str or None:
+        return self._buffered('mate', self._backend.get_mate)
+
+    def set_open(self, state: int):
+        self._buffer('open', state)
+
+    def get_open(self) -> int:
+        return self._buffered('open', self._backend.get_open)
+
+    def set_notification_listeners(self, listeners: Set[str]):
+        self._buffer('replace', sorted(int(chat_id) for chat_id in listeners))
+
+    def get_notification_listeners(self) -> Set[str]:
+        self.flush()
+        return self._backend.get_notification_listeners()
+
+    def add_notification_listener(self, chat_id: int):
+        self._buffer('add', int(chat_id))
+
+    def has_notification_listener(self, chat_id: int) -> bool:
+        with self._group.lock:
+            for writes in (self._pending, self._in_flight):
+                contained = writes.contains(int(chat_id))
+                if contained is not None:
+                    return contained
+        return self._backend.has_notification_listener(chat_id)
+
+    def iter_notification_listeners(self) -> Iterable[int]:
+        self.flush()
+        return self._backend.iter_notification_listeners()
+
+    def clear_notification_listeners(self):
+        self._buffer('replace', [])
+
+    def remove_notification_listeners(self, chat_ids: Iterable[int]):
+        # only the backend knows which chats registered since the listeners were read
+        self.flush()
+        self._backend.remove_notification_listeners(chat_ids)
+
+    def count_notification_listeners(self) -> int:
+        with self._group.lock:
+            writes = copy.deepcopy(self._in_flight)
+            writes.merge(self._pending)
+        if writes.listeners is not None:
+            return len(writes.listeners | writes.added)
+        return self._backend.count_notification_listeners() + \
+            sum(1 for chat_id in writes.added if not self._backend.has_notification_listener(chat_id))
+
+    def scoped(self, name: str) -> 'WriteBehindStorage':
+        scope_name = f'{self._scope}/{name}' if self._scope else name
+        with self._group.lock:
+            scope = self._group.scopes.get(scope_name)
+            if scope is None:
+                scope = copy.copy(self)
+                scope._backend = self._backend.scoped(name)
+                scope._scope = scope_name
+                scope._pending = _PendingWrites()
+                scope._in_flight = _PendingWrites()
+                self._group.scopes[scope_name] = scope
+            return scope
+
+    def reload(self):
+        self.flush()
+        self._backend.reload()
+
+    def set_compaction(self, enabled: bool):
+        self._backend.set_compaction(enabled)
+
+    def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        return self._backend.acquire_lease(name, holder, ttl)
+
+    def release_lease(self, name: str, holder: str):
+        self._backend.release_lease(name, holder)
+
+    def flush(self):
+        """
+        Write all buffered writes of this storage and its scopes to the backend.
+        :raises Exception: if the backend could not be written, the writes stay buffered then
+        """
+        group = self._group
+        with group.flush_lock:
+            with group.lock:
+                scopes = [scope for scope in group.scopes.values() if scope._pending]
+                if not scopes:
+                    return
+                for scope in scopes:
+                    scope._in_flight, scope._pending = scope._pending, _PendingWrites()
+                self._rotate_journal()
+
+            errors = []
+            for scope in scopes:
+                try:
+                    scope._write(scope._in_flight)
+                except Exception as e:
+                    errors.append(e)
+                    LOGGER.error('Could not flush buffered writes%s: %s', f' of {scope._scope}' if scope._scope else '',
+                                 e)
+                    with group.lock:
+                        scope._in_flight.merge(scope._pending)
+                        scope._pending = scope._in_flight
+                with group.lock:
+                    scope._in_flight = _PendingWrites()
+
+            if errors:
+                WRITE_BEHIND_FLUSHES.labels('error').inc()
+                # the rotated journal is kept and replayed together with the current one
+                raise errors[0]
+            os.remove(self._flushing_path)
+            WRITE_BEHIND_FLUSHES.labels('ok').inc()
+
+    def close(self):
+        """
+        Stop the background flushes and flush a last time.
+        """
+        self._group.stop.set()
+        if self._group.thread:
+            self._group.thread.join()
+        try:
+            self.flush()
+        finally:
+            self._group.journal.close()
+
+    @property
+    def _flushing_path(self) -> str:
+        return f'{self._group.journal_path}.flushing'
+
+    def _buffer(self, op: str, value):
+        record = json.dumps({'scope': self._scope, 'op': op, 'value': value})
+        with self._group.lock:
+            self._group.journal.write(record + '\n')
+            self._group.journal.flush()
+            self._pending.apply(op, value)
+        BUFFERED_WRITES.labels(op).inc()
+
+    def _buffered(self, key: str, loader):
+        with self._group.lock:
+            for writes in (self._pending, self._in_flight):
+                if key in writes.values:
+                    return writes.values[key]
+        return loader()
+
+    def _write(self, writes: _PendingWrites):
+        if 'mate' in writes.values:
+            self._backend.set_mate(writes.values['mate'])
+        if 'open' in writes.values:
+            self._backend.set_open(writes.values['open'])
+        if writes.listeners is not None:
+            listeners = writes.listeners | writes.added
+            if listeners:
+                self._backend.set_notification_listeners({f'{chat_id}' for chat_id in listeners})
+            else:
+                self._backend.clear_notification_listeners()
+        else:
+            for chat_id in sorted(writes.added):
+                self._backend.add_notification_listener(chat_id)
+
+    def _rotate_journal(self):
+        """
+        Move the journal aside while its writes are flushed, must be called with the group lock held.
+        """
+        group = self._group
+        group.journal.close()
+        if os.path.exists(self._flushing_path):
+            # the previous flush failed, its writes are older and have to be replayed first
+            with open(self._flushing_path, 'a', encoding='utf-8') as flushing, \
+                    open(group.journal_path, encoding='utf-8') as journal:
+                flushing.write(journal.read())
+            os.remove(group.journal_path)
+        else:
+            os.replace(group.journal_path, self._flushing_path)
+        group.journal = open(group.journal_path, 'a', encoding='utf-8')
+
+    def _recover(self):
+        paths = [path for path in (self._flushing_path, self._group.journal_path) if os.path.exists(path)]
+        records = sum(self._replay(path) for path in paths)
+        if records:
+            LOGGER.info('Replaying %d buffered writes from %s', records, self._group.journal_path)
+        if paths:
+            # the writes move into one journal, which is on disk before the journals it replaces are removed
+            merged = f'{self._group.journal_path}.tmp'
+            with open(merged, 'w', encoding='utf-8') as journal:
+                for scope in self._group.scopes.values():
+                    journal.writelines(self._records(scope))
+                journal.flush()
+                os.fsync(journal.fileno())
+            os.replace(merged, self._group.journal_path)
+        if os.path.exists(self._flushing_path):
+            os.remove(self._flushing_path)
+        if not records:
+            return
+        self._group.journal = open(self._group.journal_path, 'a', encoding='utf-8')
+        try:
+            # a failing flush keeps all the writes in the merged journal
+            self.flush()
+        except Exception:
+            # already logged, the writes stay buffered and are retried by the background flushes
+            pass
+        finally:
+            self._group.journal.close()
+
+    def _replay(self, path: str) -> int:
+        records = 0
+        with open(path, encoding='utf-8') as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # the process died in the middle of this line, it was never acknowledged
+                    LOGGER.warning('Skipping incomplete write-behind record in %s', path)
+                    continue
+                scope = self
+                for name in filter(None, record['scope'].split('/')):
+                    scope = scope.scoped(name)
+                scope._pending.apply(record['op'], record['value'])
+                records += 1
+        return records
+
+    @staticmethod
+    def _records(scope: 'WriteBehindStorage') -> List[str]:
+        writes = scope._pending
+        records = [(op, value) for op, value in writes.values.items()]
+        if writes.listeners is not None:
+            records.append(('replace', sorted(writes.listeners)))
+        records.extend(('add', chat_id) for chat_id in sorted(writes.added))
+        return [json.dumps({'scope': scope._scope, 'op': op, 'value': value}) + '\n' for op, value in records]
+
+    def _count_pending(self) -> int:
+        with self._group.lock:
+            return sum(len(scope._pending) + len(scope._in_flight) for scope in self._group.scopes.values())
+
+    def _run(self):
+        while not self._group.stop.wait(self._group.interval):
+            try:
+                self.flush()
+            except Exception:
+                # already logged, the writes are retried with the next flush
+                pass
@@ -0,0 +1,148 @@
+from array import array
+
+import pytest
+
+from frundenbot.listeners import RECORD_TYPE, ListenerJournal
+from frundenbot.storage import _FileJournal
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return _FileJournal(tmp_path / 'listeners')
+
+
+def journal_size(backend: _FileJournal) -> int:
+    return len(backend.read_journal()[0]) // array(RECORD_TYPE).itemsize
+
+
+def test_add_appends_one_record(backend):
+    listeners = ListenerJournal(backend)
+    listeners.add(2)
+    listeners.add(1)
+    listeners.add(2)
+
+    assert list(listeners) == [1, 2]
+    assert 1 in listeners and 3 not in listeners
+    assert journal_size(backend) == 2
+    assert list(ListenerJournal(backend)) == [1, 2]
+
+
+def test_load_folds_the_journal_into_the_snapshot(backend):
+    writer = ListenerJournal(backend)
+    for chat_id in (3, 1, 2):
+        writer.add(chat_id)
+
+    assert len(ListenerJournal(backend)) == 3
+    assert journal_size(backend) == 0
+    assert list(ListenerJournal(backend)) == [1, 2, 3]
+
+
+def test_load_without_compaction_never_writes(backend):
+    ListenerJournal(backend).add(1)
+    standby = ListenerJournal(backend)
+    standby.compaction = False
+
+    assert list(standby) == [1]
+    assert backend.read_snapshot() is None
+    assert journal_size(backend) == 1
+
+
+def test_compaction_after_threshold(backend):
+    listeners = ListenerJournal(backend, compact_after=3)
+    for chat_id in range(5):
+        listeners.add(chat_id)
+
+    assert journal_size(backend) == 2
+    assert list(ListenerJournal(backend)) == [0, 1, 2, 3, 4]
+
+
+def test_compaction_keeps_appends_of_other_processes(backend):
+    leader = ListenerJournal(backend)
+    leader.add(1)
+    other = ListenerJournal(backend)
+    other.compaction = False
+    len(other)
+    other.add(2)
+
+    leader.compact()
+    assert list(ListenerJournal(backend)) == [1, 2]
+
+
+def test_compaction_keeps_appends_during_the_compaction(backend):
+    leader = ListenerJournal(backend)
+    leader.add(1)
+    other = ListenerJournal(backend)
+    other.compaction = False
+    len(other)
+
+    truncate = backend.truncate_journal
+
+    def append_then_truncate(marker):
+        # another process appends after the journal was read, but before it is truncated
+        other.add(2)
+        truncate(marker)
+
+    backend.truncate_journal = append_then_truncate
+    leader.compact()
+    backend.truncate_journal = truncate
+
+    assert journal_size(backend) == 1
+    assert list(ListenerJournal(backend)) == [1, 2]
+
+
+def test_replace_and_clear(backend):
+    listeners = ListenerJournal(backend)
+    for chat_id in (1, 2, 3):
+        listeners.add(chat_id)
+
+    listeners.replace(['5', 4])
+    assert list(listeners) == [4, 5]
+    assert list(ListenerJournal(backend)) == [4, 5]
+
+    listeners.clear()
+    assert len(listeners) == 0
+    assert list(ListenerJournal(backend)) == []
+
+
+def test_remove_keeps_listeners_added_in_the_meantime(backend):
+    listeners = ListenerJournal(backend)
+    listeners.add(1)
+    listeners.add(2)
+    notified = list(listeners)
+    listeners.add(3)
+    other = ListenerJournal(backend)
+    other.compaction = False
+    len(other)
+    other.add(4)
+
+    listeners.remove(notified)
+    assert list(listeners) == [3, 4]
+    assert list(ListenerJournal(backend)) == [3, 4]
+
+
+def test_torn_record_is_ignored(backend):
+    listeners = ListenerJournal(backend)
+    listeners.compaction = False
+    listeners.add(1)
+    backend.append_journal(array(RECORD_TYPE, [2]).tobytes()[:3])
+
+    assert list(ListenerJournal(backend)) == [1]
+
+
+def test_append_after_torn_record(backend):
+    listeners = ListenerJournal(backend)
+    listeners.compaction = False
+    listeners.add(1)
+    backend.append_journal(array(RECORD_TYPE, [2]).tobytes()[:3])
+
+    standby = ListenerJournal(backend)
+    standby.compaction = False
+    standby.add(3)
+    assert list(ListenerJournal(backend)) == [1, 3]
+    assert journal_size(backend) == 0
+
+
+def test_legacy_listeners_are_migrated(backend):
+    listeners = ListenerJournal(backend, legacy=lambda: ['2', '1', ' '])
+    assert list(listeners) == [1, 2]
+    assert backend.read_snapshot() == array(RECORD_TYPE, [1, 2]).tobytes()
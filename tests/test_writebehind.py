@@ -0,0 +1,164 @@
+import json
+import os
+
+import pytest
+
+from frundenbot import STATE_OPEN
+from frundenbot.storage import FileStorage
+from frundenbot.writebehind import WriteBehindStorage
+
+
+class FlakyStorage(FileStorage):
+    """
+    FileStorage whose writes fail while it is down.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path=path)
+        self.down = False
+
+    def _write(self, path: str, value: str):
+        if self.down:
+            raise OSError('storage is down')
+        super()._write(path, value)
+
+    def scoped(self, name: str) -> 'FlakyStorage':
+        scope = FlakyStorage(f'{self.root_path}/locations/{name}')
+        scope.down = self.down
+        return scope
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return FlakyStorage(f'{tmp_path}/data/')
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return f'{tmp_path}/journal/write-behind.jsonl'
+
+
+def write_journal(path: str, records, tail: str = ''):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.writelines(json.dumps({'scope': scope, 'op': op, 'value': value}) + '\n' for scope, op, value in records)
+        file.write(tail)
+
+
+def test_writes_are_buffered_until_flushed(backend, journal):
+    storage = WriteBehindStorage(backend, journal, interval=3600)
+    storage.set_mate('Club Mate')
+    storage.set_open(STATE_OPEN)
+
+    assert storage.get_mate() == 'Club Mate'
+    assert backend.get_mate() is None
+
+    storage.flush()
+    assert FileStorage(backend.root_path).get_mate() == 'Club Mate'
+    assert FileStorage(backend.root_path).get_open() == STATE_OPEN
+    storage.close()
+
+
+def test_replay_after_failed_flush(backend, journal):
+    storage = WriteBehindStorage(backend, journal, interval=3600)
+    storage.set_mate('Club Mate')
+    storage.add_notification_listener(1)
+    backend.down = True
+    with pytest.raises(OSError):
+        storage.close()
+
+    backend.down = False
+    recovered = WriteBehindStorage(FlakyStorage(backend.root_path), journal, interval=3600)
+    persisted = FileStorage(backend.root_path)
+    assert persisted.get_mate() == 'Club Mate'
+    assert persisted.has_notification_listener(1)
+    assert not os.path.exists(f'{journal}.flushing')
+    recovered.close()
+
+
+def test_failed_replay_keeps_the_writes(backend, journal):
+    write_journal(journal, [('', 'mate', 'Club Mate')])
+    backend.down = True
+    storage = WriteBehindStorage(backend, journal, interval=3600)
+    assert storage.get_mate() == 'Club Mate'
+    storage._group.stop.set()
+
+    backend.down = False
+    WriteBehindStorage(FlakyStorage(backend.root_path), journal, interval=3600).close()
+    assert FileStorage(backend.root_path).get_mate() == 'Club Mate'
+
+
+def test_crash_between_rotate_and_remove(backend, journal):
+    # the flush of the rotated journal did not finish, newer writes were appended to the journal in the meantime
+    write_journal(f'{journal}.flushing', [('', 'mate', 'old'), ('', 'add', 1), ('', 'add', 2)])
+    write_journal(journal, [('', 'mate', 'new'), ('', 'replace', [2, 3])])
+
+    storage = WriteBehindStorage(backend, journal, interval=3600)
+    persisted = FileStorage(backend.root_path)
+    assert persisted.get_mate() == 'new'
+    assert sorted(persisted.iter_notification_listeners()) == [2, 3]
+    assert not os.path.exists(f'{journal}.flushing')
+    storage.close()
+
+
+def test_crash_after_the_merged_journal_was_written(backend, journal):
+    # the merged journal replaced the journal, but the rotated journal was not removed yet
+    write_journal(f'{journal}.flushing', [('', 'add', 1)])
+    write_journal(journal, [('', 'replace', [1]), ('', 'add', 2)])
+
+    storage = WriteBehindStorage(backend, journal, interval=3600)
+    assert sorted(FileStorage(backend.root_path).iter_notification_listeners()) == [1, 2]
+    storage.close()
+
+
+def test_torn_journal_line_is_skipped(backend, journal):
+    write_journal(journal, [('', 'mate', 'Club Mate'), ('loc', 'add', 5)], tail='{"scope": "", "op": "ma')
+
+    storage = WriteBehindStorage(backend, journal, interval=3600)
+    assert FileStorage(backend.root_path).get_mate() == 'Club Mate'
+    assert FileStorage(backend.root_path).scoped('loc').has_notification_listener(5)
+
+    # writes after the recovery are not appended to the torn line
+    storage.set_mate('Mio Mio')
+    storage._group.stop.set()
+    storage._group.thread.join()
+    storage._group.journal.close()
+    WriteBehindStorage(FlakyStorage(backend.root_path), journal, interval=3600).close()
+    assert FileStorage(backend.root_path).get_mate() == 'Mio Mio'
+
+
+def test_replace_and_clear_listeners(backend, journal):
+    backend.set_notification_listeners({'1', '2'})
+    storage = WriteBehindStorage(backend, journal, interval=3600)
+
+    storage.add_notification_listener(3)
+    assert storage.count_notification_listeners() == 3
+    storage.clear_notification_listeners()
+    assert not storage.has_notification_listener(1)
+    storage.add_notification_listener(4)
+    assert storage.count_notification_listeners() == 1
+    storage.set_notification_listeners({'5', '6'})
+    storage.add_notification_listener(7)
+
+    assert sorted(storage.iter_notification_listeners()) == [5, 6, 7]
+    assert sorted(FileStorage(backend.root_path).iter_notification_listeners()) == [5, 6, 7]
+    storage.close()
+
+
+def test_remove_keeps_listeners_added_later(backend, journal):
+    storage = WriteBehindStorage(backend, journal, interval=3600)
+    storage.add_notification_listener(1)
+    notified = list(storage.iter_notification_listeners())
+    storage.add_notification_listener(2)
+
+    storage.remove_notification_listeners(notified)
+    assert sorted(FileStorage(backend.root_path).iter_notification_listeners()) == [2]
+    storage.close()
+
+
+def test_creates_the_journal_directory(backend, tmp_path):
+    journal = f'{tmp_path}/missing/write-behind.jsonl'
+    storage = WriteBehindStorage(backend, journal, interval=3600)
+    storage.set_mate('Club Mate')
+    assert os.path.exists(journal)
+    storage.close()